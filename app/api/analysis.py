@@ -1,49 +1,299 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-import random
 from datetime import datetime
+from typing import Optional
+import json
+import sys
+import threading
+import time
 
-from app.core.databace import get_db
+from app.core.admission import admission, batch_slots
+from app.core.config import settings
+from app.core.databace import get_db, SessionLocal
+from app.core.metrics import metrics, stage_summary, START_TIME
+from app.core.profiling import profiling_allowed
+from app.models.anomaly import Anomaly
 from app.models.image import SatelliteImage
+from app.models.job import AnalysisJob
+from app.services.batch import iter_batch_analyze
+from app.services import job_queue
+from app.schemas.analysis import SweepRequest, SweepResponse, BatchRequest, StackRequest, BaselineRequest, JobCreate, JobResponse
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
-@router.post("/test")
-async def test_analysis(background_tasks: BackgroundTasks = None):
-    """Тестовый анализ - всегда работает"""
-    if background_tasks:
-        background_tasks.add_task(simulate_analysis)
-        return {"message": "Анализ запущен в фоне", "status": "processing"}
-    else:
-        result = simulate_analysis()
-        return {"message": "Анализ завершен", "status": "completed", "result": result}
-
-def simulate_analysis():
-    """Симуляция анализа"""
-    import time
-    time.sleep(1)  # Имитация обработки
+# Анализатор и рендерер визуализаций тянут cv2/numpy: создаются при первом
+# обращении (или фоновым прогревом после старта), а не при импорте роутера
+_analyzer = None
+_overlay_renderer = None
+_init_lock = threading.Lock()
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _init_lock:
+            if _analyzer is None:
+                from app.services.analizer import ImageAnalyzer
+                _analyzer = ImageAnalyzer()
+    return _analyzer
+
+def get_overlay_renderer():
+    global _overlay_renderer
+    if _overlay_renderer is None:
+        with _init_lock:
+            if _overlay_renderer is None:
+                from app.services.overlays import OverlayRenderer
+                _overlay_renderer = OverlayRenderer()
+    return _overlay_renderer
+
+def _cache_stats() -> dict:
+    """Статистика уже созданных кэшей (модули анализа ради неё не загружаются)"""
+    stats = {}
+    image_loader = sys.modules.get("app.services.image_loader")
+    if image_loader is not None:
+        stats["image"] = image_loader.ImageLoader.cache_stats()
+    if _analyzer is not None:
+        stats["result"] = _analyzer.results_cache.stats()
+        stats["diff"] = _analyzer.diff_cache.stats()
+    return stats
+
+def _queue_depths() -> dict:
+    db = SessionLocal()
+    try:
+        return job_queue.queue_depths(db)
+    finally:
+        db.close()
+
+metrics.gauge(
+    "geo_cache_hit_ratio", "Доля попаданий в кэш", ["cache"],
+    lambda: {(name,): stats["hit_ratio"] for name, stats in _cache_stats().items()}
+)
+metrics.gauge(
+    "geo_job_queue_depth", "Число задач в очереди по статусам", ["status"],
+    lambda: {(status,): count for status, count in _queue_depths().items()}
+)
+
+@router.post("/test", status_code=202)
+def test_analysis(db: Session = Depends(get_db)):
+    """Тестовый анализ - ставится в очередь задач"""
+    job = job_queue.enqueue(db, "simulate")
+    return {"message": "Анализ поставлен в очередь", "status": job.status, "job_id": job.id}
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+def create_job(request: JobCreate, db: Session = Depends(get_db),
+               x_profile_token: Optional[str] = Header(None)):
+    """Постановка анализа снимка в очередь задач"""
+    if request.profile and not profiling_allowed(x_profile_token):
+        raise HTTPException(status_code=403, detail="Профилирование недоступно")
     
-    return {
-        "anomalies_found": random.randint(3, 8),
-        "processing_time": f"{random.uniform(1.5, 3.2):.1f} секунд",
-        "detected_types": ["fire", "deforestation", "dump"],
-        "confidence": round(random.uniform(0.7, 0.95), 2),
-        "timestamp": datetime.now().isoformat()
-    }
+    image = db.query(SatelliteImage).filter(SatelliteImage.id == request.image_id).first()
+    if image is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    if request.reference_id is not None:
+        reference = db.query(SatelliteImage).filter(SatelliteImage.id == request.reference_id).first()
+        if reference is None:
+            raise HTTPException(status_code=404, detail="Референсное изображение не найдено")
+    
+    params = {"image_id": request.image_id, "reference_id": request.reference_id}
+    if request.profile:
+        params["profile"] = request.profile
+    # Одинаковые запросы, пока задача не завершена, получают её же (кроме профилирования)
+    job = job_queue.enqueue(
+        db, "analyze", params,
+        priority=request.priority, max_attempts=request.max_attempts,
+        dedupe=not request.profile
+    )
+    return JobResponse.from_job(job)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Статус и результат задачи анализа"""
+    job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return JobResponse.from_job(job)
 
 @router.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
+def get_stats(db: Session = Depends(get_db)):
     """Статистика системы"""
     try:
         total_images = db.query(SatelliteImage).count()
-    except:
-        total_images = 0
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        anomalies_today = db.query(Anomaly).filter(Anomaly.detected_at >= today).count()
+        queue = job_queue.queue_depths(db)
+    except Exception:
+        total_images, anomalies_today, queue = 0, 0, {}
+    
+    done, failed = queue.get(job_queue.DONE, 0), queue.get(job_queue.FAILED, 0)
+    uptime_hours = (time.time() - START_TIME) / 3600
     
     return {
         "total_images": total_images,
-        "total_analyses": random.randint(50, 200),
-        "anomalies_today": random.randint(1, 10),
-        "success_rate": round(random.uniform(0.85, 0.98), 2),
+        "total_analyses": done,
+        "anomalies_today": anomalies_today,
+        "success_rate": round(done / (done + failed), 2) if done + failed else None,
         "system_status": "operational",
-        "uptime": f"{random.randint(100, 1000)} часов"
+        "uptime": f"{uptime_hours:.1f} часов",
+        "queue": queue,
+        "caches": _cache_stats(),
+        "admission": admission.stats(),
+        "pipeline": stage_summary()
+    }
+
+@router.post("/sweep", response_model=SweepResponse)
+def sweep_parameters(request: SweepRequest, db: Session = Depends(get_db)):
+    """Подбор порогов детектора: много комбинаций (threshold, min_area) за один запрос"""
+    if any(not 0 <= t <= 255 for t in request.thresholds):
+        raise HTTPException(status_code=422, detail="threshold должен быть в диапазоне 0..255")
+    
+    image = db.query(SatelliteImage).filter(SatelliteImage.id == request.image_id).first()
+    reference = db.query(SatelliteImage).filter(SatelliteImage.id == request.reference_id).first()
+    if image is None or reference is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    
+    result = get_analyzer().sweep_parameters(
+        image.filepath, reference.filepath,
+        request.thresholds, request.min_areas
+    )
+    if "error" in result:
+        raise HTTPException(status_code=422, detail=result["error"])
+    
+    return {
+        "image_id": request.image_id,
+        "reference_id": request.reference_id,
+        "combinations": result["combinations"]
+    }
+
+@router.post("/batch")
+def batch_analyze(request: BatchRequest, db: Session = Depends(get_db)):
+    """
+    Пакетный анализ в пуле процессов
+    
+    Ответ - NDJSON: по строке на каждый завершённый снимок с нарастающими итогами,
+    последняя строка - событие "done".
+    """
+    images = db.query(SatelliteImage).filter(SatelliteImage.id.in_(request.image_ids)).all()
+    paths_by_id = {image.id: image.filepath for image in images}
+    missing = [image_id for image_id in request.image_ids if image_id not in paths_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Изображения не найдены: {missing}")
+    
+    reference_path = None
+    if request.reference_id is not None:
+        reference = db.query(SatelliteImage).filter(SatelliteImage.id == request.reference_id).first()
+        if reference is None:
+            raise HTTPException(status_code=404, detail="Референсное изображение не найдено")
+        reference_path = reference.filepath
+    
+    image_paths = [paths_by_id[image_id] for image_id in request.image_ids]
+    
+    # Процессов не больше, чем слотов, занятых запросом в контроле допуска
+    workers = request.workers if request.workers is not None else settings.BATCH_WORKERS
+    if settings.ADMISSION_ENABLED:
+        workers = min(workers, batch_slots(workers))
+    
+    def stream():
+        for event in iter_batch_analyze(image_paths, reference_path,
+                                        workers=workers, timeout=request.timeout):
+            yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/stack")
+def analyze_stack(request: StackRequest, db: Session = Depends(get_db)):
+    """
+    Анализ временного ряда снимков одной территории (id в хронологическом порядке)
+    
+    Ответ - NDJSON: событие на каждую пару соседних снимков и итог с картой
+    накопленных изменений.
+    """
+    images = db.query(SatelliteImage).filter(SatelliteImage.id.in_(request.image_ids)).all()
+    paths_by_id = {image.id: image.filepath for image in images}
+    missing = [image_id for image_id in request.image_ids if image_id not in paths_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Изображения не найдены: {missing}")
+    
+    image_paths = [paths_by_id[image_id] for image_id in request.image_ids]
+    
+    def stream():
+        for event in get_analyzer().analyze_stack(image_paths):
+            if "index" in event:
+                event["image_id"] = request.image_ids[event["index"]]
+            yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/baseline/{aoi_id}")
+def analyze_against_baseline(aoi_id: str, request: BaselineRequest, db: Session = Depends(get_db)):
+    """Оценка снимка по модели фона территории с обновлением модели"""
+    image = db.query(SatelliteImage).filter(SatelliteImage.id == request.image_id).first()
+    if image is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    
+    try:
+        result = get_analyzer().analyze_against_baseline(
+            image.filepath, aoi_id, update=request.update, z_threshold=request.z_threshold
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=422, detail=result["error"])
+    return result
+
+@router.get("/baseline/{aoi_id}")
+def get_baseline(aoi_id: str):
+    """Состояние модели фона территории"""
+    from app.services.baseline import BaselineModel
+    
+    try:
+        meta = BaselineModel(aoi_id).metadata()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Модель фона не найдена")
+    return meta
+
+@router.get("/overlays/{analysis_id}")
+def get_overlay(
+    analysis_id: str,
+    width: int = Query(None, ge=64, le=8192),
+    format: str = Query("png", pattern="^(png|webp)$")
+):
+    """Визуализация изменений анализа (строится при первом запросе и кэшируется)"""
+    try:
+        rendered = get_overlay_renderer().render(analysis_id, width, format)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Визуализация не найдена")
+    
+    data, media_type = rendered
+    return Response(content=data, media_type=media_type)
+
+@router.get("/masks/{analysis_id}")
+def get_mask_stats(
+    analysis_id: str,
+    x1: int = Query(None, ge=0, le=100000), y1: int = Query(None, ge=0, le=100000),
+    x2: int = Query(None, ge=0, le=100000), y2: int = Query(None, ge=0, le=100000)
+):
+    """Статистика маски изменений анализа (целиком или в окне x1, y1, x2, y2)"""
+    coords = (x1, y1, x2, y2)
+    window = coords if all(v is not None for v in coords) else None
+    if window is not None and (x2 <= x1 or y2 <= y1):
+        raise HTTPException(status_code=422, detail="Окно должно быть задано как x1 < x2, y1 < y2")
+    try:
+        mask_store = get_overlay_renderer().mask_store
+        stats = mask_store.stats(analysis_id, window)
+        meta = mask_store.load_meta(analysis_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Маска не найдена")
+    
+    return {
+        "analysis_id": analysis_id,
+        "shape": meta["shape"],
+        "regions": len(meta.get("regions", [])),
+        "window": window,
+        **stats
     }
\ No newline at end of file
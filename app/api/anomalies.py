@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from datetime import datetime, timedelta
+import asyncio
+import csv
+import io
+import json
 import random
 
-from app.core.databace import get_db
-from app.models.anomaly import Anomaly
-from app.schemas.anomaly import AnomalyResponse
+from app.core.databace import get_db, SessionLocal
+from app.models.anomaly import Anomaly, AnomalyDetection
+from app.schemas.anomaly import AnomalyResponse, AnomalyDetectionResponse
+from app.services.anomaly_feed import FeedFilter, broadcaster
 
 router = APIRouter(prefix="/anomalies", tags=["anomalies"])
 
@@ -19,10 +25,7 @@ def get_anomalies(
     """Получение аномалий (реальные + демо данные)"""
     try:
         # Пробуем получить из БД
-        query = db.query(Anomaly)
-        if anomaly_type:
-            query = query.filter(Anomaly.anomaly_type == anomaly_type)
-        query = query.filter(Anomaly.confidence >= min_confidence)
+        query = filter_anomalies(db.query(Anomaly), anomaly_type, min_confidence)
         
         db_anomalies = query.order_by(Anomaly.detected_at.desc()).all()
         
@@ -36,6 +39,217 @@ def get_anomalies(
         # При любой ошибке возвращаем демо данные
         return get_demo_anomalies(anomaly_type, min_confidence)
 
+def filter_anomalies(query, anomaly_type: Optional[str], min_confidence: float):
+    """Общие фильтры списка и экспорта аномалий"""
+    if anomaly_type:
+        query = query.filter(Anomaly.anomaly_type == anomaly_type)
+    return query.filter(Anomaly.confidence >= min_confidence)
+
+EXPORT_COLUMNS = [
+    "id", "image_id", "anomaly_type", "confidence", "latitude",
+    "longitude", "area", "bbox", "description", "detected_at",
+    "first_seen", "last_seen", "detections"
+]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "geojson": "application/geo+json"
+}
+
+@router.get("/export")
+def export_anomalies(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|geojson)$"),
+    anomaly_type: Optional[str] = Query(None),
+    min_confidence: float = Query(0.5, ge=0.0, le=1.0),
+    batch_size: int = Query(1000, ge=1, le=10000)
+):
+    """Потоковая выгрузка аномалий в NDJSON, CSV или GeoJSON"""
+    rows = iter_anomaly_rows(anomaly_type, min_confidence, batch_size)
+    writers = {
+        "ndjson": ndjson_chunks,
+        "csv": csv_chunks,
+        "geojson": geojson_chunks
+    }
+    extension = "json" if format == "geojson" else format
+    
+    return StreamingResponse(
+        writers[format](rows, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="anomalies.{extension}"'}
+    )
+
+def iter_anomaly_rows(anomaly_type: Optional[str], min_confidence: float,
+                      batch_size: int) -> Iterator[dict]:
+    """
+    Строки аномалий по курсору партиями batch_size
+    
+    Сессия открывается внутри генератора и живёт, пока идёт ответ. Выбираются
+    только колонки (без ORM-объектов и identity map), поэтому память не растёт
+    с числом строк.
+    """
+    db = SessionLocal()
+    try:
+        columns = [getattr(Anomaly, name) for name in EXPORT_COLUMNS]
+        query = filter_anomalies(db.query(*columns), anomaly_type, min_confidence)
+        query = query.order_by(Anomaly.detected_at.desc()).yield_per(batch_size)
+        
+        for row in query:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            for name in ("detected_at", "first_seen", "last_seen"):
+                if record[name] is not None:
+                    record[name] = record[name].isoformat()
+            yield record
+    finally:
+        db.close()
+
+def ndjson_chunks(rows: Iterator[dict], batch_size: int) -> Iterator[str]:
+    lines = []
+    for record in rows:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def csv_chunks(rows: Iterator[dict], batch_size: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    # Заголовок уходит сразу, до первой партии из БД
+    yield buffer.getvalue()
+    
+    buffer.seek(0)
+    buffer.truncate()
+    count = 0
+    for record in rows:
+        writer.writerow(record)
+        count += 1
+        if count >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if count:
+        yield buffer.getvalue()
+
+def geojson_chunks(rows: Iterator[dict], batch_size: int) -> Iterator[str]:
+    yield '{"type": "FeatureCollection", "features": [\n'
+    
+    features = []
+    first = True
+    for record in rows:
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [record["longitude"], record["latitude"]]},
+            "properties": {k: v for k, v in record.items() if k not in ("latitude", "longitude")}
+        }
+        features.append(json.dumps(feature, ensure_ascii=False))
+        if len(features) >= batch_size:
+            yield ("" if first else ",\n") + ",\n".join(features)
+            features = []
+            first = False
+    if features:
+        yield ("" if first else ",\n") + ",\n".join(features)
+    
+    yield "\n]}\n"
+
+@router.get("/{anomaly_id}/detections", response_model=List[AnomalyDetectionResponse])
+def get_anomaly_detections(
+    anomaly_id: int,
+    limit: int = Query(500, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Отдельные обнаружения, слитые в трек аномалии (по времени снимка)"""
+    if db.query(Anomaly.id).filter(Anomaly.id == anomaly_id).first() is None:
+        raise HTTPException(status_code=404, detail="Аномалия не найдена")
+    return (
+        db.query(AnomalyDetection)
+        .filter(AnomalyDetection.anomaly_id == anomaly_id)
+        .order_by(AnomalyDetection.observed_at, AnomalyDetection.id)
+        .limit(limit)
+        .all()
+    )
+
+@router.get("/stream")
+async def stream_anomalies(
+    anomaly_type: Optional[str] = Query(None, description="Типы через запятую"),
+    min_confidence: float = Query(0.0, ge=0.0, le=1.0),
+    bbox: Optional[str] = Query(None, description="lat_min,lon_min,lat_max,lon_max")
+):
+    """Лента новых аномалий (Server-Sent Events)"""
+    try:
+        feed_filter = FeedFilter.from_dict({
+            "types": anomaly_type, "min_confidence": min_confidence, "bbox": bbox
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    async def events():
+        subscription = broadcaster.subscribe(feed_filter)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    anomaly = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Комментарий держит соединение через прокси
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {anomaly['detection_id']}\nevent: anomaly\ndata: {json.dumps(anomaly, ensure_ascii=False)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def anomalies_websocket(websocket: WebSocket):
+    """
+    Лента новых аномалий по WebSocket
+    
+    Фильтр задаётся параметрами запроса (anomaly_type, min_confidence, bbox) и
+    может быть заменён сообщением {"types": [...], "min_confidence": ..., "bbox": [...]},
+    например при перемещении карты.
+    """
+    await websocket.accept()
+    try:
+        feed_filter = FeedFilter.from_dict(dict(websocket.query_params))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    
+    subscription = broadcaster.subscribe(feed_filter)
+    
+    async def receive_filters():
+        while True:
+            message = await websocket.receive_json()
+            try:
+                subscription.filter = FeedFilter.from_dict(message)
+            except (ValueError, TypeError) as e:
+                await websocket.send_json({"event": "error", "detail": str(e)})
+    
+    receiver = asyncio.create_task(receive_filters())
+    try:
+        while not receiver.done():
+            getter = asyncio.create_task(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await websocket.send_json({"event": "anomaly", "data": getter.result()})
+            else:
+                getter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if receiver.done() and not receiver.cancelled():
+            receiver.exception()  # отключение клиента - штатное завершение
+        receiver.cancel()
+        broadcaster.unsubscribe(subscription)
+
 def get_demo_anomalies(anomaly_type: Optional[str] = None, min_confidence: float = 0.5):
     """Генерация демо аномалий"""
     anomaly_types = ['fire', 'deforestation', 'dump', 'construction', 'flood']
@@ -5,7 +5,9 @@ import os
 from datetime import datetime
 import uuid
 
+from app.core.config import settings
 from app.core.databace import get_db
+from app.core.response_cache import bump_data_version
 from app.models.image import SatelliteImage
 from app.schemas.image import ImageResponse
 
@@ -22,7 +24,7 @@ async def upload_image(
         # Генерируем уникальное имя
         file_extension = os.path.splitext(file.filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_extension}"
-        filepath = f"data/raw/{unique_filename}"
+        filepath = os.path.join(settings.UPLOAD_DIR, unique_filename)
         
         # Создаем директорию
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
@@ -45,6 +47,7 @@ async def upload_image(
         db.add(db_image)
         db.commit()
         db.refresh(db_image)
+        bump_data_version()
         
         return db_image
         
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import Response
+from typing import Optional
+
+from app.core.profiling import list_profiles, profiling_allowed, render_profile
+
+router = APIRouter(prefix="/profiles", tags=["profiles"])
+
+def require_profile_token(token: Optional[str]):
+    if not profiling_allowed(token):
+        raise HTTPException(status_code=403, detail="Профилирование недоступно")
+
+@router.get("/")
+def get_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Список сохранённых профилей (запросы и задачи анализа)"""
+    require_profile_token(x_profile_token)
+    return list_profiles()
+
+@router.get("/{profile_id}")
+def get_profile(
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|raw)$"),
+    limit: int = Query(60, ge=1, le=1000),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """Профиль: отчёт pstats или collapsed stacks (text), файл .prof (raw)"""
+    require_profile_token(x_profile_token)
+    try:
+        rendered = render_profile(profile_id, format, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    
+    data, media_type = rendered
+    return Response(content=data, media_type=media_type)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import math
+import re
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+from .config import settings
+from .metrics import metrics
+
+REJECTED = metrics.counter(
+    "geo_admission_rejected_total", "Запросы, отклонённые контролем допуска (429)", ["cost_class"]
+)
+WAIT_SECONDS = metrics.histogram(
+    "geo_admission_wait_seconds", "Ожидание слота класса стоимости", ["cost_class"]
+)
+
+
+class CostClass:
+    """
+    Класс стоимости запросов: не более limit занятых слотов, до max_queue
+    запросов ждут не дольше timeout секунд, остальные получают 429
+
+    Обычный запрос занимает один слот, запрос со своим пулом процессов
+    (пакетный анализ) - по слоту на процесс.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.used = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Скользящее среднее времени занятия слота - для оценки Retry-After
+        self.mean_hold = 1.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Создаётся в event loop процесса при первом запросе
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def slots_for(self, slots: int) -> int:
+        return min(max(1, slots), self.limit)
+
+    async def acquire(self, slots: int = 1) -> bool:
+        slots = self.slots_for(slots)
+        condition = self.condition
+        async with condition:
+            if self.used + slots > self.limit:
+                if self.waiting >= self.max_queue or self.timeout <= 0:
+                    return self._reject()
+                self.waiting += 1
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self.used + slots <= self.limit), self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    return self._reject()
+                finally:
+                    self.waiting -= 1
+                    WAIT_SECONDS.observe(time.perf_counter() - started, self.name)
+            self.used += slots
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    async def release(self, held: float, slots: int = 1) -> None:
+        slots = self.slots_for(slots)
+        self.active -= 1
+        self.mean_hold = 0.8 * self.mean_hold + 0.2 * held
+        async with self.condition:
+            self.used -= slots
+            self.condition.notify_all()
+
+    def _reject(self) -> bool:
+        self.rejected += 1
+        REJECTED.inc(1, self.name)
+        return False
+
+    def retry_after(self) -> int:
+        """Оценка (в секундах), когда освободится слот для нового запроса"""
+        return max(1, math.ceil(self.mean_hold * (self.waiting + 1) / self.limit))
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "slots_used": self.used,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "mean_hold_s": round(self.mean_hold, 3)
+        }
+
+
+class AdmissionController:
+    """Классы стоимости процесса API (общие для middleware и статистики)"""
+
+    def __init__(self, classes: Sequence[CostClass]):
+        self.classes = {cost_class.name: cost_class for cost_class in classes}
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: cost_class.stats() for name, cost_class in self.classes.items()}
+
+
+admission = AdmissionController([
+    CostClass("heavy", settings.ADMISSION_HEAVY_LIMIT, settings.ADMISSION_MAX_QUEUE,
+              settings.ADMISSION_QUEUE_TIMEOUT),
+    CostClass("bulk", settings.ADMISSION_BULK_LIMIT, settings.ADMISSION_MAX_QUEUE,
+              settings.ADMISSION_QUEUE_TIMEOUT),
+])
+
+
+
+def batch_slots(workers: Optional[int] = None) -> int:
+    """Слоты класса heavy на пакетный анализ: по одному на процесс пула (без пула - один)"""
+    if workers is None:
+        workers = settings.BATCH_WORKERS
+    return max(1, min(workers, settings.ADMISSION_HEAVY_LIMIT))
+
+
+def batch_request_slots(body: Dict) -> int:
+    """Слоты запроса /batch по запрошенному в теле числу процессов"""
+    workers = body.get("workers")
+    return batch_slots(workers if isinstance(workers, int) and not isinstance(workers, bool) else None)
+
+
+metrics.gauge(
+    "geo_admission_in_flight", "Запросы, выполняемые в классе стоимости", ["cost_class"],
+    lambda: {(name,): cost_class.active for name, cost_class in admission.classes.items()}
+)
+metrics.gauge(
+    "geo_admission_waiting", "Запросы, ожидающие слота класса стоимости", ["cost_class"],
+    lambda: {(name,): cost_class.waiting for name, cost_class in admission.classes.items()}
+)
+
+
+class AdmissionControlMiddleware:
+    """
+    Контроль допуска по классам стоимости (ASGI middleware)
+
+    Правила - (метод, шаблон пути, класс[, слоты]). Тяжёлый анализ и выгрузки
+    ограничены слотами своих классов, поэтому не занимают все потоки пула и не
+    вытесняют лёгкие чтения (/health, /api/global/*, списки), которые идут
+    без ограничений. Слоты держатся до конца ответа, включая потоковые NDJSON.
+    Слоты - число или функция от JSON-тела запроса: тело тогда читается
+    заранее и передаётся приложению без изменений.
+    """
+
+    def __init__(self, app, rules: Sequence[Tuple],
+                 controller: AdmissionController = admission):
+        self.app = app
+        self.rules = [(rule[0], re.compile(rule[1]), rule[2], rule[3] if len(rule) > 3 else 1)
+                      for rule in rules]
+        self.controller = controller
+
+    def _classify(self, method: str, path: str) -> Tuple[Optional[CostClass], Union[int, Callable[[Dict], int]]]:
+        for rule_method, pattern, name, slots in self.rules:
+            if rule_method == method and pattern.fullmatch(path):
+                return self.controller.classes.get(name), slots
+        return None, 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cost_class, slots = self._classify(scope["method"], scope["path"])
+        if cost_class is None:
+            await self.app(scope, receive, send)
+            return
+        if callable(slots):
+            body, receive = await self._buffer_body(receive)
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                payload = {}
+            slots = slots(payload if isinstance(payload, dict) else {})
+
+        if not await cost_class.acquire(slots):
+            await self._reject(cost_class, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await cost_class.release(time.perf_counter() - started, slots)
+
+    @staticmethod
+    async def _buffer_body(receive):
+        """Тело запроса целиком и receive, который отдаст его приложению повторно"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return body, replay
+
+    @staticmethod
+    async def _reject(cost_class: CostClass, send) -> None:
+        body = json.dumps({
+            "detail": "Сервер занят, повторите запрос позже",
+            "cost_class": cost_class.name
+        }, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(cost_class.retry_after()).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -3,9 +3,99 @@ from typing import Optional
 
 class Settings:
     DATABASE_URL: str = "sqlite:///geo_anomaly.db"
+    # Файл SQLite (пусто - geo_anomaly.db в корне репозитория)
+    DATABASE_PATH: str = ""
+    # Сколько запись ждёт блокировку SQLite, прежде чем вернуть ошибку (сек)
+    DATABASE_BUSY_TIMEOUT: float = 30.0
     SECRET_KEY: str = "hakaton-secret-key-2024"
     DEBUG: bool = True
     
+    # Каталог загруженных снимков
+    UPLOAD_DIR: str = "data/raw"
+    
+    # Объём кэша декодированных снимков (в байтах, на процесс)
+    IMAGE_CACHE_BYTES: int = 512 * 1024 * 1024
+    
+    # Каталог производных данных и транскодированных снимков
+    PROCESSED_DIR: str = "data/processed"
+    RASTER_STORE_ENABLED: bool = True
+    RASTER_STORE_BYTES: int = 4 * 1024 * 1024 * 1024
+    # Объём хранилища масок изменений (RLE) на диске
+    MASK_STORE_BYTES: int = 256 * 1024 * 1024
+    
+    # Кэш результатов анализа: объём на диске и число записей в памяти
+    RESULT_CACHE_BYTES: int = 256 * 1024 * 1024
+    RESULT_CACHE_MEMORY_ENTRIES: int = 256
+    
+    # Кэш разностных изображений пар (для подбора порогов)
+    DIFF_CACHE_BYTES: int = 256 * 1024 * 1024
+    
+    # Метод разностного изображения: simple (яркость) или index (спектральный индекс)
+    CHANGE_METHOD: str = "simple"
+    
+    # Пакетный анализ: число процессов, таймаут на снимок (сек), окно снимков в работе
+    BATCH_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)
+    BATCH_TIMEOUT: float = 300.0
+    BATCH_MAX_IN_FLIGHT: int = 0
+    
+    # Очередь задач анализа: процессы-воркеры (0 - не запускать в процессе API),
+    # интервал опроса (сек), попытки, период heartbeat выполняемой задачи,
+    # сколько без heartbeat задача считается "зависшей" и период их поиска (сек)
+    JOB_WORKERS: int = 2
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_HEARTBEAT_INTERVAL: float = 30.0
+    JOB_STALE_SECONDS: int = 300
+    JOB_SWEEP_INTERVAL: float = 60.0
+    
+    # Модель фона территории: порог z-score и минимальное СКО (шум сенсора)
+    BASELINE_Z_THRESHOLD: float = 3.0
+    BASELINE_MIN_STD: float = 4.0
+    
+    # Совмещение снимков перед вычитанием (фазовая корреляция)
+    REGISTRATION_ENABLED: bool = True
+    
+    # Кэш отрисованных визуализаций изменений (в байтах)
+    OVERLAY_CACHE_BYTES: int = 128 * 1024 * 1024
+    
+    # Лента новых аномалий: интервал опроса БД (сек) и очередь на клиента
+    FEED_POLL_INTERVAL: float = 1.0
+    FEED_MAX_QUEUE: int = 1000
+    
+    # Кэш ответов GET для справочных эндпоинтов: включён, число записей
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    
+    # Профилирование по запросу: токен администратора (пусто - выключено),
+    # каталог профилей, его объём (в байтах) и интервал сэмплирования (сек)
+    PROFILE_TOKEN: str = ""
+    PROFILE_DIR: str = "data/profiles"
+    PROFILE_MAX_BYTES: int = 256 * 1024 * 1024
+    PROFILE_SAMPLE_INTERVAL: float = 0.005
+    
+    # Прогрев анализатора (cv2, numpy) в фоне после старта процесса API
+    PRELOAD_ANALYSIS: bool = True
+    
+    # Контроль допуска: одновременные тяжёлые анализы и выгрузки/загрузки,
+    # очередь ожидающих на класс и время ожидания слота (сек, 0 - сразу 429)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_HEAVY_LIMIT: int = max(1, (os.cpu_count() or 2) // 2)
+    ADMISSION_BULK_LIMIT: int = 8
+    ADMISSION_MAX_QUEUE: int = 16
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0
+    
+    # Статика с отпечатками содержимого и заранее сжатыми вариантами (gzip, brotli)
+    STATIC_ASSETS_ENABLED: bool = True
+    
+    # Треки аномалий: слияние повторных обнаружений, допустимый разрыв между
+    # снимками (часы), минимальное перекрытие bbox, ячейка сетки индекса и запас
+    # поиска треков вокруг обнаружений снимка (градусы)
+    TRACKING_ENABLED: bool = True
+    TRACK_MAX_GAP_HOURS: float = 72.0
+    TRACK_MIN_OVERLAP: float = 0.1
+    TRACK_GRID_DEG: float = 0.02
+    TRACK_SEARCH_MARGIN_DEG: float = 0.1
+    
     def __init__(self):
         # Можно переопределить через .env
         if os.path.exists(".env"):
@@ -13,7 +103,52 @@ class Settings:
             load_dotenv()
             
             self.DATABASE_URL = os.getenv("DATABASE_URL", self.DATABASE_URL)
+            self.DATABASE_PATH = os.getenv("DATABASE_PATH", self.DATABASE_PATH)
+            self.DATABASE_BUSY_TIMEOUT = float(os.getenv("DATABASE_BUSY_TIMEOUT", self.DATABASE_BUSY_TIMEOUT))
             self.SECRET_KEY = os.getenv("SECRET_KEY", self.SECRET_KEY)
             self.DEBUG = os.getenv("DEBUG", str(self.DEBUG)).lower() == "true"
+            self.IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", self.IMAGE_CACHE_BYTES))
+            self.PROCESSED_DIR = os.getenv("PROCESSED_DIR", self.PROCESSED_DIR)
+            self.UPLOAD_DIR = os.getenv("UPLOAD_DIR", self.UPLOAD_DIR)
+            self.RASTER_STORE_ENABLED = os.getenv("RASTER_STORE_ENABLED", str(self.RASTER_STORE_ENABLED)).lower() == "true"
+            self.RASTER_STORE_BYTES = int(os.getenv("RASTER_STORE_BYTES", self.RASTER_STORE_BYTES))
+            self.MASK_STORE_BYTES = int(os.getenv("MASK_STORE_BYTES", self.MASK_STORE_BYTES))
+            self.RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", self.RESULT_CACHE_BYTES))
+            self.RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", self.RESULT_CACHE_MEMORY_ENTRIES))
+            self.DIFF_CACHE_BYTES = int(os.getenv("DIFF_CACHE_BYTES", self.DIFF_CACHE_BYTES))
+            self.CHANGE_METHOD = os.getenv("CHANGE_METHOD", self.CHANGE_METHOD)
+            self.BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", self.BATCH_WORKERS))
+            self.BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", self.BATCH_TIMEOUT))
+            self.BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", self.BATCH_MAX_IN_FLIGHT))
+            self.JOB_WORKERS = int(os.getenv("JOB_WORKERS", self.JOB_WORKERS))
+            self.JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", self.JOB_POLL_INTERVAL))
+            self.JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", self.JOB_MAX_ATTEMPTS))
+            self.JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", self.JOB_HEARTBEAT_INTERVAL))
+            self.JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", self.JOB_STALE_SECONDS))
+            self.JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", self.JOB_SWEEP_INTERVAL))
+            self.BASELINE_Z_THRESHOLD = float(os.getenv("BASELINE_Z_THRESHOLD", self.BASELINE_Z_THRESHOLD))
+            self.BASELINE_MIN_STD = float(os.getenv("BASELINE_MIN_STD", self.BASELINE_MIN_STD))
+            self.REGISTRATION_ENABLED = os.getenv("REGISTRATION_ENABLED", str(self.REGISTRATION_ENABLED)).lower() == "true"
+            self.OVERLAY_CACHE_BYTES = int(os.getenv("OVERLAY_CACHE_BYTES", self.OVERLAY_CACHE_BYTES))
+            self.FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", self.FEED_POLL_INTERVAL))
+            self.FEED_MAX_QUEUE = int(os.getenv("FEED_MAX_QUEUE", self.FEED_MAX_QUEUE))
+            self.RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", str(self.RESPONSE_CACHE_ENABLED)).lower() == "true"
+            self.RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", self.RESPONSE_CACHE_MAX_ENTRIES))
+            self.PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", self.PROFILE_TOKEN)
+            self.PROFILE_DIR = os.getenv("PROFILE_DIR", self.PROFILE_DIR)
+            self.PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", self.PROFILE_MAX_BYTES))
+            self.PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", self.PROFILE_SAMPLE_INTERVAL))
+            self.PRELOAD_ANALYSIS = os.getenv("PRELOAD_ANALYSIS", str(self.PRELOAD_ANALYSIS)).lower() == "true"
+            self.ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", str(self.ADMISSION_ENABLED)).lower() == "true"
+            self.ADMISSION_HEAVY_LIMIT = int(os.getenv("ADMISSION_HEAVY_LIMIT", self.ADMISSION_HEAVY_LIMIT))
+            self.ADMISSION_BULK_LIMIT = int(os.getenv("ADMISSION_BULK_LIMIT", self.ADMISSION_BULK_LIMIT))
+            self.ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", self.ADMISSION_MAX_QUEUE))
+            self.ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", self.ADMISSION_QUEUE_TIMEOUT))
+            self.STATIC_ASSETS_ENABLED = os.getenv("STATIC_ASSETS_ENABLED", str(self.STATIC_ASSETS_ENABLED)).lower() == "true"
+            self.TRACKING_ENABLED = os.getenv("TRACKING_ENABLED", str(self.TRACKING_ENABLED)).lower() == "true"
+            self.TRACK_MAX_GAP_HOURS = float(os.getenv("TRACK_MAX_GAP_HOURS", self.TRACK_MAX_GAP_HOURS))
+            self.TRACK_MIN_OVERLAP = float(os.getenv("TRACK_MIN_OVERLAP", self.TRACK_MIN_OVERLAP))
+            self.TRACK_GRID_DEG = float(os.getenv("TRACK_GRID_DEG", self.TRACK_GRID_DEG))
+            self.TRACK_SEARCH_MARGIN_DEG = float(os.getenv("TRACK_SEARCH_MARGIN_DEG", self.TRACK_SEARCH_MARGIN_DEG))
 
 settings = Settings()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -7,7 +7,7 @@ from .config import settings
 
 # Используем SQLite для простоты
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DATABASE_PATH = os.path.join(BASE_DIR, "geo_anomaly.db")
+DATABASE_PATH = settings.DATABASE_PATH or os.path.join(BASE_DIR, "geo_anomaly.db")
 
 engine = create_engine(
     f"sqlite:///{DATABASE_PATH}",
@@ -15,6 +15,15 @@ engine = create_engine(
     echo=True  # Показывать SQL запросы в консоли
 )
 
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: чтения API не блокируются записями воркеров очереди;
+    # busy_timeout: запись ждёт блокировку, а не падает с "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.DATABASE_BUSY_TIMEOUT * 1000)}")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -23,4 +32,27 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def upgrade_schema():
+    """
+    Новые колонки и индексы моделей в уже существующих таблицах
+    (create_all создаёт только отсутствующие таблицы)
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {getattr(column.server_default.arg, 'text', column.server_default.arg)}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
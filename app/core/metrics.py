@@ -0,0 +1,252 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек (секунды)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+START_TIME = time.time()
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (счётчики, сумма, число наблюдений)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (+Inf последней), сумма, число]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self) -> Dict[LabelValues, Dict]:
+        """Число наблюдений, сумма и среднее по каждому набору меток"""
+        with self._lock:
+            return {
+                labels: {"count": count, "sum": total, "mean": total / count if count else 0.0}
+                for labels, (_, total, count) in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Показатель, снимаемый в момент выгрузки через функцию-источник"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            lines.append(f"# {self.name} unavailable: {_escape(e)}")
+            return lines
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {float(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в формате Prometheus
+
+    Значения хранятся в памяти процесса: воркеры очереди и пакетного анализа
+    считают свои метрики отдельно от процесса API.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str],
+              collect: Callable[[], Dict[LabelValues, float]]) -> Gauge:
+        gauge = Gauge(name, documentation, labelnames, collect)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "geo_pipeline_stage_seconds", "Время этапа пайплайна анализа", ["stage"]
+)
+STAGE_ITEMS = metrics.counter(
+    "geo_pipeline_stage_items_total", "Число элементов, обработанных этапом", ["stage"]
+)
+HTTP_SECONDS = metrics.histogram(
+    "geo_http_request_seconds", "Время обработки HTTP-запроса", ["method", "route", "status"]
+)
+metrics.gauge(
+    "geo_process_uptime_seconds", "Время работы процесса", [],
+    lambda: {(): time.time() - START_TIME}
+)
+
+
+@contextmanager
+def stage(name: str, items: Optional[int] = None) -> Iterator[None]:
+    """Замер этапа пайплайна: with stage("diff"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, name)
+        if items:
+            STAGE_ITEMS.inc(items, name)
+
+
+def observe_stage(name: str, seconds: float, items: Optional[int] = None) -> None:
+    """Запись уже измеренного времени этапа (накопленного в цикле)"""
+    STAGE_SECONDS.observe(seconds, name)
+    if items:
+        STAGE_ITEMS.inc(items, name)
+
+
+def count_items(name: str, items: int) -> None:
+    if items:
+        STAGE_ITEMS.inc(items, name)
+
+
+def stage_summary() -> Dict[str, Dict]:
+    """Сводка по этапам: число замеров, среднее время (мс), элементы"""
+    items = STAGE_ITEMS.values()
+    return {
+        labels[0]: {
+            "count": data["count"],
+            "mean_ms": round(data["mean"] * 1000, 3),
+            "total_s": round(data["sum"], 3),
+            "items": int(items.get(labels, 0))
+        }
+        for labels, data in sorted(STAGE_SECONDS.summary().items())
+    }
+
+
+class MetricsMiddleware:
+    """Гистограмма задержек по маршрутам (шаблон пути, а не конкретный URL)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_SECONDS.observe(elapsed, scope["method"], _route_label(scope), str(status[0]))
+
+
+def _route_label(scope) -> str:
+    """
+    Метка маршрута: путь с подставленными именами параметров (/api/images/{image_id}),
+    чтобы число рядов не зависело от числа разных URL
+    """
+    if scope.get("route") is None:
+        # Ответ из кэша ответов - по его правилу, иначе маршрут не найден
+        return scope.get("cache_rule", "unmatched")
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        value = str(value)
+        index = path.rfind(value)
+        if value and index >= 0:
+            path = path[:index] + "{" + name + "}" + path[index + len(value):]
+    return path
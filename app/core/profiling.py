@@ -0,0 +1,237 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from app.utils.cache import evict_lru_files
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# Корень пакета app: при профилировании запроса берём только стеки с кодом приложения
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profiling_allowed(token: Optional[str]) -> bool:
+    """Профилирование включено (задан PROFILE_TOKEN) и токен совпадает"""
+    if not settings.PROFILE_TOKEN or not token:
+        return False
+    # Байты, а не str: compare_digest не принимает не-ASCII строки (заголовки - latin-1)
+    return hmac.compare_digest(token.encode("utf-8"), settings.PROFILE_TOKEN.encode("utf-8"))
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик: отдельный поток раз в interval снимает стеки
+    через sys._current_frames() и считает их в формате collapsed stacks
+    (вход для flamegraph.pl / speedscope). Профилируемый код не замедляется.
+    """
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None, app_only: bool = False):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.app_only = app_only
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                stack, in_app = [], False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if self.app_only and not in_app:
+                    continue
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _path(profile_id: str, suffix: str) -> str:
+    if not PROFILE_ID_PATTERN.fullmatch(profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id}")
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}{suffix}")
+
+
+@contextmanager
+def profile_block(mode: str, label: str, profile_id: Optional[str] = None,
+                  thread_id: Optional[int] = None, app_only: bool = False) -> Iterator[Dict]:
+    """
+    Профилирование блока кода; профиль сохраняется в PROFILE_DIR
+
+    cprofile - детерминированный профиль текущего потока (pstats),
+    sample - сэмплирование стеков (всех потоков или thread_id) в collapsed stacks.
+    """
+    session = _start_profile(mode, label, profile_id, thread_id, app_only)
+    try:
+        yield session[0]
+    finally:
+        _finish_profile(*session)
+
+
+def _start_profile(mode: str, label: str, profile_id: Optional[str] = None,
+                   thread_id: Optional[int] = None, app_only: bool = False) -> Tuple:
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    info = {
+        "id": profile_id or uuid.uuid4().hex,
+        "mode": mode,
+        "label": label,
+        "started_at": datetime.now().isoformat()
+    }
+
+    profiler = sampler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL, thread_id, app_only)
+        sampler.start()
+    return info, profiler, sampler, time.perf_counter()
+
+
+def _finish_profile(info: Dict, profiler: Optional[cProfile.Profile],
+                    sampler: Optional[StackSampler], started: float) -> None:
+    """Остановка профилировщика и запись профиля (файловый ввод-вывод)"""
+    info["duration"] = round(time.perf_counter() - started, 6)
+    if profiler is not None:
+        profiler.disable()
+    else:
+        sampler.stop()
+        info["samples"] = sampler.samples
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    if profiler is not None:
+        profiler.dump_stats(_path(info["id"], ".prof"))
+    else:
+        with open(_path(info["id"], ".collapsed"), "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+    with open(_path(info["id"], ".json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False)
+    evict_lru_files(settings.PROFILE_DIR, settings.PROFILE_MAX_BYTES)
+
+
+def load_profile_meta(profile_id: str) -> Optional[Dict]:
+    try:
+        with open(_path(profile_id, ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles() -> List[Dict]:
+    profiles = []
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except OSError:
+        return profiles
+    for name in names:
+        if name.endswith(".json"):
+            meta = load_profile_meta(name[:-5])
+            if meta is not None:
+                profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta["started_at"], reverse=True)
+
+
+def render_profile(profile_id: str, fmt: str = "text", limit: int = 60) -> Optional[Tuple[bytes, str]]:
+    """
+    Профиль для выдачи: (байты, media type)
+
+    text - отчёт pstats (по cumulative) или collapsed stacks, raw - исходный
+    файл .prof для snakeviz / pstats.
+    """
+    meta = load_profile_meta(profile_id)
+    if meta is None:
+        return None
+
+    if meta["mode"] == "sample":
+        try:
+            with open(_path(profile_id, ".collapsed"), "rb") as f:
+                return f.read(), "text/plain; charset=utf-8"
+        except OSError:
+            return None
+
+    try:
+        if fmt == "raw":
+            with open(_path(profile_id, ".prof"), "rb") as f:
+                return f.read(), "application/octet-stream"
+        stream = io.StringIO()
+        stats = pstats.Stats(_path(profile_id, ".prof"), stream=stream)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue().encode("utf-8"), "text/plain; charset=utf-8"
+    except OSError:
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование отдельного запроса по заголовкам администратора
+
+    X-Profile-Token: <PROFILE_TOKEN> и X-Profile: sample. Синхронные обработчики
+    выполняются в пуле потоков, поэтому запрос профилируется сэмплированием всех
+    потоков (только стеки с кодом приложения). Id профиля - в заголовке X-Profile-Id.
+    Запросы без заголовков проходят без изменений.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        mode = headers.get(b"x-profile")
+        if mode is None or not profiling_allowed(headers.get(b"x-profile-token", b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]}
+            await send(message)
+
+        label = f"{scope['method']} {scope['path']}"
+        session = _start_profile("sample", label, profile_id=profile_id, app_only=True)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Остановка сэмплера (join) и запись файлов не блокируют event loop
+            await run_in_threadpool(_finish_profile, *session)
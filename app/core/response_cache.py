@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from .config import settings
+
+
+def _version_path() -> str:
+    return os.path.join(settings.PROCESSED_DIR, ".data_version")
+
+
+def data_version() -> int:
+    """Метка версии данных (mtime файла-маркера, общая для всех процессов)"""
+    try:
+        return os.stat(_version_path()).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def bump_data_version() -> None:
+    """Отметка о новых данных: кэшированные ответы всех процессов устаревают"""
+    path = _version_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a"):
+        pass
+    os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+
+class CachedResponse:
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes,
+                 etag: str, expires_at: float, version: int):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+        self.version = version
+
+
+class ResponseCacheMiddleware:
+    """
+    Кэш ответов GET для редко меняющихся эндпоинтов (ASGI middleware)
+
+    Ключ - путь плюс отсортированные параметры запроса. Запись живёт TTL своего
+    правила и сбрасывается раньше, если изменилась версия данных (загрузка снимка,
+    новые аномалии от воркеров). На ответ ставится сильный ETag (sha256 тела);
+    при совпадении If-None-Match отдаётся 304 без тела.
+    """
+
+    def __init__(self, app, rules: Sequence[Tuple[str, float]], max_entries: int = 1024):
+        self.app = app
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in rules]
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], CachedResponse]" = OrderedDict()
+
+    def _match(self, path: str) -> Tuple[Optional[str], Optional[float]]:
+        for pattern, ttl in self.rules:
+            if pattern.fullmatch(path):
+                return pattern.pattern, ttl
+        return None, None
+
+    @staticmethod
+    def _request_header(scope, name: bytes) -> Optional[str]:
+        for key, value in scope.get("headers", []):
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        rule, ttl = self._match(scope["path"])
+        if ttl is None:
+            await self.app(scope, receive, send)
+            return
+
+        query = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+        key = (scope["path"], urlencode(query))
+        version = data_version()
+        if_none_match = self._request_header(scope, b"if-none-match")
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic() and entry.version == version:
+            self._entries.move_to_end(key)
+            scope["cache_rule"] = rule
+            await self._send_entry(entry, send, if_none_match, b"HIT")
+            return
+
+        # Промах: собираем ответ целиком, чтобы посчитать ETag
+        start: Dict = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        body = b"".join(chunks)
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in (b"etag", b"content-length")]
+        entry = CachedResponse(
+            status=start.get("status", 500),
+            headers=headers,
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            expires_at=time.monotonic() + ttl,
+            version=version
+        )
+        if entry.status == 200:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        await self._send_entry(entry, send, if_none_match, b"MISS")
+
+    async def _send_entry(self, entry: CachedResponse, send,
+                          if_none_match: Optional[str], cache_status: bytes) -> None:
+        headers = list(entry.headers)
+        if entry.status != 200:
+            headers.append((b"content-length", str(len(entry.body)).encode()))
+            await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        headers += [
+            (b"etag", entry.etag.encode()),
+            (b"cache-control", b"no-cache"),
+            (b"x-cache", cache_status)
+        ]
+        if if_none_match is not None and self._etag_matches(if_none_match, entry.etag):
+            headers = [(k, v) for k, v in headers if k.lower() not in (b"content-type", b"content-length")]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers.append((b"content-length", str(len(entry.body)).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
+
+    @staticmethod
+    def _etag_matches(if_none_match: str, etag: str) -> bool:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+
+    def invalidate(self) -> None:
+        self._entries.clear()
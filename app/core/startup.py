@@ -0,0 +1,61 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .metrics import metrics
+
+# Тяжёлые библиотеки анализа: в отчёте видно, загружены ли они к моменту готовности
+HEAVY_MODULES = ("cv2", "numpy", "scipy", "PIL", "sklearn")
+
+
+class StartupReport:
+    """
+    Время запуска процесса API по шагам: импорт, сборка приложения,
+    подключение роутеров, инициализация в lifespan
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+        self.ready_in: Optional[float] = None
+        self.heavy_loaded: List[str] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def mark(self, name: str) -> None:
+        """Шаг от начала отсчёта до текущего момента за вычетом уже записанных"""
+        elapsed = time.perf_counter() - self.started - sum(seconds for _, seconds in self.steps)
+        self.steps.append((name, max(0.0, elapsed)))
+
+    def mark_ready(self) -> None:
+        self.ready_in = time.perf_counter() - self.started
+        self.heavy_loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    def as_dict(self) -> Dict:
+        return {
+            "ready_in_s": round(self.ready_in, 4) if self.ready_in is not None else None,
+            "steps": {name: round(seconds, 4) for name, seconds in self.steps},
+            "heavy_modules_loaded": self.heavy_loaded
+        }
+
+    def log(self) -> None:
+        print(f"⏱️ Готов к работе за {self.ready_in:.3f} с")
+        for name, seconds in sorted(self.steps, key=lambda item: item[1], reverse=True):
+            print(f"   {name:<32} {seconds * 1000:8.1f} мс")
+        if self.heavy_loaded:
+            print(f"   загружены при старте: {', '.join(self.heavy_loaded)}")
+
+
+startup_report = StartupReport()
+
+metrics.gauge(
+    "geo_startup_seconds", "Время шагов запуска процесса API", ["step"],
+    lambda: {(name,): seconds for name, seconds in startup_report.steps}
+)
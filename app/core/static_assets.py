@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+from typing import Dict, List, Optional
+
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен: отдаём gzip
+    brotli = None
+
+# Текстовые файлы, которые имеет смысл сжимать заранее
+MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".json": "application/json",
+}
+IMMUTABLE = b"public, max-age=31536000, immutable"
+REVALIDATE = b"no-cache"
+
+# Ссылки на локальные файлы в HTML: src="map.js", href="/static/style.css"
+LINK_PATTERN = re.compile(r'''(\b(?:src|href)=)(["'])([^"'#?:]+)\2''')
+
+
+class Asset:
+    def __init__(self, media_type: str, digest: str, variants: Dict[str, bytes], immutable: bool):
+        self.media_type = media_type
+        self.digest = digest
+        # кодировка (identity, gzip, br) -> тело ответа
+        self.variants = variants
+        self.immutable = immutable
+
+
+class StaticAssets:
+    """
+    Статика с заранее сжатыми вариантами и отпечатками содержимого (ASGI)
+
+    При старте текстовые файлы получают имена с хэшем (map.<hash>.js), для них
+    пишутся варианты gzip и brotli (если установлен) в PROCESSED_DIR/static,
+    ссылки в HTML переписываются на эти имена. Файлы с отпечатком отдаются с
+    Cache-Control: immutable, HTML и исходные имена - с ETag и no-cache.
+    Кодировка выбирается по Accept-Encoding. Остальные файлы (картинки) отдаёт
+    обычный StaticFiles.
+    """
+
+    def __init__(self, directory: str, build_dir: str):
+        self.directory = directory
+        self.build_dir = build_dir
+        self.fallback = StaticFiles(directory=directory, html=True)
+        self.assets: Optional[Dict[str, Asset]] = None
+
+    def build(self) -> None:
+        sources = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if os.path.splitext(name)[1] in MEDIA_TYPES:
+                    sources.append(os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/"))
+
+        assets: Dict[str, Asset] = {}
+        fingerprints: Dict[str, str] = {}
+        written: List[str] = []
+        raw_bytes = sent_bytes = 0
+        # HTML последним: в нём подставляются имена уже собранных файлов
+        for rel in sorted(sources, key=lambda path: path.endswith(".html")):
+            with open(os.path.join(self.directory, rel), "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(rel)
+            if ext == ".html":
+                data = self._rewrite_links(data, rel, fingerprints)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            fingerprinted = f"{stem}.{digest}{ext}"
+
+            variants = self._write_variants(fingerprinted, data)
+            written.extend(fingerprinted + suffix for suffix in ("", ".gz", ".br"))
+            raw_bytes += len(data)
+            sent_bytes += min(len(body) for body in variants.values())
+
+            # Исходное имя - с проверкой ETag, имя с отпечатком - навсегда
+            assets[rel] = Asset(MEDIA_TYPES[ext], digest, variants, immutable=False)
+            if ext != ".html":
+                fingerprints[rel] = fingerprinted
+                assets[fingerprinted] = Asset(MEDIA_TYPES[ext], digest, variants, immutable=True)
+
+        self._remove_stale(set(written))
+        self.assets = assets
+        print(f"🗜️ Статика: {len(sources)} файлов, {raw_bytes // 1024} КБ -> "
+              f"{sent_bytes // 1024} КБ сжатыми ({', '.join(self.encodings())})")
+
+    @staticmethod
+    def encodings() -> List[str]:
+        return (["br"] if brotli is not None else []) + ["gzip"]
+
+    def _write_variants(self, name: str, data: bytes) -> Dict[str, bytes]:
+        """Запись файла и его сжатых вариантов (имена по содержимому: уже собранные не пересжимаются)"""
+        variants = {"identity": data}
+        compressors = {"gzip": (".gz", lambda body: gzip.compress(body, compresslevel=9, mtime=0))}
+        if brotli is not None:
+            compressors["br"] = (".br", lambda body: brotli.compress(body, quality=11))
+
+        path = os.path.join(self.build_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        for encoding, (suffix, compress) in compressors.items():
+            try:
+                with open(path + suffix, "rb") as f:
+                    body = f.read()
+            except OSError:
+                body = compress(data)
+                self._write_atomic(path + suffix, body)
+            # Маленьким файлам сжатие может не помочь
+            if len(body) < len(data):
+                variants[encoding] = body
+        return variants
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        # Несколько воркеров uvicorn собирают статику одновременно
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_stale(self, keep: set) -> None:
+        for root, _, names in os.walk(self.build_dir):
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), self.build_dir).replace(os.sep, "/")
+                if rel not in keep and not name.endswith(".tmp"):
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def _rewrite_links(html: bytes, rel: str, fingerprints: Dict[str, str]) -> bytes:
+        base = posixpath.dirname(rel)
+        text = html.decode("utf-8")
+
+        def replace(match):
+            target = match.group(3)
+            if target.startswith("/static/"):
+                fingerprinted = fingerprints.get(target[len("/static/"):])
+                new_target = "/static/" + fingerprinted if fingerprinted else target
+            else:
+                fingerprinted = fingerprints.get(posixpath.normpath(posixpath.join(base, target)))
+                new_target = posixpath.relpath(fingerprinted, base or ".") if fingerprinted else target
+            return f"{match.group(1)}{match.group(2)}{new_target}{match.group(2)}"
+
+        return LINK_PATTERN.sub(replace, text).encode("utf-8")
+
+    @staticmethod
+    def _negotiate(accept_encoding: str, asset: Asset) -> str:
+        accepted = {}
+        for part in accept_encoding.split(","):
+            token, _, params = part.strip().partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[token.strip().lower()] = quality
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.fallback(scope, receive, send)
+            return
+        if self.assets is None:
+            self.build()
+
+        # Путь внутри точки монтирования (root_path уже включает /static)
+        path, root_path = scope["path"], scope.get("root_path", "")
+        rel = (path[len(root_path):] if path.startswith(root_path) else path).lstrip("/")
+        if rel == "" or rel.endswith("/"):
+            rel += "index.html"
+        asset = self.assets.get(rel)
+        if asset is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        encoding = self._negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"), asset)
+        body = asset.variants[encoding]
+        etag = f'"{asset.digest}"' if encoding == "identity" else f'"{asset.digest}-{encoding}"'
+
+        response_headers = [
+            (b"content-type", asset.media_type.encode()),
+            (b"cache-control", IMMUTABLE if asset.immutable else REVALIDATE),
+            (b"etag", etag.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if encoding != "identity":
+            response_headers.append((b"content-encoding", encoding.encode()))
+
+        if_none_match = headers.get(b"if-none-match", b"").decode("latin-1")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            await send({"type": "http.response.start", "status": 304, "headers": response_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        response_headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
@@ -1,54 +1,158 @@
-from fastapi import FastAPI
+from app.core.startup import startup_report
+
+import importlib
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import os
-import uvicorn
-
-# Создаем директории
-os.makedirs("app/static", exist_ok=True)
-os.makedirs("data/raw", exist_ok=True)
-os.makedirs("data/processed", exist_ok=True)
-
-app = FastAPI(
-    title="Geo Anomaly Detector",
-    description="Система автоматического мониторинга земной поверхности",
-    version="1.0.0",
-    debug=True
-)
-
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Статические файлы
-app.mount("/static", StaticFiles(directory="app/static", html=True), name="static")
-
-# Импорт API
-try:
-    from app.api import images, anomalies, analysis
-    app.include_router(images.router, prefix="/api")
-    app.include_router(anomalies.router, prefix="/api")
-    app.include_router(analysis.router, prefix="/api")
+
+from app.core.admission import AdmissionControlMiddleware, batch_request_slots
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.response_cache import ResponseCacheMiddleware
+from app.core.static_assets import StaticAssets
+
+startup_report.mark("import app.main")
+
+# Роутеры API: модули импортируются при сборке приложения, тяжёлые сервисы
+# анализа (cv2, numpy) - лениво, при первом обращении
+API_ROUTERS = ("images", "anomalies", "analysis", "profiles")
+
+router = APIRouter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Однократная инициализация процесса: таблицы БД, воркеры очереди задач"""
+    from app.core.databace import Base, engine, upgrade_schema
+    from app.models import anomaly, image, job  # noqa: F401
+    
+    with startup_report.step("database tables"):
+        Base.metadata.create_all(bind=engine)
+        upgrade_schema()
+    
+    if app.state.static_assets is not None:
+        with startup_report.step("static assets"):
+            app.state.static_assets.build()
+    
+    job_pool = None
+    if settings.JOB_WORKERS > 0:
+        from app.services.job_queue import JobWorkerPool
+        with startup_report.step("job workers"):
+            job_pool = JobWorkerPool(settings.JOB_WORKERS)
+            job_pool.start()
+    
+    startup_report.mark_ready()
+    startup_report.log()
+    
+    # Прогрев анализатора в фоне: процесс уже принимает запросы
+    if settings.PRELOAD_ANALYSIS:
+        from app.api.analysis import get_analyzer
+        threading.Thread(target=get_analyzer, name="preload-analysis", daemon=True).start()
+    
+    try:
+        yield
+    finally:
+        if job_pool is not None:
+            job_pool.stop()
+
+def create_app() -> FastAPI:
+    """Сборка приложения: middleware, статика, роутеры"""
+    with startup_report.step("create app"):
+        # Создаем директории
+        os.makedirs("app/static", exist_ok=True)
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(settings.PROCESSED_DIR, exist_ok=True)
+        
+        app = FastAPI(
+            title="Geo Anomaly Detector",
+            description="Система автоматического мониторинга земной поверхности",
+            version="1.0.0",
+            debug=True,
+            lifespan=lifespan
+        )
+        
+        # Middleware добавляются изнутри наружу: последний добавленный - внешний
+        
+        # Контроль допуска: (метод, шаблон пути, класс стоимости[, слоты]);
+        # остальные запросы лёгкие и не ограничиваются. Пакетный анализ запускает
+        # свой пул процессов и занимает по слоту на запрошенный процесс
+        if settings.ADMISSION_ENABLED:
+            app.add_middleware(
+                AdmissionControlMiddleware,
+                rules=[
+                    ("POST", r"/api/analysis/batch", "heavy", batch_request_slots),
+                    ("POST", r"/api/analysis/(sweep|stack|baseline/[^/]+)", "heavy"),
+                    ("GET", r"/api/analysis/overlays/[^/]+", "heavy"),
+                    ("POST", r"/api/images/upload", "bulk"),
+                    ("GET", r"/api/anomalies/export", "bulk"),
+                ]
+            )
+        
+        # Кэш ответов справочных эндпоинтов: (шаблон пути, TTL в секундах)
+        if settings.RESPONSE_CACHE_ENABLED:
+            app.add_middleware(
+                ResponseCacheMiddleware,
+                rules=[
+                    (r"/api/global/(countries|fires)", 300),
+                    (r"/api/global/search/[^/]+", 300),
+                    (r"/api/anomalies/?", 30),
+                    (r"/api/analysis/stats", 5),
+                ],
+                max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES
+            )
+        
+        # Гистограмма задержек по маршрутам (внешний слой - учитывает и кэш ответов)
+        app.add_middleware(MetricsMiddleware)
+        
+        # Профилирование отдельных запросов по заголовкам администратора
+        app.add_middleware(ProfilingMiddleware)
+        
+        # CORS - внешний слой: заголовки есть и у ответов 429, и у ответов из кэша
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+        
+        # Статические файлы: сжатые варианты и имена с отпечатками собираются при старте
+        app.state.static_assets = None
+        if settings.STATIC_ASSETS_ENABLED:
+            app.state.static_assets = StaticAssets("app/static", os.path.join(settings.PROCESSED_DIR, "static"))
+            app.mount("/static", app.state.static_assets, name="static")
+        else:
+            app.mount("/static", StaticFiles(directory="app/static", html=True), name="static")
+    
+    # Импорт API
+    for name in API_ROUTERS:
+        try:
+            with startup_report.step(f"router {name}"):
+                module = importlib.import_module(f"app.api.{name}")
+                app.include_router(module.router, prefix="/api")
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки API {name}: {e}")
     print("✅ API роутеры загружены")
-except Exception as e:
-    print(f"⚠️ Ошибка загрузки API: {e}")
+    
+    app.include_router(router)
+    return app
 
 # Глобальный поиск API (встроен в main.py для простоты)
 from fastapi import Query
 from datetime import datetime
 import random
 
-@app.get("/api/global/countries")
+@router.get("/api/global/countries")
 async def get_countries():
     countries = ["Россия", "Германия", "Испания", "США", "Китай", "Бразилия", "Австралия", "Франция", "Италия", "Канада"]
     return {"countries": countries, "count": len(countries)}
 
-@app.get("/api/global/search/{country}")
+@router.get("/api/global/search/{country}")
 async def search_by_country(country: str, year: int = Query(None)):
     # Демо данные для каждой страны
     country_data = {
@@ -99,7 +203,7 @@ async def search_by_country(country: str, year: int = Query(None)):
             "message": f"Используйте: {', '.join(country_data.keys())}"
         }
 
-@app.get("/api/global/fires")
+@router.get("/api/global/fires")
 async def get_fire_stats(country: str = Query(None)):
     fire_data = {
         "global": {"total": 238, "by_year": {"2020": 45, "2021": 52, "2022": 67, "2023": 74}},
@@ -115,7 +219,7 @@ async def get_fire_stats(country: str = Query(None)):
         return {"global": fire_data["global"], "available_countries": list(fire_data.keys())[1:]}
 
 # Основные роуты
-@app.get("/")
+@router.get("/")
 async def root():
     return {
         "message": "Geo Anomaly Detection System",
@@ -128,15 +232,24 @@ async def root():
         }
     }
 
-@app.get("/health")
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/health")
 async def health():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "startup": startup_report.as_dict()}
 
-@app.get("/test")
+@router.get("/test")
 async def test():
     return {"test": "success", "message": "Все системы работают"}
 
+app = create_app()
+
 if __name__ == "__main__":
+    import uvicorn
+    
     print("\n" + "="*70)
     print("🚀 GEO ANOMALY DETECTOR - СИСТЕМА ЗАПУЩЕНА!")
     print("="*70)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.databace import Base
@@ -17,5 +17,41 @@ class Anomaly(Base):
     description = Column(Text, nullable=True)
     detected_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Трек события: повторные обнаружения того же места расширяют bbox,
+    # сдвигают last_seen и поднимают пиковую уверенность вместо новых строк
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    detections = Column(Integer, nullable=True, server_default="1")
+    
     # Связь
-    image = relationship("SatelliteImage", backref="anomalies")
\ No newline at end of file
+    image = relationship("SatelliteImage", backref="anomalies")
+    
+    __table_args__ = (
+        # Поиск открытых треков при слиянии: тип + время последнего обнаружения
+        Index("ix_anomalies_type_last_seen", "anomaly_type", "last_seen"),
+        # Отбор треков рядом с новыми обнаружениями: тип + диапазон координат
+        Index("ix_anomalies_type_lat_lon", "anomaly_type", "latitude", "longitude"),
+    )
+
+class AnomalyDetection(Base):
+    """Отдельное обнаружение аномалии на снимке (сырьё трека)"""
+    __tablename__ = "anomaly_detections"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    anomaly_id = Column(Integer, ForeignKey("anomalies.id"), index=True, nullable=False)
+    image_id = Column(Integer, ForeignKey("satellite_images.id"), index=True)
+    # Ключ анализа (кэша результатов): повтор того же анализа не дублирует строки
+    analysis_id = Column(String(64), nullable=True)
+    anomaly_type = Column(String(50), nullable=False)
+    confidence = Column(Float, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    bbox = Column(Text, nullable=True)
+    area = Column(Float, nullable=True)
+    description = Column(Text, nullable=True)
+    observed_at = Column(DateTime, nullable=True)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_anomaly_detections_image_analysis", "image_id", "analysis_id"),
+    )
\ No newline at end of file
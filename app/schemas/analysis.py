@@ -0,0 +1,73 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, List, Optional
+import json
+
+class SweepRequest(BaseModel):
+    image_id: int
+    reference_id: int
+    thresholds: List[int] = Field(..., min_length=1, max_length=64)
+    min_areas: List[float] = Field(default_factory=lambda: [50.0], min_length=1, max_length=64)
+
+class SweepCombination(BaseModel):
+    threshold: int
+    min_area: float
+    region_count: int
+    change_area: float
+    change_percentage: float
+
+class SweepResponse(BaseModel):
+    image_id: int
+    reference_id: int
+    combinations: List[SweepCombination]
+
+class BatchRequest(BaseModel):
+    image_ids: List[int] = Field(..., min_length=1, max_length=10000)
+    reference_id: Optional[int] = None
+    workers: Optional[int] = Field(None, ge=0, le=64)
+    timeout: Optional[float] = Field(None, gt=0)
+
+class StackRequest(BaseModel):
+    image_ids: List[int] = Field(..., min_length=2, max_length=1000)
+
+class BaselineRequest(BaseModel):
+    image_id: int
+    update: bool = True
+    z_threshold: Optional[float] = Field(None, gt=0)
+
+class JobCreate(BaseModel):
+    image_id: int
+    reference_id: Optional[int] = None
+    priority: int = Field(0, ge=-100, le=100)
+    max_attempts: Optional[int] = Field(None, ge=1, le=10)
+    # Профилирование анализа (нужен заголовок X-Profile-Token)
+    profile: Optional[str] = Field(None, pattern="^(cprofile|sample)$")
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    @classmethod
+    def from_job(cls, job) -> "JobResponse":
+        return cls(
+            id=job.id,
+            kind=job.kind,
+            status=job.status,
+            priority=job.priority,
+            attempts=job.attempts,
+            max_attempts=job.max_attempts,
+            result=json.loads(job.result) if job.result else None,
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at
+        )
@@ -16,6 +16,24 @@ class AnomalyResponse(AnomalyBase):
     image_id: int
     description: Optional[str] = None
     detected_at: datetime
+    # Трек: первое/последнее обнаружение и их число
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    detections: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+class AnomalyDetectionResponse(AnomalyBase):
+    id: int
+    anomaly_id: int
+    image_id: Optional[int] = None
+    analysis_id: Optional[str] = None
+    area: Optional[float] = None
+    bbox: Optional[str] = None
+    description: Optional[str] = None
+    observed_at: Optional[datetime] = None
+    detected_at: datetime
     
     class Config:
         from_attributes = True
\ No newline at end of file
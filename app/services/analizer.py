@@ -1,14 +1,27 @@
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Iterator
+import copy
+import hashlib
 import json
 from datetime import datetime
 import os
+import time
+import uuid
 
 from .image_loader import ImageLoader
 from .change_detect import ChangeDetector
 from .classifier import AnomalyClassifier
 from .geo_mapper import GeoMapper
+from .result_cache import ResultCache
+from .batch import iter_batch_analyze
+from .baseline import BaselineModel
+from .registration import ImageRegistrar
+from .overlays import OverlayRenderer
+from app.core.config import settings
+from app.core.metrics import count_items, observe_stage, stage
+from app.utils.cache import ArrayCache
+from app.utils.locks import SingleFlight, file_lock
 
 class ImageAnalyzer:
     """Основной сервис анализа изображений"""
@@ -16,28 +29,121 @@ class ImageAnalyzer:
     def __init__(self):
         self.image_loader = ImageLoader()
         self.change_detector = ChangeDetector(threshold=25, min_area=50)
+        self.change_method = settings.CHANGE_METHOD
         self.classifier = AnomalyClassifier()
-        self.results_cache = {}
+        self.results_cache = ResultCache()
+        # Разностные изображения пар: не зависят от порогов, переиспользуются при подборе
+        self.diff_cache = ArrayCache(max_bytes=settings.DIFF_CACHE_BYTES)
+        self.registrar = ImageRegistrar()
+        self.overlay_renderer = OverlayRenderer()
+        # Одновременные анализы одной пары: один прогон на процесс и на все процессы
+        self.single_flight = SingleFlight()
+        self.locks_dir = os.path.join(settings.PROCESSED_DIR, "locks")
     
     def analyze_single_image(self, 
                            image_path: str,
-                           reference_path: Optional[str] = None) -> Dict:
+                           reference_path: Optional[str] = None,
+                           use_cache: bool = True) -> Dict:
         """
         Анализ одного изображения или сравнение с референсным
         
+        Повторный анализ той же пары с теми же параметрами берётся из кэша.
+        Одновременные запросы одной пары объединяются: в процессе - ожиданием
+        уже идущего прогона, между процессами - блокировкой на файле и повторной
+        проверкой кэша после неё.
+        
         Returns:
             Словарь с результатами анализа
         """
-        # Загружаем основное изображение
-        image = self.image_loader.load_image(image_path)
+        cache_key = None
+        if use_cache:
+            with stage("cache_lookup"):
+                cache_key = self._result_cache_key(image_path, reference_path)
+                cached = self.results_cache.get(cache_key) if cache_key is not None else None
+                cached = self._from_cache(cached, image_path) if cached is not None else None
+            if cached is not None:
+                return cached
+        
+        if cache_key is None:
+            return self._analyze_uncached(image_path, reference_path, uuid.uuid4().hex)
+        
+        results, shared = self.single_flight.do(
+            cache_key, lambda: self._analyze_exclusive(image_path, reference_path, cache_key)
+        )
+        # Объект результата общий для всех ожидавших потоков, а вызывающие его дополняют
+        results = copy.deepcopy(results)
+        if shared:
+            results["coalesced"] = True
+            count_items("coalesced", 1)
+        return results
+    
+    def _analyze_exclusive(self, image_path: str, reference_path: Optional[str], cache_key: str) -> Dict:
+        """Прогон под межпроцессной блокировкой ключа (полосы по первым символам хэша)"""
+        with file_lock(os.path.join(self.locks_dir, f"analysis-{cache_key[:2]}.lock")):
+            # Пока ждали блокировку, ту же пару мог посчитать другой процесс
+            cached = self.results_cache.get(cache_key)
+            cached = self._from_cache(cached, image_path) if cached is not None else None
+            if cached is not None:
+                count_items("coalesced", 1)
+                return cached
+            
+            results = self._analyze_uncached(image_path, reference_path, cache_key)
+            if "error" not in results:
+                self.results_cache.put(cache_key, results)
+            return results
+    
+    def _from_cache(self, cached: Dict, image_path: str) -> Optional[Dict]:
+        """
+        Результат из кэша для текущего запроса
+        
+        Кэш общий для одинаковых по содержимому снимков, поэтому путь и время
+        берутся из запроса. None - маска наложения потеряна, нужен пересчёт.
+        """
+        analysis_id = cached.get("analysis_id")
+        if cached.get("overlay_url") and analysis_id \
+                and not self.overlay_renderer.ensure_source(analysis_id, image_path):
+            return None
+        cached.setdefault("image_info", {})["path"] = image_path
+        cached["cached_at"] = cached.get("timestamp")
+        cached["timestamp"] = datetime.now().isoformat()
+        cached["cached"] = True
+        return cached
+    
+    def _analyze_uncached(self, image_path: str, reference_path: Optional[str], analysis_id: str) -> Dict:
+        with stage("analyze"):
+            results = self._run_analysis(image_path, reference_path, analysis_id)
+        count_items("analyze", 1)
+        return results
+    
+    def _result_cache_key(self, image_path: str, reference_path: Optional[str]) -> Optional[str]:
+        """Ключ кэша: содержимое снимков + параметры детектора и версия классификатора"""
+        try:
+            image_hash = self.image_loader.content_hash(image_path)
+            reference_hash = self.image_loader.content_hash(reference_path) if reference_path else None
+        except OSError:
+            return None
+        
+        params = {
+            "threshold": self.change_detector.threshold,
+            "min_area": self.change_detector.min_area,
+            "method": self.change_method,
+            "registration": settings.REGISTRATION_ENABLED,
+            "classifier": self.classifier.version
+        }
+        return ResultCache.make_key(image_hash, reference_hash, params)
+    
+    def _run_analysis(self, image_path: str, reference_path: Optional[str],
+                      analysis_id: str) -> Dict:
+        """Полный прогон пайплайна анализа без кэша"""
+        # Загружаем основное изображение вместе с метаданными
+        with stage("load"):
+            image, metadata = self.image_loader.load_image_with_metadata(image_path)
         if image is None:
             return {"error": "Failed to load image"}
         
-        # Получаем метаданные
-        metadata = self.image_loader.get_image_metadata(image_path)
-        
         # Создаем геомаппер
-        geo_mapper = GeoMapper.create_from_metadata(metadata)
+        with stage("metadata"):
+            geo_mapper = GeoMapper.create_from_metadata(metadata)
         
         results = {
             "image_info": {
@@ -45,64 +151,38 @@ class ImageAnalyzer:
                 "size": image.shape[:2],
                 "metadata": metadata
             },
+            "analysis_id": analysis_id,
             "timestamp": datetime.now().isoformat(),
             "anomalies": []
         }
         
         if reference_path:
             # Сравнение с референсным изображением
-            reference_image = self.image_loader.load_image(reference_path)
+            with stage("load"):
+                reference_image = self.image_loader.load_image(reference_path)
             if reference_image is not None:
                 # Обнаружение изменений
-                change_mask = self.change_detector.detect_changes(
-                    reference_image, image, method='simple'
-                )
+                with stage("diff"):
+                    diff = self._pair_difference(image_path, reference_path, image, reference_image)
+                with stage("morphology"):
+                    change_mask = self.change_detector.threshold_difference(diff)
                 
                 # Нахождение регионов изменений
-                regions = self.change_detector.find_anomaly_regions(change_mask)
+                with stage("regions"):
+                    regions = self.change_detector.find_anomaly_regions(change_mask)
+                count_items("regions", len(regions))
                 
                 # Классификация каждого региона
-                for region in regions:
-                    anomaly_type, confidence = self.classifier.classify(image, region)
-                    
-                    # Пропускаем нормальные регионы с низкой уверенностью
-                    if anomaly_type == "normal" and confidence < 0.5:
-                        continue
-                    
-                    # Преобразуем координаты в географические
-                    center_x, center_y = region['center']
-                    latitude, longitude = geo_mapper.pixel_to_geo(center_x, center_y)
-                    
-                    anomaly = {
-                        "type": anomaly_type,
-                        "confidence": float(confidence),
-                        "location": {
-                            "latitude": latitude,
-                            "longitude": longitude,
-                            "pixel_center": region['center'],
-                            "bbox": region['bbox']
-                        },
-                        "area": float(region['area']),
-                        "bbox_geo": geo_mapper.bbox_to_geo(region['bbox']),
-                        "description": self._generate_description(anomaly_type, confidence)
-                    }
-                    
-                    results["anomalies"].append(anomaly)
-                
-                # Визуализация результатов
-                visualization = self.change_detector.visualize_changes(
-                    image, change_mask, regions
-                )
+                results["anomalies"].extend(self._classify_regions(image, regions, geo_mapper))
                 
-                # Сохраняем визуализацию
-                vis_filename = f"visualization_{os.path.basename(image_path)}"
-                vis_path = self.image_loader.save_processed_image(visualization, vis_filename)
-                results["visualization_path"] = vis_path
+                # Маска сохраняется в RLE, визуализация строится по запросу
+                with stage("mask_save"):
+                    mask_stats = self.overlay_renderer.save_analysis(analysis_id, image_path, change_mask, regions)
+                results["overlay_url"] = f"/api/analysis/overlays/{analysis_id}"
                 
                 results["change_statistics"] = {
                     "total_changes": len(regions),
-                    "change_area": float(np.sum(change_mask > 0)),
-                    "change_percentage": float(np.sum(change_mask > 0) / change_mask.size * 100)
+                    **mask_stats
                 }
         
         else:
@@ -111,7 +191,9 @@ class ImageAnalyzer:
             # Например, поиск областей с необычным цветом или текстурой
             
             # Простой детектор по цвету
-            color_anomalies = self._detect_color_anomalies(image)
+            with stage("color_anomalies"):
+                color_anomalies = self._detect_color_anomalies(image)
+            count_items("color_anomalies", len(color_anomalies))
             
             for anomaly in color_anomalies:
                 anomaly_type, confidence, bbox = anomaly
@@ -136,6 +218,253 @@ class ImageAnalyzer:
         
         return results
     
+    def _classify_regions(self, image: np.ndarray, regions: List[Dict],
+                          geo_mapper: GeoMapper) -> List[Dict]:
+        """Классификация регионов изменений и геопривязка"""
+        anomalies = []
+        # Время классификации и геопривязки копится по регионам и пишется одним замером
+        classify_time = geo_time = 0.0
+        for region in regions:
+            started = time.perf_counter()
+            indices = self.classifier.region_indices(image, region)
+            anomaly_type, confidence = self.classifier.classify(image, region, indices)
+            classify_time += time.perf_counter() - started
+            
+            # Пропускаем нормальные регионы с низкой уверенностью
+            if anomaly_type == "normal" and confidence < 0.5:
+                continue
+            
+            # Преобразуем координаты в географические
+            started = time.perf_counter()
+            center_x, center_y = region['center']
+            latitude, longitude = geo_mapper.pixel_to_geo(center_x, center_y)
+            bbox_geo = geo_mapper.bbox_to_geo(region['bbox'])
+            geo_time += time.perf_counter() - started
+            
+            anomaly = {
+                "type": anomaly_type,
+                "confidence": float(confidence),
+                "location": {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "pixel_center": region['center'],
+                    "bbox": region['bbox']
+                },
+                "area": float(region['area']),
+                "bbox_geo": bbox_geo,
+                "indices": indices,
+                "description": self._generate_description(anomaly_type, confidence)
+            }
+            
+            anomalies.append(anomaly)
+        
+        observe_stage("classify", classify_time, len(regions))
+        observe_stage("geo_mapping", geo_time, len(anomalies))
+        return anomalies
+    
+    def _pair_difference(self, image_path: str, reference_path: str,
+                         image: Optional[np.ndarray] = None,
+                         reference_image: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Разностное изображение пары (из кэша, если пара уже считалась)"""
+        try:
+            key = (self.image_loader.content_hash(image_path),
+                   self.image_loader.content_hash(reference_path),
+                   self.change_method,
+                   settings.REGISTRATION_ENABLED)
+        except OSError:
+            key = None
+        
+        if key is not None:
+            diff = self.diff_cache.get(key)
+            if diff is not None:
+                return diff
+        
+        if image is None:
+            image = self.image_loader.load_image(image_path)
+        if reference_image is None:
+            reference_image = self.image_loader.load_image(reference_path)
+        if image is None or reference_image is None:
+            return None
+        
+        # Референсный снимок совмещается с сеткой анализируемого
+        transform = None
+        if settings.REGISTRATION_ENABLED:
+            pair_key = f"{key[1]}_{key[0]}" if key is not None else None
+            transform = self.registrar.get_transform(image, reference_image, key=pair_key)
+            if transform["size"] == [reference_image.shape[1], reference_image.shape[0]] \
+                    and self.registrar.is_identity(transform):
+                transform = None
+        
+        diff = self.change_detector.compute_difference(reference_image, image, transform,
+                                                       method=self.change_method)
+        diff.flags.writeable = False
+        if key is not None:
+            self.diff_cache.put(key, diff)
+        return diff
+    
+    def sweep_parameters(self, image_path: str, reference_path: str,
+                         thresholds: List[int], min_areas: List[float]) -> Dict:
+        """
+        Оценка набора комбинаций (threshold, min_area) по одному разностному изображению
+        
+        Разность считается один раз на пару, порог и морфология - один раз
+        на значение threshold, контуры переиспользуются для всех min_area.
+        """
+        diff = self._pair_difference(image_path, reference_path)
+        if diff is None:
+            return {"error": "Failed to load image"}
+        
+        combinations = []
+        for threshold in sorted(set(thresholds)):
+            change_mask = self.change_detector.threshold_difference(diff, threshold)
+            change_area = int(cv2.countNonZero(change_mask))
+            areas = self.change_detector.contour_areas(change_mask)
+            
+            for min_area in sorted(set(min_areas)):
+                combinations.append({
+                    "threshold": threshold,
+                    "min_area": min_area,
+                    "region_count": sum(1 for area in areas if area > min_area),
+                    "change_area": float(change_area),
+                    "change_percentage": float(change_area / change_mask.size * 100)
+                })
+        
+        return {
+            "image_path": image_path,
+            "reference_path": reference_path,
+            "size": diff.shape[:2],
+            "combinations": combinations
+        }
+    
+    def analyze_stack(self, image_paths: List[str]) -> Iterator[Dict]:
+        """
+        Анализ временного ряда снимков одной территории
+        
+        Снимки обходятся по порядку скользящим окном из двух: каждый декодируется
+        ровно один раз и сравнивается с предыдущим. На каждый шаг отдаётся событие
+        с результатами, в конце - карта накопленных изменений (сколько раз менялся
+        каждый пиксель), сохранённая 16-битным PNG.
+        """
+        previous, previous_path = None, None
+        cumulative = None
+        steps = 0
+        
+        for index, image_path in enumerate(image_paths):
+            image, metadata = self.image_loader.load_image_with_metadata(image_path)
+            if image is None:
+                yield {"event": "error", "index": index, "image_path": image_path,
+                       "error": "Failed to load image"}
+                continue
+            
+            if previous is not None:
+                diff = self._pair_difference(image_path, previous_path, image, previous)
+                change_mask = self.change_detector.threshold_difference(diff)
+                regions = self.change_detector.find_anomaly_regions(change_mask)
+                geo_mapper = GeoMapper.create_from_metadata(metadata)
+                
+                if cumulative is None:
+                    cumulative = np.zeros(change_mask.shape, dtype=np.uint16)
+                if change_mask.shape != cumulative.shape:
+                    change_mask = cv2.resize(change_mask, cumulative.shape[::-1],
+                                             interpolation=cv2.INTER_NEAREST)
+                changed = change_mask > 0
+                cumulative += changed
+                change_area = int(np.count_nonzero(changed))
+                steps += 1
+                
+                yield {
+                    "event": "step",
+                    "index": index,
+                    "image_path": image_path,
+                    "reference_path": previous_path,
+                    "anomalies": self._classify_regions(image, regions, geo_mapper),
+                    "change_statistics": {
+                        "total_changes": len(regions),
+                        "change_area": float(change_area),
+                        "change_percentage": float(change_area / changed.size * 100)
+                    }
+                }
+            
+            previous, previous_path = image, image_path
+        
+        summary = {"event": "done", "steps": steps, "cumulative": None}
+        if cumulative is not None:
+            changed_pixels = int(np.count_nonzero(cumulative))
+            summary["cumulative"] = {
+                "path": self._save_cumulative_map(image_paths, cumulative),
+                "changed_pixels": changed_pixels,
+                "change_percentage": float(changed_pixels / cumulative.size * 100),
+                "max_changes": int(cumulative.max())
+            }
+        yield summary
+    
+    def analyze_against_baseline(self, image_path: str, aoi_id: str,
+                                 update: bool = True,
+                                 z_threshold: Optional[float] = None) -> Dict:
+        """
+        Анализ снимка относительно модели фона территории
+        
+        Снимок оценивается по z-score и (если update) добавляется в модель,
+        референсный снимок не нужен.
+        """
+        baseline = BaselineModel(aoi_id)
+        model_meta = baseline.metadata()
+        
+        # Снимок размера модели читается полосами из хранилища тайлов,
+        # другого размера - целиком (его нужно масштабировать)
+        image = self.image_loader.open_windowed(image_path)
+        if image is not None and (model_meta is None or list(image.shape[:2]) == model_meta["shape"][:2]):
+            metadata = self.image_loader.get_image_metadata(image_path)
+        else:
+            image, metadata = self.image_loader.load_image_with_metadata(image_path)
+            if image is None:
+                return {"error": "Failed to load image"}
+        
+        scores = baseline.score_and_update(image, update=update)
+        meta = baseline.metadata() or {}
+        
+        results = {
+            "image_info": {
+                "path": image_path,
+                "size": image.shape[:2],
+                "metadata": metadata
+            },
+            "timestamp": datetime.now().isoformat(),
+            "baseline": {"aoi_id": aoi_id, "scenes": meta.get("count", 0), "ready": scores is not None},
+            "anomalies": []
+        }
+        if scores is None:
+            return results
+        
+        change_mask = self.change_detector.threshold_zscore(
+            scores, z_threshold or settings.BASELINE_Z_THRESHOLD
+        )
+        regions = self.change_detector.find_anomaly_regions(change_mask)
+        
+        # Регионы в координатах модели: снимок и метаданные - под её размер
+        height, width = change_mask.shape
+        geo_mapper = GeoMapper.create_from_metadata({**metadata, "width": width, "height": height})
+        if image.shape[:2] != (height, width):
+            image = cv2.resize(image[:], (width, height), interpolation=cv2.INTER_AREA)
+        results["anomalies"] = self._classify_regions(image, regions, geo_mapper)
+        
+        change_area = int(cv2.countNonZero(change_mask))
+        results["change_statistics"] = {
+            "total_changes": len(regions),
+            "change_area": float(change_area),
+            "change_percentage": float(change_area / change_mask.size * 100),
+            "max_zscore": float(scores.max())
+        }
+        return results
+    
+    def _save_cumulative_map(self, image_paths: List[str], cumulative: np.ndarray) -> str:
+        stack_id = hashlib.sha1("\n".join(image_paths).encode("utf-8")).hexdigest()
+        directory = os.path.join(settings.PROCESSED_DIR, "stacks")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"cumulative_{stack_id}.png")
+        cv2.imwrite(path, cumulative)
+        return path
+    
     def _detect_color_anomalies(self, image: np.ndarray) -> List[Tuple]:
         """Обнаружение аномалий по цвету (без сравнения)"""
         anomalies = []
@@ -212,32 +541,30 @@ class ImageAnalyzer:
         confidence_percent = int(confidence * 100)
         return f"{base_desc} (уверенность: {confidence_percent}%)"
     
-    def batch_analyze(self, image_paths: List[str]) -> Dict:
-        """Пакетный анализ нескольких изображений"""
-        results = {
-            "total_images": len(image_paths),
-            "analyzed_images": 0,
-            "total_anomalies": 0,
-            "anomalies_by_type": {},
-            "results": []
-        }
+    def batch_analyze(self, image_paths: List[str],
+                      reference_path: Optional[str] = None,
+                      workers: Optional[int] = None,
+                      timeout: Optional[float] = None) -> Dict:
+        """
+        Пакетный анализ нескольких изображений
         
-        for image_path in image_paths:
-            try:
-                analysis_result = self.analyze_single_image(image_path)
-                results["results"].append(analysis_result)
-                results["analyzed_images"] += 1
-                
-                # Статистика по аномалиям
-                for anomaly in analysis_result.get("anomalies", []):
-                    results["total_anomalies"] += 1
-                    anomaly_type = anomaly["type"]
-                    if anomaly_type not in results["anomalies_by_type"]:
-                        results["anomalies_by_type"][anomaly_type] = 0
-                    results["anomalies_by_type"][anomaly_type] += 1
-                    
-            except Exception as e:
-                print(f"Error analyzing {image_path}: {e}")
+        Выполняется параллельно в пуле процессов; полные результаты не
+        накапливаются, по каждому снимку хранится только краткая сводка.
+        """
+        results = []
+        totals = {}
+        
+        for event in iter_batch_analyze(image_paths, reference_path, workers=workers, timeout=timeout):
+            totals = event["totals"]
+            if event["event"] != "result":
                 continue
+            result = event["result"] or {}
+            results.append({
+                "image_path": event["image_path"],
+                "status": event["status"],
+                "error": event["error"],
+                "analysis_id": result.get("analysis_id"),
+                "anomalies_found": len(result.get("anomalies", []))
+            })
         
-        return results               
\ No newline at end of file
+        return {**totals, "results": results}
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.databace import SessionLocal
+from app.models.anomaly import Anomaly, AnomalyDetection
+
+logger = logging.getLogger(__name__)
+
+FEED_COLUMNS = [
+    "id", "image_id", "anomaly_type", "confidence", "latitude",
+    "longitude", "area", "bbox", "description", "detected_at",
+    "first_seen", "last_seen", "detections"
+]
+
+
+class FeedFilter:
+    """Фильтр подписчика: типы, минимальная уверенность, окно карты"""
+
+    def __init__(self, anomaly_types: Optional[Sequence[str]] = None,
+                 min_confidence: float = 0.0,
+                 bbox: Optional[Sequence[float]] = None):
+        self.anomaly_types = set(anomaly_types) if anomaly_types else None
+        self.min_confidence = min_confidence
+        # Окно карты: (lat_min, lon_min, lat_max, lon_max)
+        self.bbox = tuple(bbox) if bbox else None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FeedFilter":
+        types = data.get("types") or data.get("anomaly_type")
+        if isinstance(types, str):
+            types = [t for t in types.split(",") if t]
+        bbox = data.get("bbox")
+        if isinstance(bbox, str):
+            bbox = [float(v) for v in bbox.split(",")]
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox must be lat_min,lon_min,lat_max,lon_max")
+        return cls(types, float(data.get("min_confidence", 0.0)), bbox)
+
+    def matches(self, anomaly: Dict) -> bool:
+        if self.anomaly_types and anomaly["anomaly_type"] not in self.anomaly_types:
+            return False
+        if anomaly["confidence"] < self.min_confidence:
+            return False
+        if self.bbox:
+            lat_min, lon_min, lat_max, lon_max = self.bbox
+            if not (lat_min <= anomaly["latitude"] <= lat_max and lon_min <= anomaly["longitude"] <= lon_max):
+                return False
+        return True
+
+
+class Subscription:
+    """Очередь новых аномалий одного клиента"""
+
+    def __init__(self, feed_filter: FeedFilter, max_queue: int):
+        self.filter = feed_filter
+        self.queue: "asyncio.Queue[Dict]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, anomaly: Dict) -> None:
+        if not self.filter.matches(anomaly):
+            return
+        # Медленный клиент не тормозит остальных: теряет самые старые события
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(anomaly)
+
+
+class AnomalyBroadcaster:
+    """
+    Раздача новых аномалий подключённым клиентам
+
+    Аномалии пишут процессы-воркеры очереди задач, поэтому источником служит БД:
+    одна фоновая задача на процесс API опрашивает обнаружения (anomaly_detections)
+    с id больше последнего увиденного и раскладывает их треки по очередям
+    подписчиков с учётом их фильтров. Повторное обнаружение не создаёт строку
+    anomalies, а обновляет трек, поэтому клиент получает трек в текущем
+    состоянии (update=true, если обнаружений больше одного). Опрос идёт,
+    только пока есть хотя бы один подписчик.
+    """
+
+    def __init__(self, poll_interval: Optional[float] = None,
+                 max_queue: Optional[int] = None, batch_size: int = 500):
+        self.poll_interval = poll_interval if poll_interval is not None else settings.FEED_POLL_INTERVAL
+        self.max_queue = max_queue if max_queue is not None else settings.FEED_MAX_QUEUE
+        self.batch_size = batch_size
+        self.last_id: Optional[int] = None
+        self._subscribers: List[Subscription] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, feed_filter: FeedFilter) -> Subscription:
+        subscription = Subscription(feed_filter, self.max_queue)
+        self._subscribers.append(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll_loop())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, anomalies: List[Dict]) -> None:
+        for anomaly in anomalies:
+            for subscription in list(self._subscribers):
+                subscription.offer(anomaly)
+
+    async def _poll_loop(self) -> None:
+        if self.last_id is None:
+            # Клиентам уходят только новые аномалии, история - через /api/anomalies
+            self.last_id = await asyncio.to_thread(self._max_id)
+
+        while self._subscribers:
+            try:
+                rows, cursor, fetched = await asyncio.to_thread(self._fetch_new, self.last_id)
+            except Exception as e:
+                logger.warning("Anomaly feed poll failed: %s", e)
+                rows, cursor, fetched = [], self.last_id, 0
+            self.last_id = cursor
+            if rows:
+                self.publish(rows)
+            # Полная партия - вероятно, есть ещё, опрашиваем без паузы
+            if fetched < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+        self._task = None
+
+    def _max_id(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(AnomalyDetection.id).order_by(AnomalyDetection.id.desc()).limit(1).scalar() or 0
+        finally:
+            db.close()
+
+    def _fetch_new(self, last_id: int) -> Tuple[List[Dict], int, int]:
+        """Треки новых обнаружений: (треки, новый курсор, число прочитанных обнаружений)"""
+        db = SessionLocal()
+        try:
+            detections = (db.query(AnomalyDetection.id, AnomalyDetection.anomaly_id)
+                          .filter(AnomalyDetection.id > last_id)
+                          .order_by(AnomalyDetection.id)
+                          .limit(self.batch_size)
+                          .all())
+            if not detections:
+                return [], last_id, 0
+            # Трек с несколькими обнаружениями в партии отправляется один раз
+            latest = {anomaly_id: detection_id for detection_id, anomaly_id in detections}
+            columns = [getattr(Anomaly, name) for name in FEED_COLUMNS]
+            rows = db.query(*columns).filter(Anomaly.id.in_(latest)).all()
+        finally:
+            db.close()
+
+        anomalies = []
+        for row in rows:
+            anomaly = dict(zip(FEED_COLUMNS, row))
+            for name in ("detected_at", "first_seen", "last_seen"):
+                if anomaly[name] is not None:
+                    anomaly[name] = anomaly[name].isoformat()
+            anomaly["detection_id"] = latest[anomaly["id"]]
+            anomaly["update"] = (anomaly["detections"] or 1) > 1
+            anomalies.append(anomaly)
+        anomalies.sort(key=lambda anomaly: anomaly["detection_id"])
+        return anomalies, detections[-1][0], len(detections)
+
+
+# Один раздатчик на процесс API
+broadcaster = AnomalyBroadcaster()
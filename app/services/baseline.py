@@ -0,0 +1,109 @@
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.utils.locks import file_lock
+
+
+class BaselineModel:
+    """
+    Попиксельная модель фона территории (AOI)
+
+    Для каждого пикселя и канала хранятся среднее и сумма квадратов отклонений
+    (алгоритм Уэлфорда) в float32-файлах, открытых через np.memmap. Новый снимок
+    оценивается z-score относительно модели и сразу же добавляется в неё - за
+    один проход по строкам, поэтому память не зависит от длины истории.
+    """
+
+    def __init__(self, aoi_id: str, root: Optional[str] = None, chunk_rows: int = 256):
+        if not re.fullmatch(r"[\w\-]{1,100}", aoi_id):
+            raise ValueError(f"Invalid AOI id: {aoi_id}")
+        self.aoi_id = aoi_id
+        self.directory = os.path.join(root or os.path.join(settings.PROCESSED_DIR, "baselines"), aoi_id)
+        self.chunk_rows = chunk_rows
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def metadata(self) -> Optional[Dict]:
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_metadata(self, meta: Dict) -> None:
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _open(self, shape: tuple, mode: str):
+        mean = np.memmap(os.path.join(self.directory, "mean.f32"), dtype=np.float32, mode=mode, shape=shape)
+        m2 = np.memmap(os.path.join(self.directory, "m2.f32"), dtype=np.float32, mode=mode, shape=shape)
+        return mean, m2
+
+    def score_and_update(self, image: np.ndarray, update: bool = True) -> Optional[np.ndarray]:
+        """
+        Z-score снимка относительно модели (максимум по каналам) и обновление модели
+
+        Возвращает None, пока в модели меньше двух снимков (дисперсия не определена).
+        Снимок другого размера приводится к размеру модели. image может быть
+        WindowedImage: тогда полосы строк читаются из хранилища тайлов.
+        """
+        with file_lock(os.path.join(self.directory, ".lock")):
+            meta = self.metadata()
+            if meta is None:
+                if not update:
+                    return None
+                os.makedirs(self.directory, exist_ok=True)
+                shape = image.shape if image.ndim == 3 else image.shape + (1,)
+                meta = {"aoi_id": self.aoi_id, "shape": list(shape), "count": 0}
+                mean, m2 = self._open(tuple(shape), "w+")
+            else:
+                mean, m2 = self._open(tuple(meta["shape"]), "r+" if update else "r")
+
+            height, width, bands = meta["shape"]
+            if image.shape[:2] != (height, width):
+                image = cv2.resize(image[:], (width, height), interpolation=cv2.INTER_AREA)
+
+            count = meta["count"]
+            scores = np.empty((height, width), dtype=np.float32) if count >= 2 else None
+            new_count = count + 1
+
+            for y in range(0, height, self.chunk_rows):
+                rows = slice(y, min(y + self.chunk_rows, height))
+                x = image[rows].astype(np.float32).reshape(-1, width, bands)
+                mean_chunk = mean[rows]
+                m2_chunk = m2[rows]
+
+                if scores is not None:
+                    std = np.sqrt(m2_chunk / (count - 1))
+                    np.maximum(std, settings.BASELINE_MIN_STD, out=std)
+                    z = np.abs(x - mean_chunk)
+                    z /= std
+                    scores[rows] = z.max(axis=2)
+
+                if update:
+                    # Уэлфорд: delta до и после обновления среднего
+                    delta = x - mean_chunk
+                    mean_chunk += delta / new_count
+                    delta *= x - mean_chunk
+                    m2_chunk += delta
+
+            if update:
+                mean.flush()
+                m2.flush()
+                meta["count"] = new_count
+                meta["updated_at"] = datetime.now().isoformat()
+                self._write_metadata(meta)
+
+            del mean, m2
+            return scores
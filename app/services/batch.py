@@ -0,0 +1,215 @@
+import itertools
+import logging
+import multiprocessing
+import queue as queue_module
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Анализатор рабочего процесса пула (создаётся один раз на процесс)
+_worker_analyzer = None
+# Очередь отметок "задача начала выполняться" (передаётся пулом при старте процесса)
+_started_queue = None
+
+
+def _init_worker(started_queue=None) -> None:
+    global _worker_analyzer, _started_queue
+    from .analizer import ImageAnalyzer
+    _worker_analyzer = ImageAnalyzer()
+    _started_queue = started_queue
+
+
+def _analyze_in_worker(image_path: str, reference_path: Optional[str], task_id: Optional[int] = None) -> Dict:
+    if _worker_analyzer is None:
+        _init_worker()
+    if _started_queue is not None and task_id is not None:
+        _started_queue.put(task_id)
+    return _worker_analyzer.analyze_single_image(image_path, reference_path)
+
+
+class BatchTotals:
+    """Нарастающие итоги пакетного анализа"""
+
+    def __init__(self, total_images: int):
+        self.total_images = total_images
+        self.analyzed_images = 0
+        self.failed_images = 0
+        self.timed_out_images = 0
+        self.total_anomalies = 0
+        self.anomalies_by_type: Dict[str, int] = {}
+
+    def add(self, result: Dict) -> None:
+        self.analyzed_images += 1
+        for anomaly in result.get("anomalies", []):
+            self.total_anomalies += 1
+            anomaly_type = anomaly["type"]
+            self.anomalies_by_type[anomaly_type] = self.anomalies_by_type.get(anomaly_type, 0) + 1
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_images": self.total_images,
+            "analyzed_images": self.analyzed_images,
+            "failed_images": self.failed_images,
+            "timed_out_images": self.timed_out_images,
+            "total_anomalies": self.total_anomalies,
+            "anomalies_by_type": dict(self.anomalies_by_type)
+        }
+
+
+def iter_batch_analyze(image_paths: List[str],
+                       reference_path: Optional[str] = None,
+                       workers: Optional[int] = None,
+                       timeout: Optional[float] = None,
+                       max_in_flight: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Параллельный анализ снимков в пуле процессов с потоковой выдачей
+
+    Одновременно в работе не более max_in_flight снимков, поэтому память
+    ограничена окном, а не размером пакета. На каждый завершённый снимок
+    отдаётся событие с результатом и нарастающими итогами; последнее событие
+    - "done" с итогами по всему пакету. workers=0 - анализ в текущем процессе.
+    Таймаут отсчитывается с момента, когда рабочий процесс взял снимок; при
+    таймауте пул пересоздаётся (зависший процесс завершается), а остальные
+    снимки окна ставятся в новый пул.
+    """
+    workers = settings.BATCH_WORKERS if workers is None else workers
+    timeout = settings.BATCH_TIMEOUT if timeout is None else timeout
+    max_in_flight = max_in_flight or settings.BATCH_MAX_IN_FLIGHT or max(1, workers) * 2
+
+    totals = BatchTotals(len(image_paths))
+
+    def event(image_path: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None) -> Dict:
+        if status == "ok":
+            totals.add(result)
+        elif status == "timeout":
+            totals.timed_out_images += 1
+        else:
+            totals.failed_images += 1
+            logger.warning("Error analyzing %s: %s", image_path, error)
+        return {
+            "event": "result",
+            "image_path": image_path,
+            "status": status,
+            "result": result,
+            "error": error,
+            "totals": totals.as_dict()
+        }
+
+    if workers <= 0:
+        for image_path in image_paths:
+            try:
+                result = _analyze_in_worker(image_path, reference_path)
+            except Exception as e:
+                yield event(image_path, "error", error=str(e))
+                continue
+            if "error" in result:
+                yield event(image_path, "error", error=result["error"])
+            else:
+                yield event(image_path, "ok", result)
+        yield {"event": "done", "totals": totals.as_dict()}
+        return
+
+    context = multiprocessing.get_context("spawn")
+    started_queue = context.Queue()
+
+    def new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(started_queue,)
+        )
+
+    def stop_executor(executor: ProcessPoolExecutor, force: bool) -> None:
+        if force:
+            # Зависший процесс не прервать иначе: останавливаем весь пул
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=not force, cancel_futures=True)
+
+    executor = new_executor()
+    task_ids = itertools.count()
+    # future -> [id задачи, путь, момент начала выполнения]; начало отмечает сам
+    # рабочий процесс, поэтому время в очереди пула в таймаут не входит
+    pending: Dict[Future, list] = {}
+    queue = iter(image_paths)
+    exhausted = False
+
+    def submit(image_path: str) -> None:
+        task_id = next(task_ids)
+        future = executor.submit(_analyze_in_worker, image_path, reference_path, task_id)
+        pending[future] = [task_id, image_path, None]
+
+    def mark_started() -> None:
+        by_id = {entry[0]: entry for entry in pending.values()}
+        while True:
+            try:
+                task_id = started_queue.get_nowait()
+            except queue_module.Empty:
+                return
+            entry = by_id.get(task_id)
+            if entry is not None and entry[2] is None:
+                entry[2] = time.monotonic()
+
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                image_path = next(queue, None)
+                if image_path is None:
+                    exhausted = True
+                    break
+                submit(image_path)
+
+            if not pending:
+                break
+
+            wait_for = None
+            if timeout:
+                mark_started()
+                now = time.monotonic()
+                started = [entry[2] for entry in pending.values() if entry[2] is not None]
+                # Пока ни одна задача не стартовала - короткий опрос отметок
+                wait_for = max(0.0, min(started) + timeout - now) if started else 0.5
+                wait_for = min(wait_for, 0.5)
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                _, image_path, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield event(image_path, "error", error=str(e))
+                    continue
+                if "error" in result:
+                    yield event(image_path, "error", error=result["error"])
+                else:
+                    yield event(image_path, "ok", result)
+
+            if timeout:
+                mark_started()
+                now = time.monotonic()
+                expired = [future for future, entry in pending.items()
+                           if entry[2] is not None and now - entry[2] >= timeout and not future.done()]
+                if expired:
+                    for future in expired:
+                        _, image_path, _ = pending.pop(future)
+                        yield event(image_path, "timeout", error=f"Timed out after {timeout:.0f}s")
+                    # Процессы с зависшими снимками освобождаются пересозданием пула;
+                    # остальные снимки окна ставятся в новый пул заново
+                    restart = [entry[1] for future, entry in pending.items() if not future.done()]
+                    finished = {future: entry for future, entry in pending.items() if future.done()}
+                    stop_executor(executor, force=True)
+                    executor = new_executor()
+                    pending.clear()
+                    pending.update(finished)
+                    for image_path in restart:
+                        submit(image_path)
+    finally:
+        stop_executor(executor, force=bool(pending))
+        started_queue.close()
+
+    yield {"event": "done", "totals": totals.as_dict()}
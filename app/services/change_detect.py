@@ -1,25 +1,79 @@
 import cv2
 import numpy as np
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional
+
+from app.utils.image_utils import IndexEngine
+
+from .registration import ImageRegistrar
+
+# simple - разность яркости, index - изменение спектрального индекса
+CHANGE_METHODS = ('simple', 'index')
 
 class ChangeDetector:
-    def __init__(self, threshold: int = 30, min_area: int = 100):
+    def __init__(self, threshold: int = 30, min_area: int = 100,
+                 index: str = 'ngrdi', band_map: str = 'rgb'):
         self.threshold = threshold
         self.min_area = min_area
+        self.index = index
+        self.index_engine = IndexEngine(band_map)
     
-    def detect_changes(self, image1: np.ndarray, image2: np.ndarray) -> np.ndarray:
+    def detect_changes(self, image1: np.ndarray, image2: np.ndarray,
+                       method: str = 'simple') -> np.ndarray:
         """Обнаружение изменений между изображениями"""
-        if image1.shape != image2.shape:
+        return self.threshold_difference(self.compute_difference(image1, image2, method=method))
+    
+    def compute_difference(self, image1: np.ndarray, image2: np.ndarray,
+                           transform: Optional[Dict] = None,
+                           method: str = 'simple') -> np.ndarray:
+        """
+        Сырое разностное изображение (не зависит от порогов)
+        
+        transform - аффинное совмещение image1 с сеткой image2 (см. ImageRegistrar);
+        без него снимки разного размера просто приводятся к меньшему.
+        """
+        if method not in CHANGE_METHODS:
+            raise ValueError(f"Unknown change detection method: {method}")
+        
+        if transform is not None:
+            image1 = ImageRegistrar.warp(image1, transform)
+        elif image1.shape != image2.shape:
             height = min(image1.shape[0], image2.shape[0])
             width = min(image1.shape[1], image2.shape[1])
             image1 = cv2.resize(image1, (width, height))
             image2 = cv2.resize(image2, (width, height))
         
+        if method == 'index':
+            return self.index_difference(image1, image2)
+        
         gray1 = cv2.cvtColor(image1, cv2.COLOR_RGB2GRAY)
         gray2 = cv2.cvtColor(image2, cv2.COLOR_RGB2GRAY)
         
-        diff = cv2.absdiff(gray1, gray2)
-        _, thresh = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        return cv2.absdiff(gray1, gray2)
+    
+    def index_difference(self, image1: np.ndarray, image2: np.ndarray) -> np.ndarray:
+        """
+        Модуль изменения индекса self.index в uint8 (разница 0..2 -> 0..255)
+        
+        Оба снимка обходятся полосами строк IndexEngine, полноразмерных карт
+        индекса в float32 нет - только итоговый uint8.
+        """
+        height, width = image1.shape[:2]
+        diff = np.empty((height, width), dtype=np.uint8)
+        tiles2 = self.index_engine.iter_tiles(image2, [self.index])
+        for rows, tile1 in self.index_engine.iter_tiles(image1, [self.index]):
+            _, tile2 = next(tiles2)
+            delta = tile1[self.index]
+            np.subtract(delta, tile2[self.index], out=delta)
+            np.abs(delta, out=delta)
+            delta *= np.float32(127.5)
+            diff[rows] = delta
+        return diff
+    
+    def threshold_difference(self, diff: np.ndarray, threshold: Optional[int] = None) -> np.ndarray:
+        """Маска изменений из разностного изображения: порог + морфология"""
+        if threshold is None:
+            threshold = self.threshold
+        _, thresh = cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY)
         
         kernel = np.ones((3, 3), np.uint8)
         thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
@@ -27,8 +81,31 @@ class ChangeDetector:
         
         return thresh
     
-    def find_anomaly_regions(self, change_mask: np.ndarray) -> List[Dict]:
+    def threshold_zscore(self, scores: np.ndarray, z_threshold: float = 3.0) -> np.ndarray:
+        """Маска изменений по z-score относительно модели фона"""
+        thresh = np.where(scores > z_threshold, 255, 0).astype(np.uint8)
+        
+        kernel = np.ones((3, 3), np.uint8)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+        
+        return thresh
+    
+    def contour_areas(self, change_mask: np.ndarray) -> List[float]:
+        """Площади внешних контуров маски (без фильтра по min_area)"""
+        contours, _ = cv2.findContours(
+            change_mask, 
+            cv2.RETR_EXTERNAL, 
+            cv2.CHAIN_APPROX_SIMPLE
+        )
+        return [cv2.contourArea(contour) for contour in contours]
+    
+    def find_anomaly_regions(self, change_mask: np.ndarray,
+                             min_area: Optional[float] = None) -> List[Dict]:
         """Поиск регионов с аномалиями"""
+        if min_area is None:
+            min_area = self.min_area
+        
         contours, _ = cv2.findContours(
             change_mask, 
             cv2.RETR_EXTERNAL, 
@@ -38,7 +115,7 @@ class ChangeDetector:
         regions = []
         for contour in contours:
             area = cv2.contourArea(contour)
-            if area > self.min_area:
+            if area > min_area:
                 x, y, w, h = cv2.boundingRect(contour)
                 regions.append({
                     'bbox': (x, y, x + w, y + h),
@@ -46,4 +123,28 @@ class ChangeDetector:
                     'center': (x + w // 2, y + h // 2)
                 })
         
-        return regions
\ No newline at end of file
+        return regions
+    
+    def visualize_changes(self, image: np.ndarray, change_mask: np.ndarray,
+                          regions: List[Dict], scale: float = 1.0) -> np.ndarray:
+        """
+        Наложение маски изменений и рамок регионов на снимок (RGB)
+        
+        scale - во сколько раз image и change_mask меньше исходного снимка,
+        к которому относятся координаты регионов.
+        """
+        overlay = image.copy()
+        if change_mask.shape[:2] != overlay.shape[:2]:
+            change_mask = cv2.resize(change_mask, (overlay.shape[1], overlay.shape[0]),
+                                     interpolation=cv2.INTER_NEAREST)
+        
+        # Полупрозрачная красная заливка изменившихся пикселей
+        changed = change_mask > 0
+        overlay[changed] = (overlay[changed] * 0.5 + np.array([255, 0, 0]) * 0.5).astype(np.uint8)
+        
+        thickness = max(1, int(round(2 * scale)))
+        for region in regions:
+            x1, y1, x2, y2 = (int(round(v * scale)) for v in region['bbox'])
+            cv2.rectangle(overlay, (x1, y1), (x2, y2), (255, 255, 0), thickness)
+        
+        return overlay
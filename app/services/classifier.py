@@ -1,13 +1,45 @@
 import numpy as np
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional, Union
 import random
 
+from app.utils.image_utils import IndexEngine
+
 class AnomalyClassifier:
-    def __init__(self):
+    # Версия модели: входит в ключ кэша результатов анализа
+    version = "demo-2"
+    
+    def __init__(self, band_map: Union[str, Dict[str, int]] = 'rgb'):
         self.classes = ['fire', 'deforestation', 'dump', 'construction', 'flood', 'normal']
+        self.index_engine = IndexEngine(band_map)
+    
+    def region_indices(self, image: np.ndarray, region: Dict) -> Dict[str, float]:
+        """Средние спектральных индексов в bbox региона (полосами, без полноразмерных карт)"""
+        x1, y1, x2, y2 = region['bbox']
+        crop = image[y1:y2, x1:x2]
+        indices = self.index_engine.available_indices()
+        bands = max(self.index_engine.band_map.values()) + 1
+        if crop.ndim < 3 or crop.shape[2] < bands or crop.shape[0] == 0 or crop.shape[1] == 0:
+            return {}
+        
+        sums = dict.fromkeys(indices, 0.0)
+        for _, tile in self.index_engine.iter_tiles(crop, indices):
+            for name, values in tile.items():
+                sums[name] += float(values.sum(dtype=np.float64))
+        pixels = crop.shape[0] * crop.shape[1]
+        return {name: round(total / pixels, 4) for name, total in sums.items()}
     
-    def classify(self, image: np.ndarray, region: Dict) -> Tuple[str, float]:
+    def classify(self, image: np.ndarray, region: Dict,
+                 indices: Optional[Dict[str, float]] = None) -> Tuple[str, float]:
         """Классификация региона изображения"""
+        if indices is None:
+            indices = self.region_indices(image, region)
+        
+        # Однозначные спектральные признаки (есть только в многоканальных снимках)
+        if indices.get('nbr', 0.0) < -0.1:
+            return 'fire', round(min(0.95, 0.6 - indices['nbr'] / 2), 2)
+        if indices.get('ndwi', 0.0) > 0.3:
+            return 'flood', round(min(0.95, 0.4 + indices['ndwi'] / 2), 2)
+        
         # Простая демо классификация
         anomaly_types = ['fire', 'deforestation', 'dump', 'construction', 'flood']
         
@@ -18,4 +50,4 @@ class AnomalyClassifier:
             anomaly_type = 'normal'
             confidence = round(random.uniform(0.3, 0.6), 2)
         
-        return anomaly_type, confidence
\ No newline at end of file
+        return anomaly_type, confidence
@@ -22,4 +22,26 @@ class GeoMapper:
         x = x_norm * self.image_width
         y = y_norm * self.image_height
         
-        return x, y
\ No newline at end of file
+        return x, y
+    
+    def bbox_to_geo(self, bbox: tuple) -> dict:
+        """Преобразование пиксельного bbox (x1, y1, x2, y2) в географический"""
+        x1, y1, x2, y2 = bbox
+        lat_min, lon_min = self.pixel_to_geo(x1, y2)
+        lat_max, lon_max = self.pixel_to_geo(x2, y1)
+        
+        return {
+            "lat_min": lat_min,
+            "lon_min": lon_min,
+            "lat_max": lat_max,
+            "lon_max": lon_max
+        }
+    
+    @classmethod
+    def create_from_metadata(cls, metadata: dict) -> "GeoMapper":
+        """Создание маппера по метаданным снимка"""
+        image_size = (metadata.get('width', 1920), metadata.get('height', 1080))
+        geo_bounds = metadata.get('geo_bounds')
+        if geo_bounds:
+            return cls(image_size, tuple(geo_bounds))
+        return cls(image_size)
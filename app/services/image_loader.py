@@ -1,36 +1,226 @@
 import cv2
 import numpy as np
 from PIL import Image
+import hashlib
+import io
 import os
-from typing import Optional, Dict
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+from app.core.config import settings
+from app.utils.cache import ArrayCache
+from .raster_store import raster_store
+
+# Кэш декодированных снимков: ключ (путь, mtime, размер) -> (массив, метаданные)
+image_cache = ArrayCache(max_bytes=settings.IMAGE_CACHE_BYTES)
+
+# Хэши содержимого файлов (LRU): ключ (путь, mtime, размер) -> sha256
+CONTENT_HASH_ENTRIES = 4096
+_content_hashes: "OrderedDict[Tuple, str]" = OrderedDict()
+_content_hashes_lock = threading.Lock()
+
+
+class WindowedImage:
+    """
+    Снимок из хранилища тайлов, читаемый окнами через ImageLoader.load_window
+
+    Поддерживает shape, ndim и срезы image[rows] / image[rows, cols], поэтому
+    подходит потребителям, которые и так обходят снимок полосами или
+    вырезают регионы: полный массив в памяти не собирается.
+    """
+
+    def __init__(self, filepath: str, shape: Tuple[int, ...]):
+        self.filepath = filepath
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, item) -> np.ndarray:
+        rows, cols = item if isinstance(item, tuple) else (item, slice(None))
+        y1, y2, _ = rows.indices(self.shape[0])
+        x1, x2, _ = cols.indices(self.shape[1])
+        window = ImageLoader.load_window(self.filepath, (x1, y1, x2, y2))
+        if window is None:
+            raise OSError(f"Failed to read window of {self.filepath}")
+        return window
+
 
 class ImageLoader:
     @staticmethod
-    def load_image(filepath: str) -> Optional[np.ndarray]:
-        """Загрузка изображения"""
-        if not os.path.exists(filepath):
+    def file_key(filepath: str) -> Tuple[str, int, int]:
+        """Ключ файла для кэшей: меняется при любой перезаписи файла"""
+        stat = os.stat(filepath)
+        return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def content_hash(filepath: str) -> str:
+        """SHA-256 содержимого файла (пересчитывается только при изменении файла)"""
+        key = ImageLoader.file_key(filepath)
+        with _content_hashes_lock:
+            digest = _content_hashes.get(key)
+            if digest is not None:
+                _content_hashes.move_to_end(key)
+                return digest
+
+        hasher = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        with _content_hashes_lock:
+            _content_hashes[key] = digest
+            while len(_content_hashes) > CONTENT_HASH_ENTRIES:
+                _content_hashes.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def load_image_with_metadata(filepath: str) -> Tuple[Optional[np.ndarray], Dict]:
+        """
+        Загрузка изображения вместе с метаданными
+
+        Файл читается с диска один раз; декодированный массив кэшируется
+        и возвращается только для чтения, т.к. он общий для всех вызывающих.
+        """
+        try:
+            key = ImageLoader.file_key(filepath)
+        except OSError:
+            return None, ImageLoader._default_metadata()
+
+        cached = image_cache.get(key)
+        if cached is not None:
+            image, metadata = cached
+            return image, dict(metadata)
+
+        # Уже транскодированный снимок читаем из тайлов без декодирования
+        stored = ImageLoader._load_from_store(key)
+        if stored is not None:
+            image, metadata = stored
+        else:
+            image, metadata = ImageLoader._decode(filepath)
+            if image is None:
+                return None, ImageLoader._default_metadata()
+            if settings.RASTER_STORE_ENABLED:
+                try:
+                    raster_store.write(key, image, metadata)
+                except Exception as e:
+                    print(f"Error writing raster store: {e}")
+
+        image.flags.writeable = False
+        image_cache.put(key, (image, metadata), nbytes=image.nbytes)
+        return image, dict(metadata)
+
+    @staticmethod
+    def load_window(filepath: str, bbox: Tuple[int, int, int, int]) -> Optional[np.ndarray]:
+        """
+        Загрузка окна (x1, y1, x2, y2) снимка
+
+        Если снимок уже транскодирован, читаются только нужные тайлы.
+        """
+        try:
+            key = ImageLoader.file_key(filepath)
+        except OSError:
+            return None
+
+        # Проверка без учёта промаха: при чтении из тайлов кэш не нужен,
+        # а полная загрузка ниже сама учтёт промах
+        cached = image_cache.get(key) if key in image_cache else None
+        if cached is None and settings.RASTER_STORE_ENABLED:
+            window = raster_store.read_window(key, bbox)
+            if window is not None:
+                return window
+        if cached is None:
+            image, _ = ImageLoader.load_image_with_metadata(filepath)
+            if image is None:
+                return None
+        else:
+            image = cached[0]
+
+        x1, y1, x2, y2 = bbox
+        return image[max(0, y1):y2, max(0, x1):x2]
+
+    @staticmethod
+    def open_windowed(filepath: str) -> Optional[WindowedImage]:
+        """Оконный доступ к уже транскодированному снимку (None - снимка нет в хранилище)"""
+        if not settings.RASTER_STORE_ENABLED:
             return None
-        
         try:
-            image = cv2.imread(filepath)
-            if image is not None:
-                return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            manifest = raster_store.read_manifest(ImageLoader.file_key(filepath))
+        except OSError:
             return None
+        if manifest is None:
+            return None
+        return WindowedImage(filepath, manifest["shape"])
+
+    @staticmethod
+    def _decode(filepath: str) -> Tuple[Optional[np.ndarray], Dict]:
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return None, {}
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+            return image, ImageLoader._read_metadata(io.BytesIO(data))
         except Exception as e:
             print(f"Error loading image: {e}")
+            return None, {}
+
+    @staticmethod
+    def _load_from_store(key: Tuple) -> Optional[Tuple[np.ndarray, Dict]]:
+        if not settings.RASTER_STORE_ENABLED:
+            return None
+        manifest = raster_store.read_manifest(key)
+        if manifest is None:
+            return None
+        image = raster_store.read_window(key)
+        if image is None:
             return None
-    
+        return image, manifest.get("metadata", {})
+
+    @staticmethod
+    def load_image(filepath: str) -> Optional[np.ndarray]:
+        """Загрузка изображения"""
+        if not os.path.exists(filepath):
+            return None
+
+        image, _ = ImageLoader.load_image_with_metadata(filepath)
+        return image
+
     @staticmethod
     def get_image_metadata(filepath: str) -> Dict:
         """Получение метаданных изображения"""
         try:
-            with Image.open(filepath) as img:
-                return {
-                    'width': img.width,
-                    'height': img.height,
-                    'format': img.format,
-                    'mode': img.mode
-                }
+            key = ImageLoader.file_key(filepath)
+            cached = image_cache.peek(key)
+            if cached is not None:
+                return dict(cached[1])
+            manifest = raster_store.read_manifest(key) if settings.RASTER_STORE_ENABLED else None
+            if manifest is not None and manifest.get("metadata"):
+                return dict(manifest["metadata"])
+            return ImageLoader._read_metadata(filepath)
         except Exception as e:
             print(f"Error reading metadata: {e}")
-            return {'width': 1920, 'height': 1080, 'format': 'unknown'}
\ No newline at end of file
+            return ImageLoader._default_metadata()
+
+    @staticmethod
+    def cache_stats() -> Dict:
+        """Статистика кэша декодированных снимков"""
+        return image_cache.stats()
+
+    @staticmethod
+    def _read_metadata(source) -> Dict:
+        # PIL читает только заголовок, пиксели не декодируются
+        with Image.open(source) as img:
+            return {
+                'width': img.width,
+                'height': img.height,
+                'format': img.format,
+                'mode': img.mode
+            }
+
+    @staticmethod
+    def _default_metadata() -> Dict:
+        return {'width': 1920, 'height': 1080, 'format': 'unknown'}
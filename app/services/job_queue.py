@@ -0,0 +1,388 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.databace import SessionLocal, engine
+from app.core.profiling import profile_block
+from app.core.response_cache import bump_data_version
+from app.models.anomaly import AnomalyDetection
+from app.models.image import SatelliteImage
+from app.models.job import AnalysisJob
+from app.services.tracking import AnomalyTracker, tracks_lock
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def simulate_analysis(params: Optional[Dict] = None) -> Dict:
+    """Симуляция анализа"""
+    time.sleep(1)  # Имитация обработки
+
+    return {
+        "anomalies_found": random.randint(3, 8),
+        "processing_time": f"{random.uniform(1.5, 3.2):.1f} секунд",
+        "detected_types": ["fire", "deforestation", "dump"],
+        "confidence": round(random.uniform(0.7, 0.95), 2),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+# Анализатор воркера (создаётся лениво, один на процесс)
+_analyzer = None
+
+
+def run_analysis(params: Dict) -> Dict:
+    """Анализ снимка (и сравнение с референсным) по id из БД"""
+    global _analyzer
+    if _analyzer is None:
+        from .analizer import ImageAnalyzer
+        _analyzer = ImageAnalyzer()
+
+    db = SessionLocal()
+    try:
+        image = db.query(SatelliteImage).filter(SatelliteImage.id == params["image_id"]).first()
+        if image is None:
+            raise ValueError(f"Image {params['image_id']} not found")
+        reference_path = None
+        if params.get("reference_id") is not None:
+            reference = db.query(SatelliteImage).filter(SatelliteImage.id == params["reference_id"]).first()
+            if reference is None:
+                raise ValueError(f"Reference image {params['reference_id']} not found")
+            reference_path = reference.filepath
+        image_path = image.filepath
+    finally:
+        db.close()
+
+    if params.get("profile"):
+        # Профилируется полный прогон, без кэша результатов
+        label = f"analyze image={params['image_id']} reference={params.get('reference_id')}"
+        with profile_block(params["profile"], label, thread_id=threading.get_ident()) as profile:
+            result = _analyzer.analyze_single_image(image_path, reference_path, use_cache=False)
+        result["profile_id"] = profile["id"]
+    else:
+        result = _analyzer.analyze_single_image(image_path, reference_path)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    result["persisted"] = persist_anomalies(params["image_id"], result.get("anomalies", []),
+                                            result.get("analysis_id"))
+    return result
+
+
+def persist_anomalies(image_id: int, anomalies: List[Dict], analysis_id: Optional[str] = None) -> Dict:
+    """
+    Запись найденных аномалий в БД (новые треки забирает лента /api/anomalies/stream)
+
+    Повторные обнаружения того же места сливаются в треки (tracking), сами
+    обнаружения хранятся в anomaly_detections. Повтор того же анализа
+    (повтор задачи, кэш) строки не дублирует; анализ того же снимка с другим
+    эталоном записывается отдельно.
+    """
+    empty = {"detections": 0, "tracks_created": 0, "tracks_updated": 0}
+    if not anomalies:
+        return empty
+    db = SessionLocal()
+    try:
+        with tracks_lock():
+            already = db.query(AnomalyDetection.id).filter(
+                AnomalyDetection.image_id == image_id,
+                AnomalyDetection.analysis_id == analysis_id
+            ).first()
+            if already is not None:
+                return empty
+            image = db.query(SatelliteImage).filter(SatelliteImage.id == image_id).first()
+            observed_at = image.date_captured if image is not None and image.date_captured else datetime.now()
+            stats = AnomalyTracker().merge(db, image_id, observed_at, anomalies, analysis_id)
+            db.commit()
+        bump_data_version()
+        return stats
+    finally:
+        db.close()
+
+
+# Обработчики задач по типу
+HANDLERS: Dict[str, Callable[[Dict], Dict]] = {
+    "simulate": simulate_analysis,
+    "analyze": run_analysis,
+}
+
+
+def enqueue(db: Session, kind: str, params: Optional[Dict] = None,
+            priority: int = 0, max_attempts: Optional[int] = None,
+            dedupe: bool = False) -> AnalysisJob:
+    """
+    Постановка задачи в очередь
+
+    dedupe - если такая же задача (вид и параметры) ещё в очереди или
+    выполняется, вернуть её вместо новой: одновременные одинаковые запросы
+    ждут один результат.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    payload = json.dumps(params or {}, sort_keys=True)
+    if dedupe:
+        existing = (
+            db.query(AnalysisJob)
+            .filter(AnalysisJob.kind == kind, AnalysisJob.params == payload,
+                    AnalysisJob.status.in_([QUEUED, RUNNING]))
+            .order_by(AnalysisJob.id)
+            .first()
+        )
+        if existing is not None:
+            return existing
+
+    job = AnalysisJob(
+        kind=kind,
+        params=payload,
+        status=QUEUED,
+        priority=priority,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_next(db: Session, worker_name: str) -> Optional[AnalysisJob]:
+    """
+    Захват следующей задачи: сначала по приоритету, затем по времени постановки
+
+    Захват - условный UPDATE по статусу, поэтому одну задачу получает
+    ровно один воркер, даже если их несколько процессов.
+    """
+    for _ in range(5):
+        now = datetime.now()
+        candidate = (
+            db.query(AnalysisJob.id)
+            .filter(AnalysisJob.status == QUEUED)
+            .filter(or_(AnalysisJob.available_at.is_(None), AnalysisJob.available_at <= now))
+            .order_by(AnalysisJob.priority.desc(), AnalysisJob.id.asc())
+            .first()
+        )
+        if candidate is None:
+            return None
+
+        claimed = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == candidate.id, AnalysisJob.status == QUEUED)
+            .values(status=RUNNING, worker=worker_name, started_at=now, heartbeat_at=now,
+                    attempts=AnalysisJob.attempts + 1)
+        )
+        db.commit()
+        if claimed.rowcount == 1:
+            return db.query(AnalysisJob).filter(AnalysisJob.id == candidate.id).first()
+
+    return None
+
+
+def complete(db: Session, job: AnalysisJob, result: Dict) -> None:
+    job.status = DONE
+    job.result = json.dumps(result, ensure_ascii=False, default=str)
+    job.error = None
+    job.finished_at = datetime.now()
+    db.commit()
+
+
+def fail(db: Session, job: AnalysisJob, error: str) -> None:
+    """Ошибка задачи: повтор с экспоненциальной задержкой, пока есть попытки"""
+    job.error = error
+    if job.attempts < job.max_attempts:
+        job.status = QUEUED
+        job.available_at = datetime.now() + timedelta(seconds=2 ** job.attempts)
+    else:
+        job.status = FAILED
+        job.finished_at = datetime.now()
+    db.commit()
+
+
+def requeue_stale(db: Session) -> Dict[str, int]:
+    """
+    Задачи, зависшие в статусе running (воркер умер или завис)
+
+    Зависшей считается задача без heartbeat дольше JOB_STALE_SECONDS: живой
+    воркер обновляет heartbeat_at всё время выполнения, поэтому долгие
+    задачи не перезапускаются. Потерянный запуск - неудачная попытка (attempts увеличен при захвате):
+    пока попытки есть, задача возвращается в очередь, иначе - failed с
+    ошибкой. Так задача, роняющая воркер, не перезапускается бесконечно.
+    """
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    error = f"Worker lost: no heartbeat for {settings.JOB_STALE_SECONDS}s"
+    stale = (AnalysisJob.status == RUNNING,
+             func.coalesce(AnalysisJob.heartbeat_at, AnalysisJob.started_at) < cutoff)
+    failed = db.execute(
+        update(AnalysisJob)
+        .where(*stale, AnalysisJob.attempts >= AnalysisJob.max_attempts)
+        .values(status=FAILED, worker=None, error=error, finished_at=now)
+    )
+    requeued = db.execute(
+        update(AnalysisJob)
+        .where(*stale)
+        .values(status=QUEUED, worker=None, error=error, available_at=now)
+    )
+    db.commit()
+    return {"requeued": requeued.rowcount, "failed": failed.rowcount}
+
+
+def sweep_stale() -> None:
+    db = SessionLocal()
+    try:
+        swept = requeue_stale(db)
+        if swept["requeued"] or swept["failed"]:
+            logger.info("Stale jobs: %s requeued, %s failed", swept["requeued"], swept["failed"])
+    finally:
+        db.close()
+
+
+def queue_depths(db: Session) -> Dict[str, int]:
+    """Число задач по статусам"""
+    rows = db.query(AnalysisJob.status, func.count(AnalysisJob.id)).group_by(AnalysisJob.status).all()
+    return {status: count for status, count in rows}
+
+
+def heartbeat(job_id: int, worker_name: str) -> bool:
+    """Отметка, что задача ещё выполняется этим воркером"""
+    db = SessionLocal()
+    try:
+        updated = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == RUNNING,
+                   AnalysisJob.worker == worker_name)
+            .values(heartbeat_at=datetime.now())
+        )
+        db.commit()
+        return updated.rowcount == 1
+    finally:
+        db.close()
+
+
+def _heartbeat_loop(job_id: int, worker_name: str, done: threading.Event) -> None:
+    while not done.wait(settings.JOB_HEARTBEAT_INTERVAL):
+        try:
+            heartbeat(job_id, worker_name)
+        except Exception as e:
+            logger.error("Job %s heartbeat error: %s", job_id, e)
+
+
+def run_job(db: Session, job: AnalysisJob) -> None:
+    handler = HANDLERS.get(job.kind)
+    if handler is None:
+        job.attempts = job.max_attempts
+        fail(db, job, f"Unknown job kind: {job.kind}")
+        return
+
+    # Heartbeat из отдельного потока, пока обработчик работает
+    done = threading.Event()
+    beat = threading.Thread(target=_heartbeat_loop, args=(job.id, job.worker, done),
+                            name=f"job-heartbeat-{job.id}", daemon=True)
+    beat.start()
+    try:
+        result = handler(json.loads(job.params or "{}"))
+    except Exception as e:
+        logger.warning("Job %s (%s) failed: %s", job.id, job.kind, e)
+        fail(db, job, str(e))
+        return
+    finally:
+        done.set()
+        beat.join()
+
+    complete(db, job, result)
+
+
+def worker_loop(worker_name: str, stop_event, poll_interval: Optional[float] = None) -> None:
+    """Цикл воркера: захват задачи, выполнение, запись результата"""
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    # Соединения родительского процесса не используем
+    engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    last_sweep = time.monotonic()
+
+    while not stop_event.is_set():
+        # Поиск зависших задач идёт и после старта пула: условные UPDATE
+        # безопасны при одновременном запуске из нескольких воркеров
+        if time.monotonic() - last_sweep >= settings.JOB_SWEEP_INTERVAL:
+            last_sweep = time.monotonic()
+            try:
+                sweep_stale()
+            except Exception as e:
+                logger.error("Worker %s stale sweep error: %s", worker_name, e)
+
+        db = SessionLocal()
+        try:
+            job = claim_next(db, worker_name)
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            run_job(db, job)
+        except Exception as e:
+            logger.error("Worker %s error: %s", worker_name, e)
+            stop_event.wait(poll_interval)
+        finally:
+            db.close()
+
+
+class JobWorkerPool:
+    """Пул процессов-воркеров очереди задач (отдельно от процесса API)"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = settings.JOB_WORKERS if workers is None else workers
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        sweep_stale()
+
+        for index in range(self.workers):
+            name = f"{os.getpid()}-{index}"
+            process = self._context.Process(
+                target=worker_loop, args=(name, self._stop_event),
+                name=f"job-worker-{name}", daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process.is_alive())
+
+
+if __name__ == "__main__":
+    # Отдельный запуск воркеров: python -m app.services.job_queue
+    from app.core.databace import Base, upgrade_schema
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+    pool = JobWorkerPool()
+    pool.start()
+    print(f"Job workers started: {pool.workers}")
+    try:
+        while pool.alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import uuid
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.cache import evict_lru_files
+
+ANALYSIS_ID_PATTERN = re.compile(r"[0-9a-f]{16,64}")
+
+
+def encode_rle(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Построчное RLE маски: (runs, row_offsets)
+
+    runs - массив [start, end) отрезков ненулевых пикселей (int32, N x 2),
+    отрезки строки r лежат в runs[row_offsets[r]:row_offsets[r + 1]].
+    """
+    height, width = mask.shape[:2]
+    padded = np.zeros((height, width + 2), dtype=bool)
+    padded[:, 1:-1] = mask > 0
+
+    # Переходы 0->1 и 1->0 чередуются внутри строки: начало, конец, начало...
+    rows, cols = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    runs = cols.astype(np.int32).reshape(-1, 2)
+    run_rows = rows[::2]
+    row_offsets = np.searchsorted(run_rows, np.arange(height + 1)).astype(np.int32)
+    return runs, row_offsets
+
+
+def decode_rle(runs: np.ndarray, row_offsets: np.ndarray, shape: Tuple[int, int],
+               window: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+    """Восстановление маски (0/255) целиком или окна (x1, y1, x2, y2)"""
+    height, width = shape
+    x1, y1, x2, y2 = window if window is not None else (0, 0, width, height)
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    out_h, out_w = max(0, y2 - y1), max(0, x2 - x1)
+    if out_h == 0 or out_w == 0:
+        return np.zeros((out_h, out_w), dtype=np.uint8)
+
+    first, last = row_offsets[y1], row_offsets[y2]
+    counts = np.diff(row_offsets[y1:y2 + 1])
+    run_rows = np.repeat(np.arange(out_h), counts)
+    starts = np.clip(runs[first:last, 0], x1, x2) - x1
+    ends = np.clip(runs[first:last, 1], x1, x2) - x1
+    keep = ends > starts
+
+    # Разметка границ отрезков и накопленная сумма по строке
+    edges = np.zeros((out_h, out_w + 1), dtype=np.int32)
+    np.add.at(edges, (run_rows[keep], starts[keep]), 1)
+    np.add.at(edges, (run_rows[keep], ends[keep]), -1)
+    return np.where(np.cumsum(edges[:, :-1], axis=1) > 0, 255, 0).astype(np.uint8)
+
+
+def rle_area(runs: np.ndarray) -> int:
+    """Площадь маски прямо по RLE"""
+    if len(runs) == 0:
+        return 0
+    return int((runs[:, 1] - runs[:, 0]).sum())
+
+
+class MaskStore:
+    """
+    Хранилище масок изменений по анализам в построчном RLE
+
+    Маски изменений разреженные, поэтому RLE занимает единицы-десятки килобайт
+    вместо мегабайт на несжатый uint8. Статистика площади считается по отрезкам,
+    окно декодируется только из строк, которые в него попадают. Давно не
+    читавшиеся маски вытесняются по суммарному размеру (MASK_STORE_BYTES).
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.path.join(settings.PROCESSED_DIR, "masks")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.MASK_STORE_BYTES
+
+    def _path(self, analysis_id: str, suffix: str) -> str:
+        if not ANALYSIS_ID_PATTERN.fullmatch(analysis_id):
+            raise ValueError(f"Invalid analysis id: {analysis_id}")
+        return os.path.join(self.root, f"{analysis_id}{suffix}")
+
+    def save(self, analysis_id: str, change_mask: np.ndarray, extra: Optional[Dict] = None) -> Dict:
+        """Сохранение маски; возвращает статистику площади"""
+        runs, row_offsets = encode_rle(change_mask)
+        height, width = change_mask.shape[:2]
+        area = rle_area(runs)
+        meta = {
+            **(extra or {}),
+            "shape": [height, width],
+            "change_area": area,
+            "change_percentage": area / (height * width) * 100
+        }
+
+        os.makedirs(self.root, exist_ok=True)
+        # Запись через временные файлы: читатели не видят недописанную маску,
+        # метаданные - последними (по ним маска считается сохранённой)
+        npz_path = self._path(analysis_id, ".rle.npz")
+        tmp_path = f"{npz_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, runs=runs, row_offsets=row_offsets)
+        os.replace(tmp_path, npz_path)
+        self._write_meta(analysis_id, meta)
+        evict_lru_files(self.root, self.max_bytes)
+
+        return {"change_area": float(area), "change_percentage": float(meta["change_percentage"])}
+
+    def _write_meta(self, analysis_id: str, meta: Dict) -> None:
+        meta_path = self._path(analysis_id, ".json")
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def update_meta(self, analysis_id: str, **fields) -> bool:
+        """Обновление полей метаданных сохранённой маски (False - маски нет)"""
+        meta = self.load_meta(analysis_id)
+        if meta is None:
+            return False
+        meta.update(fields)
+        self._write_meta(analysis_id, meta)
+        return True
+
+    def exists(self, analysis_id: str) -> bool:
+        """Сохранены и маска, и метаданные"""
+        return all(os.path.exists(self._path(analysis_id, suffix)) for suffix in (".rle.npz", ".json"))
+
+    def load_meta(self, analysis_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(analysis_id, ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_runs(self, analysis_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        npz_path = self._path(analysis_id, ".rle.npz")
+        try:
+            with np.load(npz_path) as data:
+                loaded = data["runs"], data["row_offsets"]
+            # mtime - отметка последнего использования для LRU; маска раньше
+            # метаданных, поэтому при вытеснении они удаляются подряд
+            os.utime(npz_path, None)
+            os.utime(self._path(analysis_id, ".json"), None)
+        except (OSError, ValueError, KeyError):
+            return None
+        return loaded
+
+    def stats(self, analysis_id: str, window: Optional[Tuple[int, int, int, int]] = None) -> Optional[Dict]:
+        """Площадь и доля изменений (по всей маске или в окне) без декодирования"""
+        meta = self.load_meta(analysis_id)
+        loaded = self._load_runs(analysis_id)
+        if meta is None or loaded is None:
+            return None
+        runs, row_offsets = loaded
+        height, width = meta["shape"]
+
+        if window is None:
+            area, total = rle_area(runs), height * width
+        else:
+            x1, y1, x2, y2 = window
+            x1, x2 = min(max(0, x1), width), min(max(0, x2), width)
+            y1, y2 = min(max(0, y1), height), min(max(0, y2), height)
+            if x2 <= x1 or y2 <= y1:
+                # Окно за пределами маски
+                area, total = 0, 0
+            else:
+                selected = runs[row_offsets[y1]:row_offsets[y2]]
+                area, total = rle_area(np.clip(selected, x1, x2)), (x2 - x1) * (y2 - y1)
+
+        return {
+            "change_area": float(area),
+            "change_percentage": float(area / total * 100) if total else 0.0
+        }
+
+    def load(self, analysis_id: str,
+             window: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]:
+        """Маска (0/255) целиком или окно (x1, y1, x2, y2)"""
+        meta = self.load_meta(analysis_id)
+        loaded = self._load_runs(analysis_id)
+        if meta is None or loaded is None:
+            return None
+        runs, row_offsets = loaded
+        return decode_rle(runs, row_offsets, tuple(meta["shape"]), window)
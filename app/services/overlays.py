@@ -0,0 +1,112 @@
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import stage
+from app.utils.cache import evict_lru_files
+
+from .change_detect import ChangeDetector
+from .image_loader import ImageLoader
+from .mask_store import ANALYSIS_ID_PATTERN, MaskStore
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+class OverlayRenderer:
+    """
+    Визуализация изменений по запросу
+
+    При анализе сохраняются только маска изменений (RLE) и регионы; картинка
+    с наложением строится при первом просмотре в нужном разрешении, кодируется
+    в PNG/WebP и кэшируется в data/processed/overlays с вытеснением по объёму.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or settings.PROCESSED_DIR
+        self.mask_store = MaskStore(os.path.join(self.root, "masks"))
+        self.overlays_dir = os.path.join(self.root, "overlays")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.OVERLAY_CACHE_BYTES
+        self.change_detector = ChangeDetector()
+
+    def save_analysis(self, analysis_id: str, image_path: str,
+                      change_mask: np.ndarray, regions: List[Dict]) -> Dict:
+        """Сохранение маски и регионов анализа (без рендеринга); возвращает статистику"""
+        return self.mask_store.save(analysis_id, change_mask, {
+            "image_path": image_path,
+            "regions": regions
+        })
+
+    def ensure_source(self, analysis_id: str, image_path: str) -> bool:
+        """
+        Наложение анализа можно построить (маска на месте)
+
+        Анализ из кэша мог быть посчитан для копии снимка по другому пути:
+        если прежний файл удалён, снимком для рендеринга становится image_path.
+        """
+        if not self.mask_store.exists(analysis_id):
+            return False
+        info = self.mask_store.load_meta(analysis_id) or {}
+        source = info.get("image_path")
+        if source != image_path and not (source and os.path.exists(source)):
+            self.mask_store.update_meta(analysis_id, image_path=image_path)
+        return True
+
+    def render(self, analysis_id: str, width: Optional[int] = None,
+               fmt: str = "png") -> Optional[Tuple[bytes, str]]:
+        """Картинка с наложением (байты, media type) или None, если анализа нет"""
+        if not ANALYSIS_ID_PATTERN.fullmatch(analysis_id):
+            raise ValueError(f"Invalid analysis id: {analysis_id}")
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported overlay format: {fmt}")
+
+        cache_path = os.path.join(self.overlays_dir, f"{analysis_id}_{width or 'full'}.{fmt}")
+        try:
+            with open(cache_path, "rb") as f:
+                data = f.read()
+            os.utime(cache_path, None)
+            return data, MEDIA_TYPES[fmt]
+        except OSError:
+            pass
+
+        info = self.mask_store.load_meta(analysis_id)
+        change_mask = self.mask_store.load(analysis_id)
+        if info is None or change_mask is None:
+            return None
+
+        image = ImageLoader.load_image(info["image_path"])
+        if image is None:
+            return None
+
+        # Регионы и маска заданы в сетке анализируемого снимка
+        height, full_width = change_mask.shape[:2]
+        if image.shape[:2] != (height, full_width):
+            image = cv2.resize(image, (full_width, height), interpolation=cv2.INTER_AREA)
+
+        scale = 1.0
+        if width and width < full_width:
+            scale = width / full_width
+            size = (width, max(1, int(round(height * scale))))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            change_mask = cv2.resize(change_mask, size, interpolation=cv2.INTER_NEAREST)
+
+        with stage("visualize"):
+            overlay = self.change_detector.visualize_changes(image, change_mask, info["regions"], scale)
+        params = [cv2.IMWRITE_WEBP_QUALITY, 85] if fmt == "webp" else [cv2.IMWRITE_PNG_COMPRESSION, 6]
+        with stage("overlay_encode"):
+            ok, encoded = cv2.imencode(f".{fmt}", cv2.cvtColor(overlay, cv2.COLOR_RGB2BGR), params)
+        if not ok:
+            return None
+        data = encoded.tobytes()
+
+        os.makedirs(self.overlays_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+        evict_lru_files(self.overlays_dir, self.max_bytes)
+
+        return data, MEDIA_TYPES[fmt]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.cache import evict_lru_dirs, remove_tree
+
+
+class RasterStore:
+    """
+    Хранилище декодированных снимков в data/processed
+
+    Каждый снимок один раз записывается несжатыми тайлами .npy и манифестом.
+    Чтение идёт через np.load(mmap_mode='r'), поэтому с диска подтягиваются
+    только затронутые тайлы, а страничный кэш ОС общий для всех процессов.
+
+    Версии одного файла лежат в общем каталоге источника: при записи новой
+    версии (ключ включает mtime) старые удаляются. Объём хранилища ограничен
+    max_bytes, вытесняются давно не читавшиеся снимки целиком.
+    """
+
+    MANIFEST = "manifest.json"
+    # Отметка чтения обновляется не чаще раза в TOUCH_INTERVAL секунд:
+    # для LRU такой точности хватает, а лишних записей метаданных на диск нет
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, root: Optional[str] = None, tile_size: int = 512,
+                 max_bytes: Optional[int] = None):
+        self.root = root or os.path.join(settings.PROCESSED_DIR, "rasters")
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes or settings.RASTER_STORE_BYTES
+
+    def _source_dir(self, key: Tuple) -> str:
+        return os.path.join(self.root, hashlib.sha1(key[0].encode("utf-8")).hexdigest())
+
+    def _scene_dir(self, key: Tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._source_dir(key), digest)
+
+    @staticmethod
+    def _tile_name(row: int, col: int) -> str:
+        return f"r{row:04d}_c{col:04d}.npy"
+
+    def read_manifest(self, key: Tuple) -> Optional[Dict]:
+        """Манифест снимка или None, если снимок ещё не транскодирован"""
+        path = os.path.join(self._scene_dir(key), self.MANIFEST)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, key: Tuple, image: np.ndarray, metadata: Optional[Dict] = None) -> Dict:
+        """Запись снимка тайлами (один раз на ключ)"""
+        existing = self.read_manifest(key)
+        if existing is not None:
+            return existing
+
+        scene_dir = self._scene_dir(key)
+        tmp_dir = f"{scene_dir}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(os.path.dirname(scene_dir), exist_ok=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        height, width = image.shape[:2]
+        rows = (height + self.tile_size - 1) // self.tile_size
+        cols = (width + self.tile_size - 1) // self.tile_size
+
+        try:
+            for row in range(rows):
+                for col in range(cols):
+                    y, x = row * self.tile_size, col * self.tile_size
+                    tile = np.ascontiguousarray(image[y:y + self.tile_size, x:x + self.tile_size])
+                    np.save(os.path.join(tmp_dir, self._tile_name(row, col)), tile)
+
+            manifest = {
+                "source": key[0],
+                "shape": list(image.shape),
+                "dtype": str(image.dtype),
+                "tile_size": self.tile_size,
+                "rows": rows,
+                "cols": cols,
+                "metadata": metadata or {}
+            }
+            with open(os.path.join(tmp_dir, self.MANIFEST), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+            # Атомарная публикация: другой процесс мог успеть раньше
+            try:
+                os.rename(tmp_dir, scene_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self._remove_old_versions(key)
+        evict_lru_dirs(self.root, self.max_bytes, self.MANIFEST, keep=scene_dir)
+        return manifest
+
+    def _remove_old_versions(self, key: Tuple) -> None:
+        """Удаление версий того же файла с другим ключом (файл перезаписан)"""
+        source_dir = self._source_dir(key)
+        current = os.path.basename(self._scene_dir(key))
+        try:
+            names = os.listdir(source_dir)
+        except OSError:
+            return
+        for name in names:
+            if name != current and ".tmp-" not in name:
+                remove_tree(os.path.join(source_dir, name))
+
+    def read_window(self, key: Tuple, bbox: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]:
+        """
+        Чтение окна (x1, y1, x2, y2) снимка; без bbox - весь снимок
+
+        Открываются только тайлы, пересекающие окно.
+        """
+        manifest = self.read_manifest(key)
+        if manifest is None:
+            return None
+
+        shape = manifest["shape"]
+        height, width = shape[0], shape[1]
+        x1, y1, x2, y2 = bbox if bbox is not None else (0, 0, width, height)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        tile = manifest["tile_size"]
+        scene_dir = self._scene_dir(key)
+        # mtime манифеста - время последнего чтения для вытеснения
+        manifest_path = os.path.join(scene_dir, self.MANIFEST)
+        try:
+            now = time.time()
+            if now - os.stat(manifest_path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(manifest_path, (now, now))
+        except OSError:
+            pass
+        out = np.empty((y2 - y1, x2 - x1) + tuple(shape[2:]), dtype=manifest["dtype"])
+
+        try:
+            for row in range(y1 // tile, (y2 - 1) // tile + 1):
+                for col in range(x1 // tile, (x2 - 1) // tile + 1):
+                    data = np.load(os.path.join(scene_dir, self._tile_name(row, col)), mmap_mode="r")
+                    ty, tx = row * tile, col * tile
+                    sy1, sy2 = max(y1, ty), min(y2, ty + data.shape[0])
+                    sx1, sx2 = max(x1, tx), min(x2, tx + data.shape[1])
+                    out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = data[sy1 - ty:sy2 - ty, sx1 - tx:sx2 - tx]
+        except (OSError, ValueError) as e:
+            print(f"Error reading raster store: {e}")
+            return None
+
+        return out
+
+
+# Глобальный экземпляр
+raster_store = RasterStore()
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+
+class ImageRegistrar:
+    """
+    Совмещение снимков перед вычитанием
+
+    Сдвиг оценивается фазовой корреляцией по уменьшенным копиям, масштаб - по
+    размерам снимков. Результат - одна аффинная матрица 2x3, переводящая
+    подвижный снимок в сетку пикселей неподвижного. Матрица кэшируется на пару
+    (в памяти и JSON-файлом в data/processed), так что пара совмещается один раз.
+    """
+
+    def __init__(self, max_side: int = 1024, min_response: float = 0.05,
+                 root: Optional[str] = None, memory_entries: int = 1024):
+        self.max_side = max_side
+        self.min_response = min_response
+        self.root = root or os.path.join(settings.PROCESSED_DIR, "registration")
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def estimate(self, fixed: np.ndarray, moving: np.ndarray) -> Dict:
+        """Оценка преобразования moving -> fixed"""
+        fixed_h, fixed_w = fixed.shape[:2]
+        moving_h, moving_w = moving.shape[:2]
+        scale_x, scale_y = fixed_w / moving_w, fixed_h / moving_h
+
+        # Корреляция на уменьшенных копиях в сетке fixed
+        factor = min(1.0, self.max_side / max(fixed_h, fixed_w))
+        small_size = (max(1, int(fixed_w * factor)), max(1, int(fixed_h * factor)))
+        fixed_small = self._gray_float(cv2.resize(fixed, small_size, interpolation=cv2.INTER_AREA))
+        moving_small = self._gray_float(cv2.resize(moving, small_size, interpolation=cv2.INTER_AREA))
+
+        window = cv2.createHanningWindow(small_size, cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(fixed_small, moving_small, window)
+
+        # Слабый пик корреляции - сдвигу не доверяем
+        if response < self.min_response:
+            dx, dy = 0.0, 0.0
+        dx, dy = dx / factor, dy / factor
+
+        transform = {
+            "matrix": [[scale_x, 0.0, -dx], [0.0, scale_y, -dy]],
+            "shift": [dx, dy],
+            "scale": [scale_x, scale_y],
+            "response": float(response),
+            "size": [fixed_w, fixed_h]
+        }
+        if factor < 1.0 and response >= self.min_response:
+            transform = self._refine(fixed, moving, transform)
+        return transform
+
+    def _refine(self, fixed: np.ndarray, moving: np.ndarray, transform: Dict) -> Dict:
+        """Уточнение сдвига на полном разрешении по центральному фрагменту"""
+        fixed_h, fixed_w = fixed.shape[:2]
+        crop_h, crop_w = min(fixed_h, self.max_side), min(fixed_w, self.max_side)
+        y0, x0 = (fixed_h - crop_h) // 2, (fixed_w - crop_w) // 2
+
+        # Переносим начало координат в угол фрагмента и варпим только его
+        matrix = np.array(transform["matrix"], dtype=np.float32)
+        matrix[0, 2] -= x0
+        matrix[1, 2] -= y0
+        moving_crop = cv2.warpAffine(moving, matrix, (crop_w, crop_h),
+                                     flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        fixed_crop = fixed[y0:y0 + crop_h, x0:x0 + crop_w]
+
+        window = cv2.createHanningWindow((crop_w, crop_h), cv2.CV_32F)
+        (rdx, rdy), response = cv2.phaseCorrelate(
+            self._gray_float(fixed_crop), self._gray_float(moving_crop), window
+        )
+        if response < self.min_response:
+            return transform
+
+        dx, dy = transform["shift"][0] + rdx, transform["shift"][1] + rdy
+        scale_x, scale_y = transform["scale"]
+        return {
+            **transform,
+            "matrix": [[scale_x, 0.0, -dx], [0.0, scale_y, -dy]],
+            "shift": [dx, dy],
+            "response": float(response)
+        }
+
+    def get_transform(self, fixed: np.ndarray, moving: np.ndarray,
+                      key: Optional[str] = None) -> Dict:
+        """Преобразование пары из кэша или новая оценка"""
+        if key is not None:
+            cached = self._load(key)
+            if cached is not None:
+                return cached
+
+        transform = self.estimate(fixed, moving)
+        if key is not None:
+            self._store(key, transform)
+        return transform
+
+    @staticmethod
+    def is_identity(transform: Dict, tolerance: float = 0.5) -> bool:
+        (a, b, tx), (c, d, ty) = transform["matrix"]
+        return (abs(a - 1) < 1e-6 and abs(d - 1) < 1e-6 and b == 0 and c == 0
+                and abs(tx) < tolerance and abs(ty) < tolerance)
+
+    @staticmethod
+    def warp(moving: np.ndarray, transform: Dict) -> np.ndarray:
+        """Применение преобразования одним warpAffine"""
+        width, height = transform["size"]
+        matrix = np.array(transform["matrix"], dtype=np.float32)
+        return cv2.warpAffine(moving, matrix, (width, height),
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    @staticmethod
+    def _gray_float(image: np.ndarray) -> np.ndarray:
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        return image.astype(np.float32)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            transform = self._memory.get(key)
+            if transform is not None:
+                self._memory.move_to_end(key)
+                return transform
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                transform = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, transform)
+        return transform
+
+    def _store(self, key: str, transform: Dict) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(transform, f)
+        os.replace(tmp_path, self._path(key))
+        self._remember(key, transform)
+
+    def _remember(self, key: str, transform: Dict) -> None:
+        with self._lock:
+            self._memory[key] = transform
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.utils.cache import directory_size, evict_lru_files
+
+
+class ResultCache:
+    """
+    Кэш результатов анализа с адресацией по содержимому
+
+    Два уровня: небольшой LRU в памяти и JSON-файлы в data/processed/results
+    с вытеснением давно использованных файлов по суммарному размеру.
+    """
+
+    def __init__(self, root: Optional[str] = None,
+                 max_bytes: Optional[int] = None,
+                 memory_entries: Optional[int] = None):
+        self.root = root or os.path.join(settings.PROCESSED_DIR, "results")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.RESULT_CACHE_BYTES
+        self.memory_entries = memory_entries if memory_entries is not None else settings.RESULT_CACHE_MEMORY_ENTRIES
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._disk_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_hash: str, reference_hash: Optional[str], params: Dict) -> str:
+        """Ключ результата: хэши содержимого снимков + параметры пайплайна"""
+        payload = json.dumps(
+            {"image": image_hash, "reference": reference_hash, "params": params},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = f.read()
+            # mtime - отметка последнего использования для LRU на диске
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, payload)
+        return json.loads(payload)
+
+    def put(self, key: str, result: Dict) -> None:
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        # Перезапись ключа заменяет старый файл: его размер уже учтён
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember(key, payload)
+            if self._disk_bytes is None:
+                self._disk_bytes = directory_size(self.root)
+            else:
+                self._disk_bytes += len(payload.encode("utf-8")) - replaced
+            needs_eviction = self._disk_bytes > self.max_bytes
+
+        if needs_eviction:
+            # Чистим с запасом, чтобы не сканировать каталог на каждой записи
+            remaining = evict_lru_files(self.root, int(self.max_bytes * 0.9))
+            with self._lock:
+                self._disk_bytes = remaining
+
+    def _remember(self, key: str, payload: str) -> None:
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / total, 4) if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self.max_bytes
+            }
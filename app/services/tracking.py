@@ -0,0 +1,212 @@
+import json
+import math
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.anomaly import Anomaly, AnomalyDetection
+from app.utils.locks import file_lock
+
+# (lat_min, lon_min, lat_max, lon_max)
+GeoBox = Tuple[float, float, float, float]
+
+
+def detection_box(anomaly: Dict) -> GeoBox:
+    """Гео-bbox обнаружения (точка центра, если bbox не посчитан)"""
+    bbox = anomaly.get("bbox_geo")
+    if bbox:
+        return (min(bbox["lat_min"], bbox["lat_max"]), min(bbox["lon_min"], bbox["lon_max"]),
+                max(bbox["lat_min"], bbox["lat_max"]), max(bbox["lon_min"], bbox["lon_max"]))
+    lat, lon = anomaly["location"]["latitude"], anomaly["location"]["longitude"]
+    return (lat, lon, lat, lon)
+
+
+def parse_box(value: Optional[str], latitude: float, longitude: float) -> GeoBox:
+    """Гео-bbox трека из колонки bbox (JSON)"""
+    try:
+        bbox = json.loads(value) if value else None
+    except ValueError:
+        bbox = None
+    if not bbox:
+        return (latitude, longitude, latitude, longitude)
+    return (bbox["lat_min"], bbox["lon_min"], bbox["lat_max"], bbox["lon_max"])
+
+
+def overlap(a: GeoBox, b: GeoBox) -> float:
+    """Доля пересечения от меньшего из bbox (точка внутри bbox - 1.0)"""
+    lat_min, lon_min = max(a[0], b[0]), max(a[1], b[1])
+    lat_max, lon_max = min(a[2], b[2]), min(a[3], b[3])
+    if lat_min > lat_max or lon_min > lon_max:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    if smaller <= 0:
+        return 1.0
+    return (lat_max - lat_min) * (lon_max - lon_min) / smaller
+
+
+def union(a: GeoBox, b: GeoBox) -> GeoBox:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+class GridIndex:
+    """Сетка по широте/долготе: ячейка -> ключи треков, чей bbox её задевает"""
+
+    def __init__(self, cell_deg: float):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+
+    def _cells_of(self, box: GeoBox):
+        row_min, col_min = math.floor(box[0] / self.cell_deg), math.floor(box[1] / self.cell_deg)
+        row_max, col_max = math.floor(box[2] / self.cell_deg), math.floor(box[3] / self.cell_deg)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                yield row, col
+
+    def insert(self, key: int, box: GeoBox) -> None:
+        for cell in self._cells_of(box):
+            self._cells[cell].add(key)
+
+    def remove(self, key: int, box: GeoBox) -> None:
+        for cell in self._cells_of(box):
+            self._cells[cell].discard(key)
+
+    def query(self, box: GeoBox) -> Set[int]:
+        found: Set[int] = set()
+        for cell in self._cells_of(box):
+            found |= self._cells.get(cell, set())
+        return found
+
+
+class AnomalyTracker:
+    """
+    Слияние повторных обнаружений в треки событий
+
+    Обнаружение присоединяется к открытому треку того же типа (последнее
+    обнаружение не дальше TRACK_MAX_GAP_HOURS по времени снимка), если их
+    гео-bbox перекрываются не меньше чем на TRACK_MIN_OVERLAP. Из БД читаются
+    только треки, чей центр не дальше TRACK_SEARCH_MARGIN_DEG от общего bbox
+    обнаружений снимка. Трек расширяет
+    bbox, обновляет last_seen и пиковую уверенность; новая строка anomalies
+    появляется только для нового события. Каждое обнаружение сохраняется в
+    anomaly_detections со ссылкой на свой трек.
+    """
+
+    def __init__(self, max_gap_hours: Optional[float] = None,
+                 min_overlap: Optional[float] = None,
+                 cell_deg: Optional[float] = None,
+                 search_margin_deg: Optional[float] = None):
+        self.max_gap = timedelta(hours=max_gap_hours if max_gap_hours is not None else settings.TRACK_MAX_GAP_HOURS)
+        self.min_overlap = min_overlap if min_overlap is not None else settings.TRACK_MIN_OVERLAP
+        self.cell_deg = cell_deg or settings.TRACK_GRID_DEG
+        self.search_margin = (search_margin_deg if search_margin_deg is not None
+                              else settings.TRACK_SEARCH_MARGIN_DEG)
+
+    def merge(self, db: Session, image_id: int, observed_at: datetime, anomalies: List[Dict],
+              analysis_id: Optional[str] = None) -> Dict:
+        """Запись обнаружений снимка; коммит - на вызывающем"""
+        index = GridIndex(self.cell_deg)
+        tracks: Dict[int, Anomaly] = {}
+        boxes: Dict[int, GeoBox] = {}
+
+        types = {anomaly["type"] for anomaly in anomalies}
+        if settings.TRACKING_ENABLED and types:
+            area = detection_box(anomalies[0])
+            for anomaly in anomalies[1:]:
+                area = union(area, detection_box(anomaly))
+            margin = self.search_margin
+            open_tracks = (
+                db.query(Anomaly)
+                .filter(Anomaly.anomaly_type.in_(types),
+                        Anomaly.latitude.between(area[0] - margin, area[2] + margin),
+                        Anomaly.longitude.between(area[1] - margin, area[3] + margin),
+                        Anomaly.last_seen >= observed_at - self.max_gap,
+                        Anomaly.first_seen <= observed_at + self.max_gap)
+                .all()
+            )
+            for track in open_tracks:
+                tracks[track.id] = track
+                boxes[track.id] = parse_box(track.bbox, track.latitude, track.longitude)
+                index.insert(track.id, boxes[track.id])
+
+        created = updated = 0
+        for anomaly in anomalies:
+            box = detection_box(anomaly)
+            track = self._best_match(index, tracks, boxes, anomaly["type"], box)
+
+            if track is None:
+                track = Anomaly(
+                    image_id=image_id,
+                    anomaly_type=anomaly["type"],
+                    confidence=anomaly["confidence"],
+                    latitude=anomaly["location"]["latitude"],
+                    longitude=anomaly["location"]["longitude"],
+                    bbox=json.dumps(anomaly.get("bbox_geo")),
+                    area=anomaly.get("area"),
+                    description=anomaly.get("description"),
+                    first_seen=observed_at,
+                    last_seen=observed_at,
+                    detections=1
+                )
+                db.add(track)
+                db.flush()
+                created += 1
+            else:
+                index.remove(track.id, boxes[track.id])
+                box = union(boxes[track.id], box)
+                self._extend(track, anomaly, box, observed_at)
+                updated += 1
+
+            if settings.TRACKING_ENABLED:
+                tracks[track.id] = track
+                boxes[track.id] = box
+                index.insert(track.id, box)
+
+            db.add(AnomalyDetection(
+                anomaly_id=track.id,
+                image_id=image_id,
+                analysis_id=analysis_id,
+                anomaly_type=anomaly["type"],
+                confidence=anomaly["confidence"],
+                latitude=anomaly["location"]["latitude"],
+                longitude=anomaly["location"]["longitude"],
+                bbox=json.dumps(anomaly.get("bbox_geo")),
+                area=anomaly.get("area"),
+                description=anomaly.get("description"),
+                observed_at=observed_at
+            ))
+
+        return {"detections": len(anomalies), "tracks_created": created, "tracks_updated": updated}
+
+    def _best_match(self, index: GridIndex, tracks: Dict[int, Anomaly], boxes: Dict[int, GeoBox],
+                    anomaly_type: str, box: GeoBox) -> Optional[Anomaly]:
+        best, best_overlap = None, self.min_overlap
+        for key in index.query(box):
+            track = tracks[key]
+            if track.anomaly_type != anomaly_type:
+                continue
+            score = overlap(boxes[key], box)
+            if score >= best_overlap:
+                best, best_overlap = track, score
+        return best
+
+    @staticmethod
+    def _extend(track: Anomaly, anomaly: Dict, box: GeoBox, observed_at: datetime) -> None:
+        track.bbox = json.dumps({"lat_min": box[0], "lon_min": box[1], "lat_max": box[2], "lon_max": box[3]})
+        track.latitude = round((box[0] + box[2]) / 2, 6)
+        track.longitude = round((box[1] + box[3]) / 2, 6)
+        track.first_seen = min(track.first_seen or observed_at, observed_at)
+        track.last_seen = max(track.last_seen or observed_at, observed_at)
+        track.detections = (track.detections or 1) + 1
+        track.area = max(track.area or 0.0, anomaly.get("area") or 0.0)
+        if anomaly["confidence"] > track.confidence:
+            track.confidence = anomaly["confidence"]
+            track.description = anomaly.get("description")
+
+
+def tracks_lock():
+    """Блокировка слияния: воркеры разных процессов не создают дубли одного трека"""
+    return file_lock(os.path.join(settings.PROCESSED_DIR, "locks", "tracks.lock"))
@@ -0,0 +1,176 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class ArrayCache:
+    """LRU-кэш массивов в памяти с ограничением по объёму в байтах"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получение значения с обновлением позиции в LRU"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Значение без учёта в счётчиках и без сдвига в LRU (для проверок)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None) -> None:
+        """Добавление значения; при переполнении вытесняются самые старые"""
+        if nbytes is None:
+            nbytes = value.nbytes
+        # Значение больше всего бюджета не кэшируем
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Счётчики попаданий/промахов и заполненность"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+def directory_size(directory: str) -> int:
+    """Суммарный размер файлов в каталоге (рекурсивно)"""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict_lru_files(directory: str, max_bytes: int) -> int:
+    """
+    Удаление самых давно использованных файлов, пока каталог не уложится в max_bytes
+
+    Время последнего использования - mtime файла (обновляется при попадании).
+    Возвращает итоговый размер каталога.
+    """
+    files = []
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+    return total
+
+
+def remove_tree(path: str) -> None:
+    """Удаление каталога: сначала атомарное переименование, чтобы читатели не видели его наполовину удалённым"""
+    doomed = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        os.rename(path, doomed)
+    except OSError:
+        return
+    shutil.rmtree(doomed, ignore_errors=True)
+
+
+def evict_lru_dirs(directory: str, max_bytes: int, marker: str, keep: Optional[str] = None) -> int:
+    """
+    То же, что evict_lru_files, но единица вытеснения - каталог с файлом marker
+
+    Каталог удаляется целиком (частично удалённый снимок из тайлов бесполезен).
+    Время последнего использования - mtime файла marker. Каталог keep не
+    удаляется. Возвращает итоговый размер.
+    """
+    units = []
+    total = 0
+    for root, dirs, names in os.walk(directory):
+        if ".tmp-" in os.path.basename(root):
+            dirs[:] = []
+            continue
+        if marker not in names:
+            continue
+        dirs[:] = []
+        size = 0
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+        try:
+            used = os.path.getmtime(os.path.join(root, marker))
+        except OSError:
+            used = 0.0
+        units.append((used, size, root))
+        total += size
+
+    units.sort()
+    keep = os.path.abspath(keep) if keep else None
+    for _, size, path in units:
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) == keep:
+            continue
+        remove_tree(path)
+        total -= size
+
+    return total
@@ -1,16 +1,141 @@
 import numpy as np
 import cv2
-from typing import Tuple
+from typing import Tuple, Dict, Iterator, List, Optional, Sequence, Union
 
-def normalize_image(image: np.ndarray) -> np.ndarray:
-    """Нормализация изображения"""
-    return (image - image.min()) / (image.max() - image.min() + 1e-7)
+# Индексы вида (a - b) / (a + b): имя -> (канал a, канал b)
+NORMALIZED_DIFFERENCE_INDICES = {
+    'ndvi': ('nir', 'red'),      # растительность
+    'nbr': ('nir', 'swir2'),     # гари / пожары
+    'ndwi': ('green', 'nir'),    # вода / затопления
+    'ngrdi': ('green', 'red'),   # растительность по видимым каналам (RGB)
+}
+
+# Раскладки каналов: имя канала -> индекс в последней оси массива
+BAND_MAPS = {
+    'rgb': {'red': 0, 'green': 1, 'blue': 2},
+    # Стек Sentinel-2: B2, B3, B4, B8, B11, B12
+    'sentinel2': {'blue': 0, 'green': 1, 'red': 2, 'nir': 3, 'swir1': 4, 'swir2': 5},
+}
+
+EPS = 1e-7
+
+def normalize_image(image: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Нормализация изображения (float32, результат можно писать в готовый буфер)"""
+    low, high = float(image.min()), float(image.max())
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+    np.subtract(image, low, out=out, dtype=np.float32)
+    out *= np.float32(1.0 / (high - low + EPS))
+    return out
 
 def resize_image(image: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
     """Изменение размера изображения"""
     return cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
 
-def apply_ndvi(red_band: np.ndarray, nir_band: np.ndarray) -> np.ndarray:
+def normalized_difference(band_a: np.ndarray, band_b: np.ndarray,
+                          out: Optional[np.ndarray] = None,
+                          scratch: Optional[np.ndarray] = None) -> np.ndarray:
+    """(a - b) / (a + b) в float32 без полноразмерных временных массивов"""
+    if out is None:
+        out = np.empty(band_a.shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(band_a.shape, dtype=np.float32)
+    np.subtract(band_a, band_b, out=out, dtype=np.float32)
+    np.add(band_a, band_b, out=scratch, dtype=np.float32)
+    scratch += EPS
+    np.divide(out, scratch, out=out)
+    return np.clip(out, -1, 1, out=out)
+
+def apply_ndvi(red_band: np.ndarray, nir_band: np.ndarray,
+               out: Optional[np.ndarray] = None) -> np.ndarray:
     """Вычисление NDVI (Normalized Difference Vegetation Index)"""
-    ndvi = (nir_band - red_band) / (nir_band + red_band + 1e-7)
-    return np.clip(ndvi, -1, 1)
\ No newline at end of file
+    return normalized_difference(nir_band, red_band, out=out)
+
+
+class IndexEngine:
+    """
+    Расчёт нескольких спектральных индексов за один проход
+
+    Снимок обходится полосами по tile_rows строк; каждая полоса каналов читается
+    один раз и используется для всех запрошенных индексов. Буферы float32 размером
+    в одну полосу переиспользуются между полосами.
+    """
+
+    def __init__(self, band_map: Union[str, Dict[str, int]] = 'rgb', tile_rows: int = 256):
+        self.band_map = BAND_MAPS[band_map] if isinstance(band_map, str) else band_map
+        self.tile_rows = tile_rows
+
+    def available_indices(self) -> List[str]:
+        return [name for name, (a, b) in NORMALIZED_DIFFERENCE_INDICES.items()
+                if a in self.band_map and b in self.band_map]
+
+    def _resolve(self, indices: Sequence[str]) -> List[Tuple[str, int, int]]:
+        resolved = []
+        for name in indices:
+            if name not in NORMALIZED_DIFFERENCE_INDICES:
+                raise ValueError(f"Unknown index: {name}")
+            band_a, band_b = NORMALIZED_DIFFERENCE_INDICES[name]
+            if band_a not in self.band_map or band_b not in self.band_map:
+                raise ValueError(f"Index '{name}' needs bands '{band_a}' and '{band_b}'")
+            resolved.append((name, self.band_map[band_a], self.band_map[band_b]))
+        return resolved
+
+    def iter_tiles(self, image: np.ndarray, indices: Sequence[str]) -> Iterator[Tuple[slice, Dict[str, np.ndarray]]]:
+        """
+        Индексы по полосам строк: (срез строк, {индекс: массив полосы})
+
+        Массивы - представления общих буферов и действительны до следующей итерации.
+        """
+        resolved = self._resolve(indices)
+        height, width = image.shape[:2]
+        rows = min(self.tile_rows, height)
+        buffers = {name: np.empty((rows, width), dtype=np.float32) for name, _, _ in resolved}
+        scratch = np.empty((rows, width), dtype=np.float32)
+
+        for y in range(0, height, rows):
+            strip = image[y:y + rows]
+            n = strip.shape[0]
+            tile = {}
+            for name, band_a, band_b in resolved:
+                tile[name] = normalized_difference(
+                    strip[..., band_a], strip[..., band_b],
+                    out=buffers[name][:n], scratch=scratch[:n]
+                )
+            yield slice(y, y + n), tile
+
+    def compute(self, image: np.ndarray, indices: Sequence[str],
+                out: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+        """Полноразмерные карты индексов (float32), можно передать готовые буферы out"""
+        resolved = self._resolve(indices)
+        height, width = image.shape[:2]
+        out = dict(out or {})
+        for name, _, _ in resolved:
+            if name not in out:
+                out[name] = np.empty((height, width), dtype=np.float32)
+
+        scratch = np.empty((min(self.tile_rows, height), width), dtype=np.float32)
+        for y in range(0, height, self.tile_rows):
+            strip = image[y:y + self.tile_rows]
+            n = strip.shape[0]
+            for name, band_a, band_b in resolved:
+                normalized_difference(strip[..., band_a], strip[..., band_b],
+                                      out=out[name][y:y + n], scratch=scratch[:n])
+        return out
+
+    def tile_stats(self, image: np.ndarray, indices: Sequence[str], tile_size: int = 256) -> List[Dict]:
+        """Статистика индексов по квадратным тайлам tile_size x tile_size"""
+        engine = IndexEngine(self.band_map, tile_rows=tile_size)
+        width = image.shape[1]
+        stats = []
+        for rows, tile in engine.iter_tiles(image, indices):
+            for x in range(0, width, tile_size):
+                entry = {'bbox': (x, rows.start, min(x + tile_size, width), rows.stop)}
+                for name, values in tile.items():
+                    cell = values[:, x:x + tile_size]
+                    entry[name] = {
+                        'mean': float(cell.mean()),
+                        'min': float(cell.min()),
+                        'max': float(cell.max())
+                    }
+                stats.append(entry)
+        return stats
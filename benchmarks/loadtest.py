@@ -0,0 +1,299 @@
+"""
+Нагрузочный тест API с перцентилями задержек по маршрутам
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.loadtest                         # приложение в процессе (ASGI)
+    python -m benchmarks.loadtest --url http://localhost:8000 --concurrency 64
+    python -m benchmarks.loadtest --duration 30 --mix anomalies=5,upload=0 --output report.json
+
+В процессе запросы идут через httpx.ASGITransport в app из app/main.py (со
+startup/shutdown), вместе с ними замеряется задержка event loop: таймер на
+10 мс, опоздания которого показывают блокирующий код в async-обработчиках.
+Отчёт - JSON с p50/p95/p99, пропускной способностью и долей ошибок по
+маршрутам, его удобно сравнивать между сборками.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import httpx
+import numpy as np
+
+COUNTRIES = ["Россия", "Германия", "Испания", "США", "Китай"]
+
+# Сценарии: имя -> вес по умолчанию
+DEFAULT_MIX = {
+    "anomalies": 4,
+    "global_countries": 2,
+    "global_fires": 2,
+    "global_search": 2,
+    "images": 2,
+    "stats": 1,
+    "upload": 1,
+    "analysis": 1,
+}
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p95_ms": to_ms(percentile(values, 95)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "max_ms": to_ms(values[-1] if values else None),
+        "mean_ms": to_ms(sum(values) / len(values) if values else None)
+    }
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+
+    def add(self, seconds: float, status: Optional[int], ok: bool) -> None:
+        self.latencies.append(seconds)
+        key = str(status) if status is not None else "exception"
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def report(self, elapsed: float) -> Dict:
+        total = len(self.latencies)
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else None,
+            "statuses": self.statuses,
+            **summarize(self.latencies)
+        }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, int], seed: int):
+        self.client = client
+        self.mix = {name: weight for name, weight in mix.items() if weight > 0}
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, RouteStats] = {}
+        self.image_ids: List[int] = []
+        self.upload_payload = self._make_upload(seed)
+        self.scenarios: Dict[str, Callable] = {
+            "anomalies": self.get_anomalies,
+            "global_countries": lambda: self.request("GET /api/global/countries", "GET", "/api/global/countries"),
+            "global_fires": lambda: self.request("GET /api/global/fires", "GET", "/api/global/fires",
+                                                 params={"country": self.rng.choice(COUNTRIES)}),
+            "global_search": lambda: self.request("GET /api/global/search/{country}", "GET",
+                                                  f"/api/global/search/{self.rng.choice(COUNTRIES)}"),
+            "images": self.get_images,
+            "stats": lambda: self.request("GET /api/analysis/stats", "GET", "/api/analysis/stats"),
+            "upload": self.upload,
+            "analysis": self.analysis,
+        }
+        unknown = set(self.mix) - set(self.scenarios)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    @staticmethod
+    def _make_upload(seed: int) -> bytes:
+        rng = np.random.default_rng(seed)
+        image = rng.integers(0, 256, size=(256, 256, 3), dtype=np.uint8)
+        ok, encoded = cv2.imencode(".png", image)
+        return encoded.tobytes()
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        stats = self.stats.setdefault(route, RouteStats())
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            stats.add(time.perf_counter() - started, None, False)
+            return None
+        stats.add(time.perf_counter() - started, response.status_code, response.status_code < 400)
+        return response
+
+    async def get_anomalies(self):
+        params = {"min_confidence": self.rng.choice([0.5, 0.6, 0.7, 0.8])}
+        if self.rng.random() < 0.5:
+            params["anomaly_type"] = self.rng.choice(["fire", "deforestation", "dump", "construction", "flood"])
+        await self.request("GET /api/anomalies/", "GET", "/api/anomalies/", params=params)
+
+    async def get_images(self):
+        response = await self.request("GET /api/images/", "GET", "/api/images/")
+        if response is not None and response.status_code == 200 and not self.image_ids:
+            self.image_ids = [image["id"] for image in response.json()][:50]
+
+    async def upload(self):
+        files = {"file": ("loadtest.png", self.upload_payload, "image/png")}
+        response = await self.request("POST /api/images/upload", "POST", "/api/images/upload", files=files)
+        if response is not None and response.status_code == 200:
+            self.image_ids.append(response.json()["id"])
+
+    async def analysis(self):
+        if not self.image_ids:
+            await self.get_images()
+        if not self.image_ids:
+            return
+        payload = {"image_id": self.rng.choice(self.image_ids)}
+        if len(self.image_ids) > 1 and self.rng.random() < 0.5:
+            payload["reference_id"] = self.rng.choice(self.image_ids)
+        await self.request("POST /api/analysis/jobs", "POST", "/api/analysis/jobs", json=payload)
+
+    async def worker(self, deadline: float, budget: List[int]) -> None:
+        names, weights = zip(*self.mix.items())
+        while time.perf_counter() < deadline:
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+            await self.scenarios[self.rng.choices(names, weights)[0]]()
+
+    async def run(self, concurrency: int, duration: float, max_requests: int) -> float:
+        deadline = time.perf_counter() + duration
+        budget = [max_requests if max_requests > 0 else sys.maxsize]
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(deadline, budget) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> List[float]:
+    """Опоздания таймера event loop (блокирующий код в async-обработчиках)"""
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+    return lags
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, value.split(",")):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+async def run_load_test(args) -> Dict:
+    mix = parse_mix(args.mix)
+    lags: List[float] = []
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            test = LoadTest(client, mix, args.seed)
+            await client.get("/health")  # соединение и прогрев
+            elapsed = await test.run(args.concurrency, args.duration, args.requests)
+    else:
+        # База, загрузки и производные данные - во временном каталоге, а не в
+        # рабочих data/ и geo_anomaly.db (настройки - до импорта приложения)
+        workdir = tempfile.TemporaryDirectory(prefix="geo-loadtest-")
+        os.environ.setdefault("JOB_WORKERS", str(args.job_workers))
+        from app.core.config import settings
+        settings.JOB_WORKERS = args.job_workers
+        settings.DATABASE_PATH = os.path.join(workdir.name, "geo_anomaly.db")
+        settings.UPLOAD_DIR = os.path.join(workdir.name, "raw")
+        settings.PROCESSED_DIR = os.path.join(workdir.name, "processed")
+        settings.PROFILE_DIR = os.path.join(workdir.name, "profiles")
+        from app.core.databace import engine
+        from app.main import app
+        # Эхо SQL в консоль - отладочная настройка, в замер её не включаем
+        engine.echo = args.sql_echo
+
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+                    test = LoadTest(client, mix, args.seed)
+                    stop = asyncio.Event()
+                    lag_task = asyncio.create_task(measure_loop_lag(stop))
+                    elapsed = await test.run(args.concurrency, args.duration, args.requests)
+                    stop.set()
+                    lags = await lag_task
+        finally:
+            engine.dispose()
+            workdir.cleanup()
+
+    routes = {route: stats.report(elapsed) for route, stats in sorted(test.stats.items())}
+    all_latencies = [v for stats in test.stats.values() for v in stats.latencies]
+    total = len(all_latencies)
+    errors = sum(stats.errors for stats in test.stats.values())
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": args.url or "in-process",
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"concurrency": args.concurrency, "duration": args.duration,
+                   "requests": args.requests, "mix": mix, "seed": args.seed},
+        "elapsed_s": round(elapsed, 3),
+        "total": {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else None,
+            **summarize(all_latencies)
+        },
+        "routes": routes
+    }
+    if lags:
+        report["event_loop_lag"] = summarize(lags)
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f"\nЦель: {report['target']}, {report['elapsed_s']} с, "
+          f"конкурентность {report['config']['concurrency']}")
+    header = f"{'маршрут':<36} {'запр.':>7} {'ош.%':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["routes"].items()) + [("ВСЕГО", report["total"])]
+    for route, stats in rows:
+        print(f"{route:<36} {stats['requests']:>7} {stats['error_rate'] * 100:>6.2f} "
+              f"{stats['throughput_rps'] or 0:>8.1f} {stats['p50_ms'] or 0:>9.2f} "
+              f"{stats['p95_ms'] or 0:>9.2f} {stats['p99_ms'] or 0:>9.2f}")
+    if "event_loop_lag" in report:
+        lag = report["event_loop_lag"]
+        print(f"\nЗадержка event loop: p50 {lag['p50_ms']} мс, p99 {lag['p99_ms']} мс, max {lag['max_ms']} мс")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API")
+    parser.add_argument("--url", help="адрес запущенного сервера (по умолчанию - app в процессе)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд")
+    parser.add_argument("--requests", type=int, default=0, help="лимит запросов (0 - без лимита)")
+    parser.add_argument("--mix", default="", help="веса сценариев: anomalies=4,upload=0,...")
+    parser.add_argument("--job-workers", type=int, default=0,
+                        help="воркеры очереди задач в процессе (0 - задачи только ставятся в очередь)")
+    parser.add_argument("--sql-echo", action="store_true", help="не отключать эхо SQL (в процессе)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON-отчёт")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load_test(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Бенчмарки пайплайна анализа и хранилищ на синтетических данных
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run                      # размеры 1, 4, 16 МП
+    python -m benchmarks.run --sizes 1,16,64,128  # до 100+ МП
+    python -m benchmarks.run --save-baseline      # записать baseline.json
+    python -m benchmarks.run --only detect        # только подходящие бенчмарки
+
+Для каждого бенчмарка печатаются медианное время, пропускная способность и
+пиковый RSS, для каждой серии - показатель масштабирования (наклон log-log).
+Результат сравнивается с baseline-файлом: замедление больше --threshold
+считается регрессией, и процесс завершается с кодом 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.change_detect import ChangeDetector
+from app.services.classifier import AnomalyClassifier
+from app.services.geo_mapper import GeoMapper
+from app.services.global_data import GlobalAnomalyDatabase
+from app.services.image_loader import ImageLoader, image_cache
+from app.services.raster_store import raster_store
+
+from benchmarks.synthetic import make_global_records, make_regions, make_scene_pair, write_scene
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class RssSampler:
+    """Пиковый RSS процесса за время замера (опрос /proc/self/statm в фоне)"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self) -> int:
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * self._page
+        except (OSError, ValueError, IndexError):
+            # Не Linux: пик за всё время процесса
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def measure(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None,
+            min_time: float = 0.25, max_repeat: int = 50) -> Dict:
+    """
+    Медиана и минимум времени fn, пиковый RSS
+
+    Не меньше repeat прогонов; короткие операции повторяются, пока суммарное
+    время не достигнет min_time (но не больше max_repeat раз) - иначе шум.
+    """
+    times = []
+    with RssSampler() as rss:
+        while len(times) < repeat or (sum(times) < min_time and len(times) < max_repeat):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+    return {
+        "seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1)
+    }
+
+
+class BenchmarkSuite:
+    def __init__(self, args):
+        self.args = args
+        self.results: List[Dict] = []
+        self.workdir = tempfile.mkdtemp(prefix="geo-bench-")
+        # Транскодированные снимки - во временный каталог, а не в data/processed
+        raster_store.root = os.path.join(self.workdir, "rasters")
+
+    def selected(self, name: str) -> bool:
+        return not self.args.only or any(part in name for part in self.args.only.split(","))
+
+    def record(self, name: str, size: float, unit: str, items: float, item_unit: str, stats: Dict) -> None:
+        entry = {
+            "name": name,
+            "size": size,
+            "size_unit": unit,
+            **stats,
+            "throughput": round(items / stats["seconds"], 3) if stats["seconds"] > 0 else None,
+            "throughput_unit": f"{item_unit}/s"
+        }
+        self.results.append(entry)
+        print(f"  {name:<36} {size:>9g} {unit:<7} {stats['seconds'] * 1000:>10.2f} ms "
+              f"{entry['throughput'] or 0:>14.2f} {item_unit}/s  rss {stats['peak_rss_mb']:>8.1f} MB")
+
+    def run_scene_benchmarks(self) -> None:
+        detector = ChangeDetector(threshold=25, min_area=50)
+        classifier = AnomalyClassifier()
+
+        for megapixels in self.args.sizes:
+            before, after, changes = make_scene_pair(megapixels, self.args.density, self.args.seed)
+            height, width = before.shape[:2]
+            actual_mp = height * width / 1e6
+            print(f"\nСцена {width}x{height} ({actual_mp:.1f} МП), изменений: {changes}")
+
+            path = write_scene(os.path.join(self.workdir, f"scene_{megapixels:g}.png"), after)
+            repeat = self.args.repeat
+
+            if self.selected("load_image.decode"):
+                def cold():
+                    image_cache.clear()
+                    settings.RASTER_STORE_ENABLED = False
+                stats = measure(lambda: ImageLoader.load_image(path), repeat, setup=cold)
+                settings.RASTER_STORE_ENABLED = True
+                self.record("load_image.decode", megapixels, "MP", actual_mp, "MP", stats)
+
+            if self.selected("load_image.store"):
+                image_cache.clear()
+                ImageLoader.load_image(path)  # транскодирование в хранилище тайлов
+                stats = measure(lambda: ImageLoader.load_image(path), repeat, setup=image_cache.clear)
+                self.record("load_image.store", megapixels, "MP", actual_mp, "MP", stats)
+
+            if self.selected("load_image.memory"):
+                ImageLoader.load_image(path)
+                stats = measure(lambda: ImageLoader.load_image(path), repeat)
+                self.record("load_image.memory", megapixels, "MP", actual_mp, "MP", stats)
+            image_cache.clear()
+
+            mask = detector.detect_changes(after, before)
+            if self.selected("detect_changes"):
+                stats = measure(lambda: detector.detect_changes(after, before), repeat)
+                self.record("detect_changes", megapixels, "MP", actual_mp, "MP", stats)
+
+            if self.selected("find_anomaly_regions"):
+                regions = detector.find_anomaly_regions(mask)
+                stats = measure(lambda: detector.find_anomaly_regions(mask), repeat)
+                self.record("find_anomaly_regions", megapixels, "MP", actual_mp, "MP", stats)
+                print(f"  {'':<36} регионов: {len(regions)}")
+
+            if self.selected("classify") and megapixels == self.args.sizes[0]:
+                random.seed(self.args.seed)
+                regions = make_regions(self.args.regions, (height, width), self.args.seed)
+                stats = measure(lambda: [classifier.classify(after, r) for r in regions], repeat)
+                self.record("classify", self.args.regions, "regions", self.args.regions, "regions", stats)
+
+            del before, after, mask
+
+    def run_geo_benchmarks(self) -> None:
+        count = self.args.points
+        if not (self.selected("geo_mapper.pixel_to_geo") or self.selected("geo_mapper.bbox_to_geo")):
+            return
+        print("\nGeoMapper")
+        mapper = GeoMapper((10000, 10000))
+        rng = np.random.default_rng(self.args.seed)
+        points = rng.uniform(0, 10000, size=(count, 2)).tolist()
+        bboxes = [(x, y, x + 50, y + 50) for x, y in points]
+
+        if self.selected("geo_mapper.pixel_to_geo"):
+            stats = measure(lambda: [mapper.pixel_to_geo(x, y) for x, y in points], self.args.repeat)
+            self.record("geo_mapper.pixel_to_geo", count, "points", count, "points", stats)
+        if self.selected("geo_mapper.bbox_to_geo"):
+            stats = measure(lambda: [mapper.bbox_to_geo(b) for b in bboxes], self.args.repeat)
+            self.record("geo_mapper.bbox_to_geo", count, "bboxes", count, "bboxes", stats)
+
+    def run_global_db_benchmarks(self) -> None:
+        queries = {
+            "search_by_country": lambda db: db.search_by_country("Россия", 2023),
+            "search_by_coordinates": lambda db: db.search_by_coordinates(55.7558, 37.6173, 100),
+            "get_country_stats": lambda db: db.get_country_stats("Россия"),
+            "get_time_range_stats": lambda db: db.get_time_range_stats("2022-01-01", "2022-12-31"),
+            "get_fire_stats": lambda db: db.get_fire_stats(),
+            "get_recent_anomalies": lambda db: db.get_recent_anomalies(30),
+        }
+        queries = {name: fn for name, fn in queries.items() if self.selected(f"global_db.{name}")}
+        if not queries:
+            return
+
+        db = GlobalAnomalyDatabase()
+        for count in self.args.records:
+            print(f"\nGlobalAnomalyDatabase: {count} записей")
+            db.historical_data = make_global_records(count, db.countries, self.args.seed)
+            for name, query in queries.items():
+                stats = measure(lambda: query(db), self.args.repeat)
+                self.record(f"global_db.{name}", count, "records", count, "records", stats)
+            db.historical_data = []
+
+    def scaling(self) -> Dict[str, float]:
+        """Наклон log(время) от log(размер): ~1 - линейно, >1 - хуже линейного"""
+        series: Dict[str, List] = {}
+        for entry in self.results:
+            series.setdefault(entry["name"], []).append((entry["size"], entry["seconds"]))
+        exponents = {}
+        for name, points in series.items():
+            if len(points) >= 2 and all(s > 0 and t > 0 for s, t in points):
+                sizes, seconds = zip(*points)
+                slope = np.polyfit(np.log(sizes), np.log(seconds), 1)[0]
+                exponents[name] = round(float(slope), 3)
+        return exponents
+
+
+def machine_info() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+
+def result_key(entry: Dict) -> str:
+    return f"{entry['name']}@{entry['size']:g}"
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    Сравнение с baseline по минимальному времени (устойчивее медианы к фоновой
+    нагрузке): список бенчмарков, замедлившихся больше порога
+    """
+    regressions = []
+    reference = baseline.get("results", {})
+    print(f"\nСравнение с baseline (порог +{threshold:.0%}):")
+    for entry in results:
+        key = result_key(entry)
+        if key not in reference:
+            continue
+        before, current = reference[key]["min_seconds"], entry["min_seconds"]
+        ratio = current / before if before > 0 else 1.0
+        # Доли микросекунды (попадание в кэш) - ниже разрешения замера
+        if before < 5e-5:
+            ratio = 1.0
+        status = "РЕГРЕССИЯ" if ratio > 1 + threshold else "ок"
+        print(f"  {key:<48} {before * 1000:>10.2f} -> {current * 1000:>10.2f} ms  x{ratio:.2f}  {status}")
+        if ratio > 1 + threshold:
+            regressions.append({"benchmark": key, "baseline": before, "current": current, "ratio": round(ratio, 3)})
+    return regressions
+
+
+def parse_list(value: str, cast=float) -> List:
+    return [cast(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки пайплайна анализа")
+    parser.add_argument("--sizes", type=lambda v: parse_list(v, float), default=[1, 4, 16],
+                        help="размеры сцен в мегапикселях через запятую")
+    parser.add_argument("--density", type=float, default=0.02, help="доля площади с изменениями")
+    parser.add_argument("--records", type=lambda v: parse_list(v, int), default=[10000, 100000],
+                        help="размеры глобальной базы аномалий через запятую")
+    parser.add_argument("--regions", type=int, default=10000, help="регионов для классификатора")
+    parser.add_argument("--points", type=int, default=100000, help="точек для GeoMapper")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default="", help="подстроки имён бенчмарков через запятую")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+    parser.add_argument("--output", help="JSON-отчёт")
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(args)
+    try:
+        suite.run_scene_benchmarks()
+        suite.run_geo_benchmarks()
+        suite.run_global_db_benchmarks()
+    finally:
+        shutil.rmtree(suite.workdir, ignore_errors=True)
+
+    exponents = suite.scaling()
+    if exponents:
+        print("\nМасштабирование (наклон log-log):")
+        for name, slope in sorted(exponents.items()):
+            print(f"  {name:<36} {slope:>6.2f}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": machine_info(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "output", "save_baseline")},
+        "results": {result_key(entry): entry for entry in suite.results},
+        "scaling": exponents
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print("\n⚠️ baseline снят на другой машине - сравнение ориентировочное")
+        regressions = compare(suite.results, baseline, args.threshold)
+        report["regressions"] = regressions
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline записан: {args.baseline}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print(f"\n❌ Регрессий: {len(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Синтетические данные для бенчмарков: пары снимков и записи глобальной базы
+
+Всё генерируется из seed, поэтому прогоны на разных сборках сравнимы.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+ANOMALY_TYPES = ['fire', 'deforestation', 'dump', 'construction', 'flood']
+
+# Фиксированный диапазон дат записей: набор не зависит от дня запуска
+RECORDS_START = datetime(2020, 1, 1)
+RECORDS_END = datetime(2026, 10, 19)
+
+
+def scene_shape(megapixels: float, aspect: float = 1.5) -> Tuple[int, int]:
+    """(высота, ширина) снимка заданного размера в мегапикселях"""
+    height = int(round((megapixels * 1_000_000 / aspect) ** 0.5))
+    width = int(round(height * aspect))
+    return height, width
+
+
+def make_scene_pair(megapixels: float, change_density: float = 0.02,
+                    seed: int = 0) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Пара снимков RGB uint8 (до, после) и число внесённых изменений
+
+    Фон - сглаженный шум с низкочастотной текстурой (апскейл маленького шума),
+    изменения - прямоугольники и эллипсы другого цвета, покрывающие примерно
+    change_density площади снимка. Между снимками есть слабый сенсорный шум.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = scene_shape(megapixels)
+
+    coarse = rng.integers(40, 200, size=(max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    before = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    fine = rng.integers(-6, 7, size=(max(2, height // 4), max(2, width // 4), 3), dtype=np.int16)
+    before = np.clip(before + cv2.resize(fine, (width, height), interpolation=cv2.INTER_NEAREST), 0, 255).astype(np.uint8)
+
+    after = before.copy()
+    noise = rng.integers(-3, 4, size=(max(2, height // 8), max(2, width // 8), 3), dtype=np.int16)
+    after = np.clip(after + cv2.resize(noise, (width, height), interpolation=cv2.INTER_NEAREST), 0, 255).astype(np.uint8)
+
+    target_area = change_density * height * width
+    side = max(8, int(min(height, width) * 0.02))
+    changed, count = 0, 0
+    while changed < target_area:
+        w = int(rng.integers(side // 2, side * 2))
+        h = int(rng.integers(side // 2, side * 2))
+        x = int(rng.integers(0, max(1, width - w)))
+        y = int(rng.integers(0, max(1, height - h)))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        if count % 2:
+            cv2.ellipse(after, (x + w // 2, y + h // 2), (w // 2, h // 2), 0, 0, 360, color, -1)
+        else:
+            cv2.rectangle(after, (x, y), (x + w, y + h), color, -1)
+        changed += w * h
+        count += 1
+
+    return before, after, count
+
+
+def write_scene(path: str, image: np.ndarray) -> str:
+    """Запись снимка в PNG (быстрое сжатие) в формате, который читает ImageLoader"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    return path
+
+
+def make_regions(count: int, image_shape: Tuple[int, int], seed: int = 0) -> List[Dict]:
+    """Регионы в формате ChangeDetector.find_anomaly_regions"""
+    rng = np.random.default_rng(seed)
+    height, width = image_shape
+    regions = []
+    for _ in range(count):
+        w, h = int(rng.integers(4, 64)), int(rng.integers(4, 64))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        regions.append({'bbox': (x, y, x + w, y + h), 'area': float(w * h), 'center': (x + w // 2, y + h // 2)})
+    return regions
+
+
+def make_global_records(count: int, countries: Dict[str, Dict], seed: int = 0,
+                        end: datetime = RECORDS_END) -> List[Dict]:
+    """Записи в формате GlobalAnomalyDatabase.historical_data (даты - с RECORDS_START по end)"""
+    rng = np.random.default_rng(seed)
+    names = list(countries)
+    start = RECORDS_START
+    days = (end - start).days
+
+    country_idx = rng.integers(0, len(names), size=count)
+    type_idx = rng.integers(0, len(ANOMALY_TYPES), size=count)
+    offsets = rng.uniform(-5, 5, size=(count, 2))
+    confidence = np.round(rng.uniform(0.5, 0.95, size=count), 2)
+    day_offsets = rng.integers(0, days + 1, size=count)
+    area = rng.integers(1, 1000, size=count)
+
+    records = []
+    for i in range(count):
+        country = names[country_idx[i]]
+        info = countries[country]
+        date = start + timedelta(days=int(day_offsets[i]))
+        records.append({
+            'id': i + 1,
+            'country': country,
+            'region': info['regions'][i % len(info['regions'])],
+            'anomaly_type': ANOMALY_TYPES[type_idx[i]],
+            'latitude': info['coords'][0] + float(offsets[i, 0]),
+            'longitude': info['coords'][1] + float(offsets[i, 1]),
+            'confidence': float(confidence[i]),
+            'description': f'Синтетическая аномалия {i + 1}',
+            'date': date.strftime('%Y-%m-%d'),
+            'year': date.year,
+            'month': date.month,
+            'day': date.day,
+            'area_ha': int(area[i]),
+            'severity': ('low', 'medium', 'high')[i % 3],
+            'status': ('active', 'resolved', 'monitoring')[i % 3]
+        })
+    return records
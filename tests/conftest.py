@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+# БД и производные данные тестов - во временном каталоге; настройки
+# меняются до импорта databace, который создаёт engine по DATABASE_PATH
+TEST_DIR = tempfile.mkdtemp(prefix="geo-anomaly-tests-")
+settings.DATABASE_PATH = os.path.join(TEST_DIR, "test.db")
+settings.PROCESSED_DIR = os.path.join(TEST_DIR, "processed")
+settings.JOB_WORKERS = 0
+settings.PRELOAD_ANALYSIS = False
+
+from app.core import databace
+
+databace.engine.echo = False
+
+import app.models.image  # noqa: E402,F401
+import app.models.anomaly  # noqa: E402,F401
+import app.models.job  # noqa: E402,F401
+
+databace.Base.metadata.create_all(bind=databace.engine)
+
+
+@pytest.fixture
+def db():
+    """Сессия БД; таблицы очищаются после теста"""
+    session = databace.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        for table in reversed(databace.Base.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.commit()
+        session.close()
@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.admission import (AdmissionController, AdmissionControlMiddleware, CostClass,
+                                batch_request_slots, batch_slots)
+from app.core.config import settings
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_slots_are_held_until_release():
+    async def scenario():
+        heavy = CostClass("heavy", limit=4, max_queue=0, timeout=0)
+        assert await heavy.acquire(3)
+        assert heavy.used == 3 and heavy.active == 1
+        assert not await heavy.acquire(2)
+        assert await heavy.acquire(1)
+        assert heavy.used == 4
+
+        await heavy.release(0.1, 3)
+        await heavy.release(0.1, 1)
+        return heavy
+
+    heavy = run(scenario())
+    assert (heavy.used, heavy.active, heavy.admitted, heavy.rejected) == (0, 0, 2, 1)
+
+
+def test_request_larger_than_limit_takes_whole_class():
+    async def scenario():
+        heavy = CostClass("heavy", limit=2, max_queue=0, timeout=0)
+        assert await heavy.acquire(10)
+        used = heavy.used
+        await heavy.release(0.1, 10)
+        return used, heavy.used
+
+    assert run(scenario()) == (2, 0)
+
+
+def test_waiter_is_admitted_after_release():
+    async def scenario():
+        heavy = CostClass("heavy", limit=1, max_queue=1, timeout=5)
+        assert await heavy.acquire()
+        waiter = asyncio.ensure_future(heavy.acquire())
+        await asyncio.sleep(0.01)
+        assert heavy.waiting == 1
+        await heavy.release(0.1)
+        assert await waiter
+        return heavy.used, heavy.waiting
+
+    assert run(scenario()) == (1, 0)
+
+
+def test_queue_timeout_rejects():
+    async def scenario():
+        heavy = CostClass("heavy", limit=1, max_queue=1, timeout=0.05)
+        assert await heavy.acquire()
+        return await heavy.acquire(), heavy.waiting
+
+    assert run(scenario()) == (False, 0)
+
+
+def test_batch_slots_default_to_pool_size(monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_WORKERS", 3)
+    monkeypatch.setattr(settings, "ADMISSION_HEAVY_LIMIT", 2)
+
+    assert batch_slots() == 2
+    assert batch_slots(0) == 1
+
+
+@pytest.mark.parametrize("body, slots", [
+    ({"workers": 0}, 1),
+    ({"workers": 1}, 1),
+    ({"workers": 2}, 2),
+    ({}, 3),
+    ({"workers": 99}, 4),
+    ({"workers": "many"}, 3),
+])
+def test_batch_slots_follow_requested_workers(monkeypatch, body, slots):
+    monkeypatch.setattr(settings, "BATCH_WORKERS", 3)
+    monkeypatch.setattr(settings, "ADMISSION_HEAVY_LIMIT", 4)
+
+    assert batch_request_slots(body) == slots
+
+
+def call_middleware(middleware, method, path, body=b""):
+    """Запрос через ASGI middleware (тело приходит двумя частями); возвращает статус ответа"""
+    chunks = [body[:3], body[3:]]
+    sent = []
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    run(middleware({"type": "http", "method": method, "path": path, "headers": []}, receive, send))
+    return sent[0]["status"]
+
+
+def test_middleware_charges_body_dependent_slots(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_HEAVY_LIMIT", 4)
+    controller = AdmissionController([CostClass("heavy", limit=4, max_queue=0, timeout=0)])
+    seen = {}
+
+    async def app(scope, receive, send):
+        message = await receive()
+        seen["body"] = message["body"]
+        seen["used"] = controller.classes["heavy"].used
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionControlMiddleware(app, [
+        ("POST", r"/api/analysis/batch", "heavy", batch_request_slots),
+        ("POST", r"/api/analysis/sweep", "heavy"),
+    ], controller=controller)
+
+    body = json.dumps({"image_ids": [1, 2], "workers": 2}).encode()
+    assert call_middleware(middleware, "POST", "/api/analysis/batch", body) == 200
+    assert seen == {"body": body, "used": 2}
+
+    assert call_middleware(middleware, "POST", "/api/analysis/sweep") == 200
+    assert seen["used"] == 1
+    assert controller.classes["heavy"].used == 0
+
+
+def test_middleware_rejects_when_class_is_full():
+    controller = AdmissionController([CostClass("heavy", limit=1, max_queue=0, timeout=0)])
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionControlMiddleware(app, [("POST", r"/heavy", "heavy")], controller=controller)
+    run(controller.classes["heavy"].acquire())
+
+    assert call_middleware(middleware, "POST", "/heavy") == 429
+    assert call_middleware(middleware, "GET", "/heavy") == 200
@@ -0,0 +1,117 @@
+import threading
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.databace import SessionLocal
+from app.models.job import AnalysisJob
+from app.services import job_queue
+from app.services.job_queue import DONE, FAILED, QUEUED, RUNNING
+
+
+def test_claim_order_and_attempts(db):
+    low = job_queue.enqueue(db, "simulate", {"n": 1})
+    high = job_queue.enqueue(db, "simulate", {"n": 2}, priority=5)
+
+    first = job_queue.claim_next(db, "w1")
+    second = job_queue.claim_next(db, "w2")
+
+    assert (first.id, second.id) == (high.id, low.id)
+    assert first.status == RUNNING and first.worker == "w1"
+    assert first.attempts == 1
+    assert first.heartbeat_at is not None
+    assert job_queue.claim_next(db, "w3") is None
+
+
+def test_claim_skips_delayed_jobs(db):
+    job = job_queue.enqueue(db, "simulate")
+    job.available_at = datetime.now() + timedelta(hours=1)
+    db.commit()
+
+    assert job_queue.claim_next(db, "w1") is None
+
+
+def test_concurrent_claims_get_distinct_jobs(db):
+    jobs = [job_queue.enqueue(db, "simulate", {"n": n}) for n in range(20)]
+    claimed = []
+    claimed_lock = threading.Lock()
+
+    def claim_all(name):
+        session = SessionLocal()
+        try:
+            while True:
+                job = job_queue.claim_next(session, name)
+                if job is None:
+                    return
+                with claimed_lock:
+                    claimed.append(job.id)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=claim_all, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job.id for job in jobs)
+
+
+def test_dedupe_returns_pending_job(db):
+    first = job_queue.enqueue(db, "simulate", {"image_id": 1}, dedupe=True)
+    second = job_queue.enqueue(db, "simulate", {"image_id": 1}, dedupe=True)
+
+    assert first.id == second.id
+
+
+def test_fail_retries_then_gives_up(db):
+    job_queue.enqueue(db, "simulate", max_attempts=2)
+
+    job = job_queue.claim_next(db, "w1")
+    job_queue.fail(db, job, "boom")
+    assert job.status == QUEUED
+    assert job.available_at > datetime.now()
+
+    job.available_at = None
+    db.commit()
+    job = job_queue.claim_next(db, "w1")
+    job_queue.fail(db, job, "boom")
+    assert job.status == FAILED
+    assert job.attempts == 2
+
+
+def test_run_job_completes(db, monkeypatch):
+    monkeypatch.setitem(job_queue.HANDLERS, "echo", lambda params: {"echo": params})
+    job_queue.enqueue(db, "echo", {"x": 1})
+
+    job = job_queue.claim_next(db, "w1")
+    job_queue.run_job(db, job)
+
+    assert job.status == DONE
+    assert '"x": 1' in job.result
+
+
+def test_requeue_stale_uses_heartbeat(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_STALE_SECONDS", 60)
+    old = datetime.now() - timedelta(hours=2)
+    alive = AnalysisJob(kind="simulate", status=RUNNING, attempts=1, max_attempts=3,
+                        started_at=old, heartbeat_at=datetime.now())
+    lost = AnalysisJob(kind="simulate", status=RUNNING, attempts=1, max_attempts=3,
+                       started_at=old, heartbeat_at=old)
+    exhausted = AnalysisJob(kind="simulate", status=RUNNING, attempts=3, max_attempts=3,
+                            started_at=old)
+    db.add_all([alive, lost, exhausted])
+    db.commit()
+
+    assert job_queue.requeue_stale(db) == {"requeued": 1, "failed": 1}
+    db.expire_all()
+    assert alive.status == RUNNING
+    assert lost.status == QUEUED and lost.worker is None
+    assert exhausted.status == FAILED
+
+
+def test_heartbeat_only_for_owner(db):
+    job_queue.enqueue(db, "simulate")
+    job = job_queue.claim_next(db, "w1")
+
+    assert job_queue.heartbeat(job.id, "w1")
+    assert not job_queue.heartbeat(job.id, "w2")
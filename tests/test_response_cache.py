@@ -0,0 +1,90 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.response_cache import ResponseCacheMiddleware, bump_data_version
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(calls):
+    async def countries(request):
+        calls.append(dict(request.query_params))
+        return JSONResponse({"calls": len(calls), "query": dict(request.query_params)})
+
+    async def missing(request):
+        calls.append({})
+        return JSONResponse({"detail": "not found"}, status_code=404)
+
+    app = Starlette(routes=[
+        Route("/api/global/countries", countries),
+        Route("/api/global/missing", missing),
+        Route("/api/other", countries),
+    ])
+    app.add_middleware(ResponseCacheMiddleware, rules=[(r"/api/global/[a-z]+", 300)])
+    return TestClient(app)
+
+
+def test_second_request_is_served_from_cache(client, calls):
+    first = client.get("/api/global/countries")
+    second = client.get("/api/global/countries")
+
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json() == first.json()
+    assert second.headers["etag"] == first.headers["etag"]
+    assert len(calls) == 1
+
+
+def test_matching_etag_returns_304(client):
+    etag = client.get("/api/global/countries").headers["etag"]
+
+    response = client.get("/api/global/countries", headers={"If-None-Match": f'"other", {etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert "content-type" not in response.headers
+
+
+def test_stale_etag_returns_body(client):
+    client.get("/api/global/countries")
+
+    response = client.get("/api/global/countries", headers={"If-None-Match": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.json()["calls"] == 1
+
+
+def test_query_order_shares_entry(client, calls):
+    client.get("/api/global/countries?a=1&b=2")
+    response = client.get("/api/global/countries?b=2&a=1")
+
+    assert response.headers["x-cache"] == "HIT"
+    assert len(calls) == 1
+
+
+def test_data_version_invalidates(client, calls):
+    etag = client.get("/api/global/countries").headers["etag"]
+    bump_data_version()
+
+    response = client.get("/api/global/countries", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["x-cache"] == "MISS"
+    assert response.headers["etag"] != etag
+    assert len(calls) == 2
+
+
+def test_errors_and_unmatched_paths_are_not_cached(client, calls):
+    for _ in range(2):
+        assert client.get("/api/global/missing").status_code == 404
+        assert "x-cache" not in client.get("/api/other").headers
+
+    assert len(calls) == 4
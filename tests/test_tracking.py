@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from app.models.anomaly import Anomaly, AnomalyDetection
+from app.models.image import SatelliteImage
+from app.services.anomaly_feed import AnomalyBroadcaster
+from app.services.job_queue import persist_anomalies
+from app.services.tracking import AnomalyTracker
+
+OBSERVED = datetime(2026, 6, 1, 12, 0)
+
+
+def detection(lat, lon, anomaly_type="fire", confidence=0.8, size=0.01, area=100.0):
+    return {
+        "type": anomaly_type,
+        "confidence": confidence,
+        "location": {"latitude": lat, "longitude": lon},
+        "bbox_geo": {"lat_min": lat - size / 2, "lon_min": lon - size / 2,
+                     "lat_max": lat + size / 2, "lon_max": lon + size / 2},
+        "area": area,
+        "description": f"{anomaly_type} {confidence}"
+    }
+
+
+def merge(db, anomalies, observed_at=OBSERVED, image_id=1, analysis_id=None):
+    stats = AnomalyTracker(max_gap_hours=72, min_overlap=0.1).merge(
+        db, image_id, observed_at, anomalies, analysis_id)
+    db.commit()
+    return stats
+
+
+def test_repeat_detection_extends_track(db):
+    merge(db, [detection(55.0, 37.0, confidence=0.7)])
+    stats = merge(db, [detection(55.004, 37.004, confidence=0.9, area=150.0)],
+                  observed_at=OBSERVED + timedelta(hours=24), image_id=2)
+
+    assert stats == {"detections": 1, "tracks_created": 0, "tracks_updated": 1}
+    track = db.query(Anomaly).one()
+    assert track.detections == 2
+    assert track.first_seen == OBSERVED
+    assert track.last_seen == OBSERVED + timedelta(hours=24)
+    assert track.confidence == 0.9 and track.area == 150.0
+    assert 55.0 < track.latitude < 55.004
+    assert db.query(AnomalyDetection).filter(AnomalyDetection.anomaly_id == track.id).count() == 2
+
+
+def test_detections_of_one_image_merge_together(db):
+    stats = merge(db, [detection(55.0, 37.0), detection(55.002, 37.002), detection(56.0, 38.0)])
+
+    assert stats == {"detections": 3, "tracks_created": 2, "tracks_updated": 1}
+
+
+def test_other_type_place_or_time_starts_new_track(db):
+    merge(db, [detection(55.0, 37.0)])
+    merge(db, [detection(55.0, 37.0, anomaly_type="flood")])
+    merge(db, [detection(55.5, 37.5)])
+    merge(db, [detection(55.0, 37.0)], observed_at=OBSERVED + timedelta(hours=100))
+
+    assert db.query(Anomaly).count() == 4
+
+
+def test_persist_is_idempotent_per_analysis(db):
+    db.add(SatelliteImage(id=1, filename="a.png", filepath="a.png", date_captured=OBSERVED))
+    db.commit()
+    anomalies = [detection(55.0, 37.0)]
+
+    first = persist_anomalies(1, anomalies, analysis_id="a" * 16)
+    again = persist_anomalies(1, anomalies, analysis_id="a" * 16)
+    other = persist_anomalies(1, anomalies, analysis_id="b" * 16)
+
+    assert first["tracks_created"] == 1
+    assert again["detections"] == 0
+    assert other["tracks_updated"] == 1
+    assert db.query(AnomalyDetection).count() == 2
+
+
+def test_feed_pushes_updated_tracks(db):
+    feed = AnomalyBroadcaster(batch_size=10)
+    merge(db, [detection(55.0, 37.0), detection(56.0, 38.0)])
+    rows, cursor, fetched = feed._fetch_new(0)
+    assert fetched == 2
+    assert [row["update"] for row in rows] == [False, False]
+
+    merge(db, [detection(55.001, 37.001)], observed_at=OBSERVED + timedelta(hours=1))
+    rows, next_cursor, fetched = feed._fetch_new(cursor)
+
+    assert fetched == 1 and next_cursor > cursor
+    assert rows[0]["id"] == db.query(Anomaly.id).order_by(Anomaly.id).first()[0]
+    assert rows[0]["update"] and rows[0]["detections"] == 2